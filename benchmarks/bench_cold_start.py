@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Minimal events that get each handler past input validation to its first
+# DynamoDB call; functions not listed are invoked with an empty event
+EVENTS = {
+    'ingest_usage': {'body': json.dumps({'customer_id': 'bench', 'event_type': 'api_call', 'quantity': 1})},
+    'ingest_usage_batch': {'body': json.dumps({'events': [{'customer_id': 'bench', 'event_type': 'api_call', 'quantity': 1}]})},
+    'get_customer_usage': {'pathParameters': {'customer_id': 'bench'}},
+    'create_subscription': {'body': json.dumps({
+        'client_id': 'bench', 'company_name': 'Bench', 'email': 'bench@example.com', 'subscription_tier': 'basic'
+    })},
+    'get_subscription': {'pathParameters': {'client_id': 'bench'}},
+    'calculate_pricing': {'body': json.dumps({'client_id': 'bench', 'usage_data': {'api_call': 1000}})},
+    'update_pricing_rules': {'pathParameters': {'client_id': 'bench'}, 'body': json.dumps({'pricing_rules': {}})},
+    'generate_invoice': {'body': json.dumps({'customer_id': 'bench'})},
+    'run_billing_cycle': {'body': json.dumps({'customer_ids': ['bench']})},
+    'get_invoices': {'pathParameters': {'customer_id': 'bench'}},
+    'process_analytics_stream': {'Records': []}
+}
+
+# Runs in a fresh interpreter per sample. `eager` rebuilds every module
+# table right after import, which is what the handlers used to do at import
+# time. Credentials are cleared so the first AWS call fails while signing,
+# after all client setup but before any network I/O.
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import importlib
+module = importlib.import_module(sys.argv[1])
+if sys.argv[3] == 'eager':
+    from utils import aws
+    for value in list(vars(module).values()):
+        if isinstance(value, aws.LazyTable):
+            value._resolve()
+imported = time.perf_counter()
+handler = getattr(module, sys.argv[2], None)
+if handler is not None:
+    try:
+        handler(json.loads(sys.argv[4]), None)
+    except Exception:
+        pass
+invoked = time.perf_counter()
+print(json.dumps({'found': handler is not None, 'import': imported - started, 'first_call': invoked - started}))
+'''
+
+
+# Function definitions included by serverless.yml in the default split mode
+FUNCTION_FILES = ('serverless/functions-split.yml', 'serverless/functions-background.yml')
+
+
+def serverless_handlers(paths=FUNCTION_FILES):
+    """(function name, module, handler) for every function in the given files"""
+    handlers = []
+    for path in paths:
+        name = None
+        with open(os.path.join(ROOT, path)) as f:
+            for line in f:
+                function = re.match(r'^(\w+):\s*$', line)
+                if function:
+                    name = function.group(1)
+                handler = re.match(r'^  handler:\s*(\S+)\.(\w+)\s*$', line)
+                if handler and name:
+                    handlers.append((name, handler.group(1), handler.group(2)))
+    return handlers
+
+
+def probe_env():
+    env = dict(os.environ, STAGE='bench', AWS_DEFAULT_REGION='us-east-1', AWS_EC2_METADATA_DISABLED='true',
+               AWS_SHARED_CREDENTIALS_FILE=os.devnull, AWS_CONFIG_FILE=os.devnull, PYTHONDONTWRITEBYTECODE='1')
+    for variable in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_PROFILE',
+                     'AWS_CONTAINER_CREDENTIALS_RELATIVE_URI', 'AWS_CONTAINER_CREDENTIALS_FULL_URI'):
+        env.pop(variable, None)
+    return env
+
+
+def measure(module, handler, mode, runs, env, event=None):
+    """Median import and import + first invocation seconds over fresh interpreters"""
+    event = EVENTS.get(handler, {}) if event is None else event
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, module, handler, mode, json.dumps(event)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'found': samples[0]['found'],
+        'import': statistics.median(sample['import'] for sample in samples),
+        'first_call': statistics.median(sample['first_call'] for sample in samples)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import time and cold start per serverless function')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per measurement')
+    parser.add_argument('--function', help='only this serverless function name')
+    args = parser.parse_args()
+
+    env = probe_env()
+    print(f"cold start, median of {args.runs} fresh interpreters (ms)")
+    print(f"  {'function':<24} {'import eager':>12} {'lazy':>7} {'first call eager':>17} {'lazy':>7}")
+    for name, module, handler in serverless_handlers():
+        if args.function and name != args.function:
+            continue
+        eager = measure(module, handler, 'eager', args.runs, env)
+        if not eager['found']:
+            print(f"  {name:<24} {module}.{handler} is not defined")
+            continue
+        lazy = measure(module, handler, 'lazy', args.runs, env)
+        print(f"  {name:<24} {eager['import'] * 1000:12.0f} {lazy['import'] * 1000:7.0f} "
+              f"{eager['first_call'] * 1000:17.0f} {lazy['first_call'] * 1000:7.0f}")
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import billing_handlers
+import pricing_handlers
+from utils import dynamo
+
+
+class LatencyTable:
+    """Local DynamoDB Table stand-in: canned items behind a network-like delay
+
+    Every call sleeps for a log-normally distributed round trip (the GIL is
+    released, as it is while botocore waits on a socket).
+    """
+
+    def __init__(self, latency_ms, seed, item=None, items=()):
+        self.latency_ms = latency_ms
+        self.item = item
+        self.items = list(items)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def _round_trip(self):
+        with self.lock:
+            delay = self.rng.lognormvariate(0, 0.35) * self.latency_ms / 1000
+        time.sleep(delay)
+
+    def get_item(self, **kwargs):
+        self._round_trip()
+        return {'Item': self.item} if self.item else {}
+
+    def query(self, **kwargs):
+        self._round_trip()
+        return {'Items': self.items}
+
+    def put_item(self, **kwargs):
+        self._round_trip()
+        return {}
+
+
+def stand_in_tables(latency_ms, seed):
+    """Table patches for the pricing and invoice handlers"""
+    rules = {'api_call': {'rate': '0.02', 'free_tier': 1000}}
+    return {
+        (pricing_handlers, 'subscriptions_table'): LatencyTable(latency_ms, seed, item={
+            'client_id': 'client-1', 'subscription_tier': 'pro', 'created_at': '2024-01-01T00:00:00'
+        }),
+        (pricing_handlers, 'pricing_rules_table'): LatencyTable(latency_ms, seed + 1, item={
+            'client_id': 'client-1', 'rules': rules, 'updated_at': '2024-01-01T00:00:00'
+        }),
+        (billing_handlers, 'customers_table'): LatencyTable(latency_ms, seed + 2, item={
+            'customer_id': 'cust-1', 'name': 'Bench Co', 'email': 'bench@example.com'
+        }),
+        (billing_handlers, 'rollups_table'): LatencyTable(latency_ms, seed + 3, items=[
+            {'event_type': 'api_call', 'quantity': Decimal('1500'), 'event_count': 40},
+            {'event_type': 'storage_gb', 'quantity': Decimal('12.5'), 'event_count': 3}
+        ]),
+        (billing_handlers, 'invoices_table'): LatencyTable(latency_ms, seed + 4)
+    }
+
+
+def calculate_pricing():
+    # Cold caches, so both reads reach the table on every request
+    pricing_handlers.subscription_cache.clear()
+    pricing_handlers.pricing_rules_cache.clear()
+    return pricing_handlers.calculate_pricing({'body': json.dumps({
+        'client_id': 'client-1', 'usage_data': {'api_calls': 20000},
+        'client_usage_events': {'api_call': [1500]}
+    })}, None)
+
+
+def generate_invoice():
+    return billing_handlers.generate_invoice({'body': json.dumps({'customer_id': 'cust-1'})}, None)
+
+
+def latencies(request, count, concurrent):
+    samples = []
+    with patch.object(dynamo, 'CONCURRENT_READS', concurrent):
+        for _ in range(count):
+            started = time.perf_counter()
+            response = request()
+            samples.append(time.perf_counter() - started)
+            assert response['statusCode'] in (200, 201), response
+    return sorted(samples)
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Handler latency with chained vs concurrent DynamoDB reads')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=8, help='median DynamoDB round trip of the stand-in')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    tables = stand_in_tables(args.latency_ms, args.seed)
+    for (module, name), table in tables.items():
+        setattr(module, name, table)
+
+    print(f"{args.requests} requests per handler, {args.latency_ms:g} ms median round trip (ms)")
+    print(f"  {'handler':<18} {'chained p50':>11} {'p99':>6} {'concurrent p50':>15} {'p99':>6}")
+    for name, request in (('calculate_pricing', calculate_pricing), ('generate_invoice', generate_invoice)):
+        request()  # warm the read pool
+        chained = latencies(request, args.requests, False)
+        concurrent = latencies(request, args.requests, True)
+        print(f"  {name:<18} {percentile(chained, 50) * 1000:11.1f} {percentile(chained, 99) * 1000:6.1f} "
+              f"{percentile(concurrent, 50) * 1000:15.1f} {percentile(concurrent, 99) * 1000:6.1f}")
@@ -0,0 +1,459 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+# Handler modules name their tables from STAGE at import, and archived months
+# would be read from S3, so the environment is fixed before they are imported.
+# Credentials are always replaced with dummies so no request can reach a real
+# account, whatever the backend.
+os.environ['STAGE'] = os.environ.get('BENCH_STAGE', 'bench')
+for variable in ('USAGE_ARCHIVE_URL', 'AWS_SESSION_TOKEN', 'AWS_SECURITY_TOKEN', 'AWS_PROFILE',
+                 'AWS_ENDPOINT_URL', 'AWS_ENDPOINT_URL_DYNAMODB'):
+    os.environ.pop(variable, None)
+os.environ.update({
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'bench',
+    'AWS_SECRET_ACCESS_KEY': 'bench',
+    # No ~/.aws profiles, credential processes or SSO sessions
+    'AWS_CONFIG_FILE': os.devnull,
+    'AWS_SHARED_CREDENTIALS_FILE': os.devnull
+})
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import billing_handlers
+import handler
+import pricing_handlers
+from utils import aws
+from utils.analytics import VIEW_ID, apply_view_delta, empty_delta, empty_view, fold_change
+from utils.dynamo import batch_write_items
+from utils.money import MONEY_SCALE, QUANTITY_SCALE
+from utils.pricing import calculate_client_billing, compile_client_plan
+from utils.rollups import aggregate_rollups, apply_rollups
+from utils.sketches import apply_usage_sketches, fold_usage_sketches
+from utils.sort_keys import new_sort_key
+
+# Key schemas from serverless.yml, by table name without the stage suffix
+TABLE_SCHEMAS = {
+    'UsageEvents': [('customer_id', 'HASH'), ('timestamp', 'RANGE')],
+    'UsageRollups': [('customer_id', 'HASH'), ('rollup_key', 'RANGE')],
+    'Customers': [('customer_id', 'HASH')],
+    'Subscriptions': [('client_id', 'HASH')],
+    'PricingRules': [('client_id', 'HASH')],
+    'BillingRuns': [('run_id', 'HASH'), ('customer_id', 'RANGE')],
+    'Invoices': [('invoice_id', 'HASH')],
+    'AnalyticsView': [('view_id', 'HASH')]
+}
+INVOICES_BY_CUSTOMER_INDEX = [('customer_id', 'HASH'), ('created_at', 'RANGE')]
+
+EVENT_TYPES = ('api_call', 'storage_gb', 'compute_hour')
+INVOICE_MONTH = '2024-01'
+
+# Sweeps; --quick keeps the smallest sizes for a smoke run
+FULL_SWEEPS = {
+    'events_per_month': [1000, 10000, 100000, 1000000],
+    'analytics_invoices': [1000, 10000, 100000],
+    'rule_counts': [1, 10, 100, 1000]
+}
+QUICK_SWEEPS = {
+    'events_per_month': [1000, 10000],
+    'analytics_invoices': [1000],
+    'rule_counts': [1, 100]
+}
+
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def dynamodb_backend(endpoint_url=None):
+    """Context in which the shared boto3 session talks to moto or DynamoDB Local"""
+    if endpoint_url:
+        host = urlsplit(endpoint_url).hostname
+        if host not in LOCAL_HOSTS:
+            raise ValueError(f"Refusing to benchmark against {endpoint_url!r}: "
+                             f"--endpoint-url must point at localhost or 127.0.0.1")
+        # Picked up by botocore when the shared session builds its clients
+        os.environ['AWS_ENDPOINT_URL_DYNAMODB'] = endpoint_url
+        return contextlib.nullcontext()
+    try:
+        from moto import mock_aws
+    except ImportError:
+        raise RuntimeError("The moto backend requires moto (pip install 'moto[dynamodb]'); "
+                           "pass --endpoint-url to use DynamoDB Local instead")
+    return mock_aws()
+
+
+def module_tables():
+    """Every distinct table the handler modules use"""
+    tables = {}
+    for module in (handler, pricing_handlers, billing_handlers):
+        for value in vars(module).values():
+            if isinstance(value, aws.LazyTable):
+                tables[value.name] = value
+    return tables
+
+
+def create_tables():
+    """Create the handlers' tables, on-demand like production
+
+    Existing tables are never touched: the run stops instead, so pointing the
+    suite at a database that already holds data cannot drop it.
+    """
+    client = aws.client('dynamodb')
+    existing = set(client.get_paginator('list_tables').paginate().build_full_result()['TableNames'])
+    clashes = sorted(existing & set(module_tables()))
+    if clashes:
+        raise RuntimeError(f"Tables already exist: {', '.join(clashes)}; "
+                           f"start from an empty local database")
+    for name in module_tables():
+        schema = TABLE_SCHEMAS[name.split('-')[0]]
+        attributes = dict.fromkeys(attribute for attribute, _ in schema)
+        definition = {
+            'TableName': name,
+            'KeySchema': [{'AttributeName': attribute, 'KeyType': key_type} for attribute, key_type in schema],
+            'BillingMode': 'PAY_PER_REQUEST'
+        }
+        if name.startswith('Invoices'):
+            attributes.update(dict.fromkeys(attribute for attribute, _ in INVOICES_BY_CUSTOMER_INDEX))
+            definition['GlobalSecondaryIndexes'] = [{
+                'IndexName': billing_handlers.INVOICES_BY_CUSTOMER_INDEX,
+                'KeySchema': [{'AttributeName': a, 'KeyType': k} for a, k in INVOICES_BY_CUSTOMER_INDEX],
+                'Projection': {'ProjectionType': 'ALL'}
+            }]
+        definition['AttributeDefinitions'] = [{'AttributeName': a, 'AttributeType': 'S'} for a in attributes]
+
+        client.create_table(**definition)
+        client.get_waiter('table_exists').wait(TableName=name)
+
+
+def latency_stats(samples):
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3)
+    }
+
+
+def time_calls(call, runs, check=None):
+    """Latency stats for `runs` calls, failing loudly on an unexpected response"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = call()
+        samples.append(time.perf_counter() - started)
+        if check:
+            check(response)
+    return latency_stats(samples)
+
+
+def expect_status(*codes):
+    def check(response):
+        if response['statusCode'] not in codes:
+            raise AssertionError(f"Unexpected response: {response}")
+    return check
+
+
+def usage_events(count, customer_id, start, span, rng):
+    """UsageEvents items spread over `span` from `start`, in time order"""
+    offsets = sorted(rng.random() for _ in range(count))
+    for offset in offsets:
+        event_type = rng.choice(EVENT_TYPES)
+        yield {
+            'customer_id': customer_id,
+            'timestamp': new_sort_key(start + span * offset),
+            'event_type': event_type,
+            'quantity': Decimal(rng.randint(1, 5000)) / 10,
+            'metadata': {}
+        }
+
+
+def seed_usage(events, chunk=10000):
+    """Write usage events and their rollups the way ingestion does, in bounded chunks"""
+    batch = []
+    for usage_event in events:
+        batch.append(usage_event)
+        if len(batch) == chunk:
+            _write_usage(batch)
+            batch = []
+    if batch:
+        _write_usage(batch)
+
+
+def _write_usage(batch):
+    failed = batch_write_items(handler.dynamodb, handler.USAGE_EVENTS_TABLE, batch, ('customer_id', 'timestamp'))
+    if failed:
+        raise RuntimeError(f"{len(failed)} usage events could not be seeded")
+    apply_rollups(handler.rollups_table, aggregate_rollups(batch))
+
+
+def bench_ingest(runs, rng):
+    """Single and batch ingestion throughput"""
+    results = []
+    payload = {'customer_id': 'bench-ingest', 'event_type': 'api_call', 'quantity': 1}
+    stats = time_calls(lambda: handler.ingest_usage({'body': json.dumps(payload)}, None), runs, expect_status(200))
+    results.append({'benchmark': 'ingest_usage', 'params': {'batch_size': 1},
+                    'metrics': dict(stats, events_per_second=round(1000 / stats['mean_ms'], 1))})
+
+    for batch_size in (100, 1000):
+        body = json.dumps({'events': [
+            {'customer_id': f'bench-ingest-{rng.randrange(50)}', 'event_type': rng.choice(EVENT_TYPES),
+             'quantity': rng.randint(1, 100)}
+            for _ in range(batch_size)
+        ]})
+        stats = time_calls(lambda: handler.ingest_usage_batch({'body': body}, None), max(3, runs // 20),
+                           expect_status(200))
+        results.append({'benchmark': 'ingest_usage_batch', 'params': {'batch_size': batch_size},
+                        'metrics': dict(stats, events_per_second=round(batch_size * 1000 / stats['mean_ms'], 1))})
+    return results
+
+
+def bench_invoices(sizes, runs, rng):
+    """generate_invoice latency as one customer's monthly event count grows
+
+    Sizes are seeded cumulatively into the same customer and month, so the
+    largest size costs one pass of seeding.
+    """
+    results = []
+    customer_id = 'bench-invoice'
+    billing_handlers.customers_table.put_item(Item={
+        'customer_id': customer_id, 'name': 'Bench Invoice Co', 'email': 'billing@example.com',
+        'created_at': '2023-06-01T00:00:00'
+    })
+    month_start = datetime.strptime(INVOICE_MONTH, '%Y-%m')
+    month_span = timedelta(days=31) - timedelta(microseconds=1)
+
+    seeded = 0
+    for size in sorted(sizes):
+        started = time.perf_counter()
+        seed_usage(usage_events(size - seeded, customer_id, month_start, month_span, rng))
+        seeded = size
+        print(f"  seeded {size:,} events in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        body = json.dumps({'customer_id': customer_id, 'billing_period': INVOICE_MONTH})
+        for usage_source in ('rollups', 'events'):
+            request = json.dumps(dict(json.loads(body), usage_source=usage_source))
+            # Raw-event invoices scan the whole month; fewer repeats at large sizes
+            repeats = runs if usage_source == 'rollups' or size <= 10000 else max(1, runs // 10)
+            stats = time_calls(lambda: billing_handlers.generate_invoice({'body': request}, None), repeats,
+                               expect_status(201))
+            results.append({'benchmark': 'generate_invoice',
+                            'params': {'events_per_month': size, 'usage_source': usage_source},
+                            'metrics': stats})
+    return results
+
+
+def seed_analytics(invoice_count, rng, today):
+    """Invoices, customers and a rebuilt analytics view, as backfill_analytics leaves them"""
+    customers = [
+        {'customer_id': f'bench-customer-{index}', 'name': f'Customer {index}', 'email': f'c{index}@example.com',
+         'created_at': (today - timedelta(days=rng.randrange(365))).isoformat()}
+        for index in range(max(1, invoice_count // 10))
+    ]
+    invoices = []
+    for index in range(invoice_count):
+        customer = customers[index % len(customers)]
+        created_at = today - timedelta(days=rng.randrange(365))
+        invoices.append({
+            'invoice_id': f'INV-{created_at:%Y%m}-{customer["customer_id"]}-{index}',
+            'customer_id': customer['customer_id'], 'customer_name': customer['name'],
+            'total_amount': rng.randrange(1, 5000) * MONEY_SCALE, 'money_scale': MONEY_SCALE,
+            'quantity_scale': QUANTITY_SCALE, 'status': 'generated', 'created_at': created_at.isoformat()
+        })
+
+    for table_name, items, key_names in (
+        (billing_handlers.customers_table.name, customers, ('customer_id',)),
+        (billing_handlers.invoices_table.name, invoices, ('invoice_id',))
+    ):
+        if batch_write_items(billing_handlers.dynamodb, table_name, items, key_names):
+            raise RuntimeError(f"{table_name} could not be seeded")
+
+    delta = empty_delta()
+    for customer in customers:
+        fold_change(delta, 'customers', None, customer)
+    for invoice in invoices:
+        fold_change(delta, 'invoices', None, invoice)
+    current = billing_handlers.analytics_view_table.get_item(Key={'view_id': VIEW_ID}).get('Item')
+    view = apply_view_delta(current or empty_view(), delta, today)
+    view.update({'view_id': VIEW_ID, 'version': int(current['version']) + 1 if current else 1})
+    billing_handlers.analytics_view_table.put_item(Item=view)
+
+
+def bench_analytics(sizes, runs, rng):
+    """get_analytics latency as the invoice and customer tables grow"""
+    results = []
+    today = datetime.utcnow()
+    # 30 days of platform usage with sketches, so the sketch summary is real work
+    events = list(usage_events(20000, 'bench-analytics', today - timedelta(days=29), timedelta(days=29), rng))
+    for usage_event in events:
+        usage_event['customer_id'] = f'bench-customer-{rng.randrange(5000)}'
+    seed_usage(events)
+    apply_usage_sketches(billing_handlers.rollups_table, fold_usage_sketches(events))
+
+    seeded = 0
+    for size in sorted(sizes):
+        seed_analytics(size - seeded, rng, today)
+        seeded = size
+        stats = time_calls(lambda: billing_handlers.get_analytics({'headers': {}}, None), runs, expect_status(200))
+        results.append({'benchmark': 'get_analytics', 'params': {'invoices': size}, 'metrics': stats})
+    return results
+
+
+def pricing_rules(rule_count):
+    """Rules for `rule_count` event types, alternating flat and graduated"""
+    rules = {}
+    for index in range(rule_count):
+        if index % 2:
+            rules[f'event_{index}'] = {'mode': 'graduated', 'tiers': [
+                {'up_to': 1000, 'rate': 0}, {'up_to': 100000, 'rate': '0.01'}, {'up_to': None, 'rate': '0.005'}
+            ]}
+        else:
+            rules[f'event_{index}'] = {'rate': '0.02', 'free_tier': 100}
+    return rules
+
+
+def bench_pricing(rule_counts, runs, rng):
+    """Pricing engine and pricing endpoints as a client's rule count grows"""
+    results = []
+    for rule_count in rule_counts:
+        client_id = f'bench-client-{rule_count}'
+        rules = pricing_rules(rule_count)
+        pricing_handlers.subscriptions_table.put_item(Item={
+            'client_id': client_id, 'subscription_tier': 'pro', 'created_at': '2024-01-01T00:00:00'
+        })
+        pricing_handlers.pricing_rules_table.put_item(Item={
+            'client_id': client_id, 'rules': rules, 'updated_at': '2024-01-01T00:00:00'
+        })
+        usage = {event_type: [rng.randint(1, 200000) * QUANTITY_SCALE] for event_type in rules}
+        plan = compile_client_plan(rules)
+
+        stats = time_calls(lambda: calculate_client_billing(plan, usage), runs * 10)
+        results.append({'benchmark': 'calculate_client_billing', 'params': {'rules': rule_count}, 'metrics': stats})
+
+        body = json.dumps({'client_id': client_id, 'usage_data': {'api_calls': 20000},
+                           'client_usage_events': {event_type: [q[0] / QUANTITY_SCALE] for event_type, q in usage.items()}})
+        for cache in ('cold', 'warm'):
+            def call():
+                if cache == 'cold':
+                    pricing_handlers.subscription_cache.clear()
+                    pricing_handlers.pricing_rules_cache.clear()
+                return pricing_handlers.calculate_pricing({'body': body}, None)
+            stats = time_calls(call, runs, expect_status(200))
+            results.append({'benchmark': 'calculate_pricing', 'params': {'rules': rule_count, 'cache': cache},
+                            'metrics': stats})
+
+    # Batch quotes over every client above, caches cold
+    entries = [{'client_id': f'bench-client-{rule_count}', 'usage_data': {'api_calls': 20000}}
+               for rule_count in rule_counts] * (100 // len(rule_counts))
+    body = json.dumps({'entries': entries})
+
+    def batch_call():
+        pricing_handlers.subscription_cache.clear()
+        pricing_handlers.pricing_rules_cache.clear()
+        return pricing_handlers.calculate_pricing_batch({'body': body}, None)
+    stats = time_calls(batch_call, runs, expect_status(200))
+    results.append({'benchmark': 'calculate_pricing_batch', 'params': {'entries': len(entries)},
+                    'metrics': dict(stats, entries_per_second=round(len(entries) * 1000 / stats['mean_ms'], 1))})
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return result['benchmark'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(baseline_path, current_path, threshold):
+    """Print metric changes between two result files; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = {result_key(result): result for result in json.load(f)['results']}
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    for result in current:
+        before = baseline.get(result_key(result))
+        if before is None:
+            continue
+        for metric, value in result['metrics'].items():
+            old = before['metrics'].get(metric)
+            if metric == 'runs' or not old:
+                continue
+            change = value / old - 1
+            # Latencies regress upwards, throughputs downwards
+            worse = change > threshold if metric.endswith('_ms') else change < -threshold
+            regressions += worse
+            print(f"{'REGRESSION' if worse else '':<11}{result['benchmark']:<26} {result_key(result)[1]:<48} "
+                  f"{metric:<18} {old:>12,.3f} -> {value:>12,.3f} ({change:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Handler benchmarks against moto or DynamoDB Local')
+    parser.add_argument('--output', default='benchmark-results.json', help='JSON results file')
+    parser.add_argument('--endpoint-url', help='DynamoDB Local endpoint, e.g. http://localhost:8000 (default: moto)')
+    parser.add_argument('--runs', type=int, default=50, help='timed calls per measurement')
+    parser.add_argument('--quick', action='store_true', help='smallest sizes only, for a smoke run')
+    parser.add_argument('--only', choices=('ingest', 'invoices', 'analytics', 'pricing'), action='append')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative change reported as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    sweeps = QUICK_SWEEPS if args.quick else FULL_SWEEPS
+    rng = random.Random(args.seed)
+    suites = {
+        'ingest': lambda: bench_ingest(args.runs, rng),
+        'invoices': lambda: bench_invoices(sweeps['events_per_month'], args.runs, rng),
+        'analytics': lambda: bench_analytics(sweeps['analytics_invoices'], args.runs, rng),
+        'pricing': lambda: bench_pricing(sweeps['rule_counts'], args.runs, rng)
+    }
+
+    results = []
+    with dynamodb_backend(args.endpoint_url):
+        create_tables()
+        for name, suite in suites.items():
+            if args.only and name not in args.only:
+                continue
+            print(f"{name}...", file=sys.stderr)
+            for result in suite():
+                results.append(result)
+                print(f"  {result['benchmark']:<26} {json.dumps(result['params']):<48} "
+                      f"p50 {result['metrics']['p50_ms']:9.2f} ms  p99 {result['metrics']['p99_ms']:9.2f} ms",
+                      file=sys.stderr)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.utcnow().isoformat(),
+        'backend': args.endpoint_url or 'moto',
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'runs': args.runs,
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
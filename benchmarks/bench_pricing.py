@@ -0,0 +1,162 @@
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pricing import (
+    calculate_client_billing,
+    calculate_client_billing_batch,
+    calculate_squill_billing,
+    calculate_squill_billing_batch,
+    CompiledTiers,
+    SubscriptionPlan,
+    compile_client_plan,
+    DEFAULT_CLIENT_PRICING,
+    SUBSCRIPTION_TIERS
+)
+from utils.money import to_money_units, to_quantity_units
+
+
+def bench_client_pricing(customers, seed):
+    """Scalar vs batch client pricing over one billing cycle"""
+    rng = random.Random(seed)
+    event_types = list(DEFAULT_CLIENT_PRICING)
+    usage = [
+        [rng.randint(0, 5000000), Decimal(rng.randint(0, 100000)) / 1000, rng.randint(0, 2000)]
+        for _ in range(customers)
+    ]
+    usage = [[to_quantity_units(q) for q in row] for row in usage]
+    usage_units = np.array(usage, dtype=np.int64)
+
+    started = time.perf_counter()
+    scalar = [
+        calculate_client_billing(None, {t: [q] for t, q in zip(event_types, row)})
+        for row in usage
+    ]
+    scalar_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = calculate_client_billing_batch(None, event_types, usage_units)
+    batch_seconds = time.perf_counter() - started
+
+    identical = all(
+        batch['total_costs'][row] == result['total_cost']
+        for row, result in enumerate(scalar)
+    )
+    return scalar_seconds, batch_seconds, identical
+
+
+def bench_squill_pricing(clients, seed):
+    """Scalar vs batch subscription pricing over one billing cycle"""
+    rng = random.Random(seed)
+    metrics = ['customers', 'api_calls', 'storage_gb']
+    tiers = [rng.choice(list(SUBSCRIPTION_TIERS)) for _ in range(clients)]
+    usage = [
+        [to_quantity_units(rng.randint(0, 20000)), to_quantity_units(rng.randint(0, 300000)),
+         to_quantity_units(rng.randint(0, 300))]
+        for _ in tiers
+    ]
+    usage_units = np.array(usage, dtype=np.int64)
+
+    started = time.perf_counter()
+    scalar = [calculate_squill_billing(tier, dict(zip(metrics, row))) for tier, row in zip(tiers, usage)]
+    scalar_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = calculate_squill_billing_batch(tiers, metrics, usage_units)
+    batch_seconds = time.perf_counter() - started
+
+    identical = all(
+        batch['total_costs'][row] == result['total_cost']
+        for row, result in enumerate(scalar)
+    )
+    return scalar_seconds, batch_seconds, identical
+
+
+def bench_tier_evaluation(tier_count, evaluations, seed):
+    """Bisect over compiled tiers vs walking every tier per evaluation"""
+    rng = random.Random(seed)
+    tiers = [{'up_to': (i + 1) * 1000, 'rate': Decimal(tier_count - i) / 10000} for i in range(tier_count - 1)]
+    tiers.append({'up_to': None, 'rate': Decimal('0.0001')})
+    quantities = [Decimal(rng.randint(0, tier_count * 1000)) for _ in range(evaluations)]
+
+    def walk(quantity):
+        cost, start = Decimal('0'), Decimal('0')
+        for tier in tiers:
+            end = Decimal(tier['up_to']) if tier['up_to'] is not None else quantity
+            if quantity <= start:
+                break
+            cost += (min(quantity, end) - start) * tier['rate']
+            start = end
+        return cost
+
+    started = time.perf_counter()
+    walked = [walk(q) for q in quantities]
+    walk_seconds = time.perf_counter() - started
+
+    compiled = CompiledTiers(tiers)
+    quantity_units = [to_quantity_units(q) for q in quantities]
+    started = time.perf_counter()
+    bisected = [compiled.cost(q) for q in quantity_units]
+    bisect_seconds = time.perf_counter() - started
+
+    return walk_seconds, bisect_seconds, [to_money_units(c) for c in walked] == bisected
+
+
+def bench_plan_reuse(calls):
+    """Per-call cost of pricing from raw rule dicts vs precompiled plans"""
+    # Shaped like a PricingRules item read from DynamoDB
+    pricing_rules = {
+        'api_call': {'rate': Decimal('0.01'), 'free_tier': Decimal('100')},
+        'storage_gb': {'rate': Decimal('5.00'), 'free_tier': Decimal('1')},
+        'transaction': {'rate': Decimal('0.30'), 'free_tier': Decimal('10')}
+    }
+    usage_events = {'api_call': [15000000], 'storage_gb': [12500], 'transaction': [40000]}
+    usage_data = {'customers': 1500000, 'api_calls': 150000000, 'storage_gb': 15000}
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        calculate_client_billing(pricing_rules, usage_events)
+        calculate_squill_billing(SubscriptionPlan('basic', SUBSCRIPTION_TIERS['basic']), usage_data)
+    dict_seconds = time.perf_counter() - started
+
+    client_plan = compile_client_plan(pricing_rules)
+    started = time.perf_counter()
+    for _ in range(calls):
+        calculate_client_billing(client_plan, usage_events)
+        calculate_squill_billing('basic', usage_data)
+    plan_seconds = time.perf_counter() - started
+
+    return dict_seconds, plan_seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare scalar and vectorized pricing')
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    for name, bench in (('client pricing', bench_client_pricing), ('squill pricing', bench_squill_pricing)):
+        scalar_seconds, batch_seconds, identical = bench(args.customers, args.seed)
+        print(f"{name}: {args.customers:,} customers")
+        print(f"  scalar  {scalar_seconds * 1000:9.1f} ms")
+        print(f"  batch   {batch_seconds * 1000:9.1f} ms  ({scalar_seconds / batch_seconds:.1f}x)")
+        print(f"  identical results: {identical}")
+
+    dict_seconds, plan_seconds = bench_plan_reuse(20000)
+    print("plan reuse: 20,000 client + subscription pricing calls")
+    print(f"  compile per call {dict_seconds / 20000 * 1e6:7.2f} us/call")
+    print(f"  precompiled plan {plan_seconds / 20000 * 1e6:7.2f} us/call  ({dict_seconds / plan_seconds:.1f}x)")
+
+    for tier_count in (4, 32, 256):
+        walk_seconds, bisect_seconds, identical = bench_tier_evaluation(tier_count, 20000, args.seed)
+        print(f"graduated tiers: {tier_count} tiers, 20,000 evaluations")
+        print(f"  tier walk {walk_seconds * 1000:9.1f} ms")
+        print(f"  bisect    {bisect_seconds * 1000:9.1f} ms  ({walk_seconds / bisect_seconds:.1f}x)")
+        print(f"  identical results: {identical}")
@@ -0,0 +1,135 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_cold_start import EVENTS, measure, probe_env, serverless_handlers
+from router import ROUTES, match_route
+
+# Requests per hour by function, shaped like production: steady ingestion,
+# dashboard polling, and admin endpoints that are called a few times a day
+TRAFFIC = {
+    'ingestUsage': 1800,
+    'ingestUsageBatch': 120,
+    'getCustomerUsage': 40,
+    'getAnalytics': 240,
+    'getInvoices': 20,
+    'calculatePricing': 30,
+    'getSubscription': 3,
+    'createSubscription': 1,
+    'updatePricingRules': 1,
+    'generateInvoice': 2
+}
+
+
+def router_event(module, handler):
+    """API Gateway proxy event for a handler's route, as router mode receives it"""
+    for method, template, target in ROUTES:
+        if target == f'{module}.{handler}':
+            event = dict(EVENTS.get(handler, {}))
+            path = template
+            for name, value in (event.pop('pathParameters', None) or {}).items():
+                path = path.replace('{' + name + '}', value)
+            return dict(event, httpMethod=method, path=path, resource='/{proxy+}',
+                        pathParameters={'proxy': path.lstrip('/')})
+    return None
+
+
+def dispatch_overhead(iterations=100000):
+    """Mean seconds the router spends matching a request to its handler"""
+    requests = [(method, template.replace('{customer_id}', 'cust-1').replace('{client_id}', 'client-1'))
+                for method, template, _ in ROUTES]
+    started = time.perf_counter()
+    for index in range(iterations):
+        match_route(*requests[index % len(requests)])
+    return (time.perf_counter() - started) / iterations
+
+
+def arrivals(traffic, hours, seed):
+    """(time in seconds, function name) Poisson arrivals for a traffic mix"""
+    rng = random.Random(seed)
+    events = []
+    for name, per_hour in traffic.items():
+        now = 0.0
+        while True:
+            now += rng.expovariate(per_hour / 3600)
+            if now >= hours * 3600:
+                break
+            events.append((now, name))
+    events.sort()
+    return events
+
+
+def simulate(requests, pool_for, cold_seconds, warm_seconds, keep_warm_seconds):
+    """Latency of every request with Lambda-style container reuse
+
+    Requests in the same pool share containers. A container idle for more
+    than `keep_warm_seconds` is reclaimed; a request that finds no free
+    container starts one and pays the cold start first. Returns
+    (function name, latency seconds, cold) per request.
+    """
+    pools = {}
+    results = []
+    for now, name in requests:
+        pool = pools.setdefault(pool_for(name), [])
+        pool[:] = [busy_until for busy_until in pool if now - busy_until <= keep_warm_seconds]
+        free = [index for index, busy_until in enumerate(pool) if busy_until <= now]
+        cold = not free
+        latency = warm_seconds + (cold_seconds[name] if cold else 0)
+        if cold:
+            pool.append(now + latency)
+        else:
+            # Lambda favours the most recently used container
+            pool[max(free, key=lambda index: pool[index])] = now + latency
+        results.append((name, latency, cold))
+    return results
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(label, results):
+    latencies = [latency for _, latency, _ in results]
+    colds = sum(1 for _, _, cold in results if cold)
+    quiet = [latency for name, latency, _ in results if name == 'getSubscription']
+    print(f"  {label:<7} {colds:6,} cold ({colds / len(results):6.2%})  p50 {percentile(latencies, 50) * 1000:5.0f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:5.0f} ms  p99.9 {percentile(latencies, 99.9) * 1000:5.0f} ms  "
+          f"getSubscription p99 "
+          f"{percentile(quiet, 99) * 1000 if quiet else 0:5.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cold starts and p99 latency: one function per endpoint vs the router')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per cold start measurement')
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--keep-warm-minutes', type=float, default=10, help='idle time before a container is reclaimed')
+    parser.add_argument('--warm-ms', type=float, default=25, help='warm handler latency, mostly DynamoDB round trips')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    env = probe_env()
+    functions = {name: (module, handler) for name, module, handler in serverless_handlers() if name in TRAFFIC}
+    cold_seconds = {'split': {}, 'router': {}}
+    print(f"cold start, import + first call, median of {args.runs} fresh interpreters (ms)")
+    for name, (module, handler) in functions.items():
+        split = measure(module, handler, 'lazy', args.runs, env)['first_call']
+        router = measure('router', 'route', 'lazy', args.runs, env, router_event(module, handler))['first_call']
+        cold_seconds['split'][name], cold_seconds['router'][name] = split, router
+        print(f"  {name:<20} split {split * 1000:5.0f}  router {router * 1000:5.0f}")
+
+    overhead = dispatch_overhead()
+    print(f"router dispatch: {overhead * 1e6:.1f} us/request")
+
+    requests = arrivals(TRAFFIC, args.hours, args.seed)
+    warm = args.warm_ms / 1000
+    print(f"\n{len(requests):,} requests over {args.hours:g} h, {args.keep_warm_minutes:g} min keep-warm, "
+          f"{args.warm_ms:g} ms warm latency")
+    report('split', simulate(requests, lambda name: name, cold_seconds['split'], warm, args.keep_warm_minutes * 60))
+    report('router', simulate(requests, lambda name: 'api', cold_seconds['router'], warm + overhead,
+                              args.keep_warm_minutes * 60))
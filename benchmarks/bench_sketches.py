@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.money import to_quantity_units
+from utils.sketches import HyperLogLog, SpaceSaving, TDigest, fold_usage_sketches
+
+
+def usage_events(events, customers, seed):
+    """Zipf-like usage stream: a few noisy tenants and a long tail"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(customers)]
+    customer_ids = rng.choices([f'customer-{i}' for i in range(customers)], weights=weights, k=events)
+    return [
+        {
+            'customer_id': customer_id,
+            'event_type': 'api_call',
+            'quantity': Decimal(rng.randint(1, 500)),
+            'timestamp': '2024-01-15T10:00:00.000000#bench'
+        }
+        for customer_id in customer_ids
+    ]
+
+
+def bench_per_event(events):
+    """Per-event cost of each sketch on its own"""
+    quantities = [to_quantity_units(usage_event['quantity']) for usage_event in events]
+    results = {}
+
+    for name, sketch, add in (
+        ('hyperloglog', HyperLogLog(), lambda sketch, e, q: sketch.add(e['customer_id'])),
+        ('t-digest', TDigest(), lambda sketch, e, q: sketch.add(e['quantity'])),
+        ('space-saving', SpaceSaving(), lambda sketch, e, q: sketch.add(e['customer_id'], q))
+    ):
+        started = time.perf_counter()
+        for usage_event, quantity in zip(events, quantities):
+            add(sketch, usage_event, quantity)
+        results[name] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sketches = fold_usage_sketches(events)
+    results['all sketches'] = time.perf_counter() - started
+
+    return results, sketches
+
+
+def top_k_recall(events, sketches, k):
+    """Share of the exact top k customers the Space-Saving summary reports"""
+    exact = {}
+    for usage_event in events:
+        exact[usage_event['customer_id']] = exact.get(usage_event['customer_id'], 0) + usage_event['quantity']
+    expected = {customer_id for customer_id, _ in sorted(exact.items(), key=lambda e: e[1], reverse=True)[:k]}
+    reported = {customer_id for customer_id, count, error in sketches[('2024-01-15', 'api_call')]['top_customers'].top(k)}
+    return len(expected & reported) / k
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Per-event cost of the usage sketches')
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    events = usage_events(args.events, args.customers, args.seed)
+    results, sketches = bench_per_event(events)
+
+    print(f"usage sketches: {args.events:,} events from {args.customers:,} customers")
+    for name, seconds in results.items():
+        print(f"  {name:<13} {seconds / args.events * 1e6:7.2f} us/event")
+    print(f"  top-10 recall: {top_k_recall(events, sketches, 10):.0%}")
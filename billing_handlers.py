@@ -1,17 +1,60 @@
 import json
-import boto3
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timedelta
 from decimal import Decimal
-from utils.pricing import calculate_squill_billing, calculate_client_billing
+from utils import aws
+from utils.pricing import calculate_squill_billing, calculate_client_billing, DEFAULT_CLIENT_PLAN
+from utils.money import (
+    MONEY_SCALE, QUANTITY_SCALE, to_quantity_units,
+    money_json, quantity_json, units_to_json
+)
+from utils.dynamo import gather, iter_items, parallel_scan, query_page, decode_page_token
+from utils.sort_keys import sort_key_range, sort_key_timestamp
+from utils.rollups import ALL_CUSTOMERS, GRANULARITIES, query_rollups, summarize_rollups
+from utils.analytics import (
+    VIEW_ID, USAGE_WINDOW_DAYS, empty_view, fold_stream_records, update_analytics_view, usage_event_inserts
+)
+from utils.sketches import fold_usage_sketches, apply_usage_sketches, summarize_sketches
+from utils.etags import version_etag, content_etag, etag_matches, not_modified, with_validators
+from utils.archive import ArchiveStore, archived_usage_summary
 
-# Initialize DynamoDB
-region = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource('dynamodb', region_name=region)
-invoices_table = dynamodb.Table(f'Invoices-{os.environ.get("STAGE", "dev")}')
-customers_table = dynamodb.Table(f'Customers-{os.environ.get("STAGE", "dev")}')
-usage_table = dynamodb.Table(f'UsageEvents-{os.environ.get("STAGE", "dev")}')
-subscriptions_table = dynamodb.Table('Subscriptions')
+# DynamoDB tables, created from the shared resource on first use
+STAGE = os.environ.get("STAGE", "dev")
+dynamodb = aws.LazyResource('dynamodb')
+invoices_table = aws.table(f'Invoices-{STAGE}')
+customers_table = aws.table(f'Customers-{STAGE}')
+usage_table = aws.table(f'UsageEvents-{STAGE}')
+rollups_table = aws.table(f'UsageRollups-{STAGE}')
+billing_runs_table = aws.table(f'BillingRuns-{STAGE}')
+analytics_view_table = aws.table(f'AnalyticsView-{STAGE}')
+subscriptions_table = aws.table('Subscriptions')
+
+# Closed months compacted by scripts/archive_usage.py; raw-event reads for
+# archived months come from here instead of UsageEvents
+USAGE_ARCHIVE_URL = os.environ.get('USAGE_ARCHIVE_URL')
+usage_archive = ArchiveStore(USAGE_ARCHIVE_URL) if USAGE_ARCHIVE_URL else None
+
+# Bulk billing runs: invoices generated concurrently, and the run stops handing
+# out work once the Lambda is this close to its timeout so it can be resumed
+BILLING_RUN_WORKERS = int(os.environ.get('BILLING_RUN_WORKERS', '16'))
+BILLING_RUN_SAFETY_MS = 60 * 1000
+BILLING_RUN_SCAN_SEGMENTS = int(os.environ.get('BILLING_RUN_SCAN_SEGMENTS', '4'))
+# A run that stops at its deadline re-invokes itself with the same run id; the
+# cap keeps a run that can never finish from re-invoking itself forever
+MAX_BILLING_RUN_CONTINUATIONS = int(os.environ.get('MAX_BILLING_RUN_CONTINUATIONS', '50'))
+
+# Invoices are listed per customer, newest first, from this GSI
+INVOICES_BY_CUSTOMER_INDEX = 'customer_id-created_at-index'
+DEFAULT_INVOICE_PAGE_SIZE = 25
+MAX_INVOICE_PAGE_SIZE = 100
+
+# Cache-Control hints for dashboard polling: invoice pages always revalidate;
+# the analytics view is eventually consistent, so a short reuse window is fine
+INVOICES_CACHE_CONTROL = 'private, no-cache'
+ANALYTICS_CACHE_CONTROL = 'private, max-age=15'
 
 def generate_invoice(event, context):
     """Generate invoice for a customer"""
@@ -19,90 +62,261 @@ def generate_invoice(event, context):
         body = json.loads(event['body'])
         customer_id = body['customer_id']
         billing_period = body.get('billing_period', 'current_month')
+        try:
+            billing_period_dates(billing_period)
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'billing_period must be current_month, previous_month or YYYY-MM'})
+            }
         
-        # Get customer
-        customer_response = customers_table.get_item(Key={'customer_id': customer_id})
+        # The customer and its usage are read concurrently; a usage error
+        # only matters once the customer is known to exist
+        usage_source = body.get('usage_source', 'rollups')
+        customer_response, usage = gather(
+            lambda: customers_table.get_item(Key={'customer_id': customer_id}),
+            lambda: load_invoice_usage(customer_id, billing_period, usage_source),
+            return_exceptions=True
+        )
+        if isinstance(customer_response, Exception):
+            raise customer_response
         if 'Item' not in customer_response:
             return {
                 'statusCode': 404,
                 'headers': {'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({'error': 'Customer not found'})
             }
+        if isinstance(usage, Exception):
+            raise usage
         
         customer = customer_response['Item']
+        invoice_data = create_invoice(customer, billing_period, usage_source, usage)
         
-        # Calculate billing period dates
-        now = datetime.utcnow()
-        if billing_period == 'current_month':
-            start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            if now.month == 12:
-                end_date = now.replace(year=now.year+1, month=1, day=1) - timedelta(days=1)
-            else:
-                end_date = now.replace(month=now.month+1, day=1) - timedelta(days=1)
-        else:  # previous_month
-            if now.month == 1:
-                start_date = now.replace(year=now.year-1, month=12, day=1)
-                end_date = now.replace(day=1) - timedelta(days=1)
-            else:
-                start_date = now.replace(month=now.month-1, day=1)
-                end_date = now.replace(day=1) - timedelta(days=1)
-        
-        # Get usage data for period
-        from boto3.dynamodb.conditions import Key
-        usage_response = usage_table.query(
-            KeyConditionExpression=Key('customer_id').eq(customer_id) & 
-            Key('timestamp').between(start_date.isoformat(), end_date.isoformat())
-        )
+        return {
+            'statusCode': 201,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(invoice_json(invoice_data), default=str)
+        }
         
-        # Aggregate usage
-        usage_summary = {}
-        total_events = 0
-        for item in usage_response['Items']:
-            event_type = item['event_type']
-            quantity = float(item['quantity'])
-            total_events += 1
-            
-            if event_type not in usage_summary:
-                usage_summary[event_type] = 0
-            usage_summary[event_type] += quantity
-        
-        # Calculate billing using existing pricing engine
-        pricing_rules = {
-            'api_call': {'rate': Decimal('0.01'), 'free_tier': 100},
-            'storage_gb': {'rate': Decimal('5.00'), 'free_tier': 1},
-            'transaction': {'rate': Decimal('0.30'), 'free_tier': 10}
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)})
         }
+
+def invoice_json(invoice):
+    """Invoice with stored integer units converted to JSON amounts"""
+    # Invoices written before amounts were stored as units carry no scale
+    if 'money_scale' not in invoice:
+        return invoice
+    invoice = units_to_json(invoice)
+    if 'usage_summary' in invoice:
+        invoice['usage_summary'] = {
+            event_type: quantity_json(units) for event_type, units in invoice['usage_summary'].items()
+        }
+    invoice.pop('money_scale')
+    invoice.pop('quantity_scale', None)
+    return invoice
+
+def billing_period_dates(billing_period, now=None):
+    """Start and end datetimes of the current or previous calendar month, or a `YYYY-MM` month"""
+    now = now or datetime.utcnow()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if billing_period not in ('current_month', 'previous_month'):
+        month_start = datetime.strptime(billing_period, '%Y-%m')
+        start_date = month_start
+    elif billing_period == 'current_month':
+        start_date = month_start
+    elif month_start.month == 1:  # previous_month
+        start_date = month_start.replace(year=month_start.year-1, month=12)
+    else:
+        start_date = month_start.replace(month=month_start.month-1)
+    
+    if start_date.month == 12:
+        next_month = start_date.replace(year=start_date.year+1, month=1)
+    else:
+        next_month = start_date.replace(month=start_date.month+1)
+    end_date = next_month - timedelta(microseconds=1)
+    
+    return start_date, end_date
+
+def load_invoice_usage(customer_id, billing_period='current_month', usage_source='rollups'):
+    """Usage totals in quantity units and event count for a customer's billing period"""
+    start_date, end_date = billing_period_dates(billing_period)
+    
+    # Daily rollups keep invoice cost independent of raw event volume;
+    # 'events' re-aggregates the raw UsageEvents for reconciliation
+    if usage_source == 'events':
+        return aggregate_usage_events(customer_id, start_date, end_date)
+    
+    day_format = GRANULARITIES['day']
+    rollup_items = query_rollups(
+        rollups_table, customer_id, 'day',
+        start_date.strftime(day_format), end_date.strftime(day_format)
+    )
+    return summarize_rollups(rollup_items)
+
+def create_invoice(customer, billing_period='current_month', usage_source='rollups', usage=None):
+    """Price a customer's usage for a billing period and store the invoice
+
+    `usage` is the (usage_summary, total_events) pair from load_invoice_usage
+    when the caller has already read it.
+    """
+    customer_id = customer['customer_id']
+    start_date, end_date = billing_period_dates(billing_period)
+    usage_summary, total_events = usage or load_invoice_usage(customer_id, billing_period, usage_source)
+    
+    # Calculate billing in integer units using the precompiled default pricing plan
+    usage_events = {k: [v] for k, v in usage_summary.items()}
+    billing_result = calculate_client_billing(DEFAULT_CLIENT_PLAN, usage_events)
+    
+    # Generate invoice
+    invoice_number = f"INV-{start_date.strftime('%Y%m')}-{customer_id}"
+    due_date = (end_date + timedelta(days=30)).isoformat()
+    
+    invoice_data = {
+        'invoice_id': invoice_number,
+        'customer_id': customer_id,
+        'customer_name': customer['name'],
+        'customer_email': customer['email'],
+        'billing_period_start': start_date.isoformat(),
+        'billing_period_end': end_date.isoformat(),
+        'due_date': due_date,
+        'usage_summary': usage_summary,
+        'billing_details': billing_result['billing_details'],
+        'total_amount': billing_result['total_cost'],
+        'money_scale': MONEY_SCALE,
+        'quantity_scale': QUANTITY_SCALE,
+        'status': 'generated',
+        'created_at': datetime.utcnow().isoformat(),
+        'total_events': total_events
+    }
+    
+    # Store invoice
+    invoices_table.put_item(Item=invoice_data)
+    
+    return invoice_data
+
+def run_billing_cycle(event, context):
+    """Invoice every customer for a billing period with checkpointed progress
+
+    Customers are streamed from a segmented scan of the Customers table and
+    invoiced on a bounded worker pool. Each finished customer is recorded in BillingRuns under the
+    run id, so re-invoking the same run (after a crash or timeout) skips them.
+    A run that nears the Lambda timeout re-invokes itself asynchronously with
+    the same run id, as long as it made progress, until every customer is
+    done. The HTTP trigger is still bound by API Gateway's 29 s timeout: a
+    longer run carries on in Lambda, but the caller gets a 504 and has to
+    read the outcome from BillingRuns.
+    """
+    try:
+        body = event.get('body') if isinstance(event, dict) else None
+        params = json.loads(body) if body else (event or {})
+        billing_period = params.get('billing_period', 'previous_month')
+        usage_source = params.get('usage_source', 'rollups')
+        max_workers = int(params.get('max_workers', BILLING_RUN_WORKERS))
+        continuation = int(params.get('continuation', 0))
         
-        usage_events = {k: [v] for k, v in usage_summary.items()}
-        billing_result = calculate_client_billing(pricing_rules, usage_events)
+        start_date, _ = billing_period_dates(billing_period)
+        run_id = params.get('run_id') or f"billing-{start_date.strftime('%Y%m')}"
         
-        # Generate invoice
-        invoice_number = f"INV-{start_date.strftime('%Y%m')}-{customer_id}"
-        due_date = (end_date + timedelta(days=30)).isoformat()
+        completed = load_completed_customers(run_id)
         
-        invoice_data = {
-            'invoice_id': invoice_number,
-            'customer_id': customer_id,
-            'customer_name': customer['name'],
-            'customer_email': customer['email'],
-            'billing_period_start': start_date.isoformat(),
-            'billing_period_end': end_date.isoformat(),
-            'due_date': due_date,
-            'usage_summary': usage_summary,
-            'billing_details': billing_result['billing_details'],
-            'total_amount': float(billing_result['total_cost']),
-            'status': 'generated',
-            'created_at': datetime.utcnow().isoformat(),
-            'total_events': total_events
-        }
+        run_started = time.perf_counter()
+        latencies = []
+        failures = []
+        skipped = 0
+        timed_out = False
+        
+        def invoice_customer(customer):
+            invoice_started = time.perf_counter()
+            try:
+                invoice = create_invoice(customer, billing_period, usage_source)
+                latency_ms = (time.perf_counter() - invoice_started) * 1000
+                record_checkpoint(run_id, customer['customer_id'], 'completed', latency_ms, invoice['invoice_id'])
+                return customer['customer_id'], latency_ms, None
+            except Exception as e:
+                latency_ms = (time.perf_counter() - invoice_started) * 1000
+                record_checkpoint(run_id, customer['customer_id'], 'failed', latency_ms, error=str(e))
+                return customer['customer_id'], latency_ms, str(e)
+        
+        def collect(done):
+            for future in done:
+                customer_id, latency_ms, error = future.result()
+                latencies.append(latency_ms)
+                if error:
+                    failures.append({'customer_id': customer_id, 'error': error})
+        
+        # Keep at most 2x workers in flight so memory stays flat for large tenants
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            customers = parallel_scan(
+                customers_table,
+                BILLING_RUN_SCAN_SEGMENTS,
+                ProjectionExpression='customer_id, #name, email',
+                ExpressionAttributeNames={'#name': 'name'}
+            )
+            for customer in customers:
+                if customer['customer_id'] in completed:
+                    skipped += 1
+                    continue
+                if context is not None and hasattr(context, 'get_remaining_time_in_millis') \
+                        and context.get_remaining_time_in_millis() < BILLING_RUN_SAFETY_MS:
+                    timed_out = True
+                    break
+                if len(in_flight) >= max_workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(pool.submit(invoice_customer, customer))
+            
+            done, _ = wait(in_flight)
+            collect(done)
         
-        # Store invoice
-        invoices_table.put_item(Item=invoice_data)
+        elapsed = time.perf_counter() - run_started
+        latencies.sort()
+        
+        # Resume from the checkpoints in a fresh invocation; the period is pinned
+        # so a continuation after midnight on the 1st bills the same month
+        continued = False
+        if timed_out and latencies and continuation < MAX_BILLING_RUN_CONTINUATIONS:
+            try:
+                continue_billing_run(context, {
+                    'billing_period': start_date.strftime('%Y-%m'),
+                    'usage_source': usage_source,
+                    'max_workers': max_workers,
+                    'run_id': run_id,
+                    'continuation': continuation + 1
+                })
+                continued = True
+            except Exception as e:
+                print(f"Failed to continue billing run {run_id}: {e}")
+        
+        summary = {
+            'run_id': run_id,
+            'billing_period': billing_period,
+            'complete': not timed_out,
+            'continued': continued,
+            'continuation': continuation,
+            'invoiced': len(latencies) - len(failures),
+            'failed': len(failures),
+            'skipped_already_completed': skipped,
+            'elapsed_seconds': round(elapsed, 3),
+            'invoices_per_second': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0,
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': round(latencies[-1], 2) if latencies else 0
+            },
+            'failures': failures[:50]
+        }
         
         return {
-            'statusCode': 201,
+            'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(invoice_data, default=str)
+            'body': json.dumps(summary)
         }
         
     except Exception as e:
@@ -112,29 +326,135 @@ def generate_invoice(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
+def continue_billing_run(context, params):
+    """Asynchronously invoke this function again to carry on a billing run"""
+    aws.client('lambda').invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps(params).encode()
+    )
+
+def load_completed_customers(run_id):
+    """Customer ids already invoiced by a billing run"""
+    from boto3.dynamodb.conditions import Key
+    checkpoints = iter_items(
+        billing_runs_table.query,
+        KeyConditionExpression=Key('run_id').eq(run_id),
+        ProjectionExpression='customer_id, #status',
+        ExpressionAttributeNames={'#status': 'status'}
+    )
+    return {item['customer_id'] for item in checkpoints if item['status'] == 'completed'}
+
+def record_checkpoint(run_id, customer_id, status, latency_ms, invoice_id=None, error=None):
+    """Record the outcome of one customer in a billing run"""
+    checkpoint = {
+        'run_id': run_id,
+        'customer_id': customer_id,
+        'status': status,
+        'latency_ms': Decimal(str(round(latency_ms, 2))),
+        'updated_at': datetime.utcnow().isoformat()
+    }
+    if invoice_id:
+        checkpoint['invoice_id'] = invoice_id
+    if error:
+        checkpoint['error'] = error
+    billing_runs_table.put_item(Item=checkpoint)
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return round(sorted_values[rank], 2)
+
+def aggregate_usage_events(customer_id, start_date, end_date):
+    """Sum raw usage events per event type for a billing period, in quantity units
+
+    Pages through the whole period but only projects event_type and quantity,
+    folding each page into running totals instead of holding every item.
+    Periods in archived months are read from the Parquet archive instead,
+    since their raw items may have expired from DynamoDB.
+    """
+    from boto3.dynamodb.conditions import Key
+    if usage_archive is not None:
+        archived = archived_usage_summary(usage_archive, customer_id, start_date, end_date)
+        if archived is not None:
+            return archived
+    
+    events = iter_items(
+        usage_table.query,
+        KeyConditionExpression=Key('customer_id').eq(customer_id) & 
+        Key('timestamp').between(*sort_key_range(start_date, end_date)),
+        ProjectionExpression='event_type, quantity'
+    )
+    
+    usage_summary = {}
+    total_events = 0
+    for item in events:
+        event_type = item['event_type']
+        total_events += 1
+        usage_summary[event_type] = usage_summary.get(event_type, 0) + to_quantity_units(item['quantity'])
+    
+    return usage_summary, total_events
+
 def get_invoices(event, context):
-    """Get invoices for a customer"""
+    """Get a page of invoices for a customer, newest first
+
+    Query parameters: `limit` (1-100, default 25) and `next_token` from the
+    previous page.
+    """
     try:
+        from boto3.dynamodb.conditions import Key
         customer_id = event['pathParameters']['customer_id']
+        params = event.get('queryStringParameters') or {}
         
-        # Scan for invoices (in production, use GSI)
-        response = invoices_table.scan(
-            FilterExpression='customer_id = :customer_id',
-            ExpressionAttributeValues={':customer_id': customer_id}
-        )
+        try:
+            limit = int(params.get('limit', DEFAULT_INVOICE_PAGE_SIZE))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_INVOICE_PAGE_SIZE:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'limit must be between 1 and {MAX_INVOICE_PAGE_SIZE}'})
+            }
         
-        invoices = response['Items']
-        invoices.sort(key=lambda x: x['created_at'], reverse=True)
+        try:
+            next_token = params.get('next_token')
+            # Cursors are only valid for the customer whose query issued them
+            if next_token and decode_page_token(next_token).get('customer_id') != customer_id:
+                raise ValueError('Invalid next_token')
+            invoices, next_token = query_page(
+                invoices_table.query,
+                limit,
+                next_token,
+                IndexName=INVOICES_BY_CUSTOMER_INDEX,
+                KeyConditionExpression=Key('customer_id').eq(customer_id),
+                ScanIndexForward=False
+            )
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
         
-        return {
+        # Invoices carry no per-customer version, so the page is validated by content
+        body = json.dumps({
+            'customer_id': customer_id,
+            'invoices': [invoice_json(invoice) for invoice in invoices],
+            'count': len(invoices),
+            'next_token': next_token
+        }, default=str)
+        etag = content_etag(body)
+        if etag_matches(event, etag):
+            return not_modified(etag, INVOICES_CACHE_CONTROL)
+        
+        return with_validators({
             'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'customer_id': customer_id,
-                'invoices': invoices,
-                'total_invoices': len(invoices)
-            }, default=str)
-        }
+            'body': body
+        }, etag, INVOICES_CACHE_CONTROL)
         
     except Exception as e:
         return {
@@ -144,72 +464,58 @@ def get_invoices(event, context):
         }
 
 def get_analytics(event, context):
-    """Get billing analytics"""
+    """Get billing analytics from the precomputed analytics view"""
     try:
-        # Get all invoices for analytics
-        invoices_response = invoices_table.scan()
-        invoices = invoices_response['Items']
-        
-        # Get all customers
-        customers_response = customers_table.scan()
-        customers = customers_response['Items']
-        
-        # Get recent usage events
-        usage_response = usage_table.scan(Limit=100)
-        recent_usage = usage_response['Items']
-        recent_usage.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        # Calculate metrics
-        total_revenue = sum(float(inv.get('total_amount', 0)) for inv in invoices)
-        total_customers = len(customers)
-        total_invoices = len(invoices)
-        
-        # Monthly revenue trend (last 6 months)
-        monthly_revenue = {}
-        for invoice in invoices:
-            created_at = invoice['created_at'][:7]  # YYYY-MM
-            if created_at not in monthly_revenue:
-                monthly_revenue[created_at] = 0
-            monthly_revenue[created_at] += float(invoice.get('total_amount', 0))
-        
-        # Usage by event type
+        item = analytics_view_table.get_item(Key={'view_id': VIEW_ID}).get('Item') or empty_view()
+        
+        # Every stream batch bumps the view version after updating the usage
+        # sketches; the day moves the 30-day window
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        etag = version_etag(VIEW_ID, int(item.get('version', 0)), today)
+        if etag_matches(event, etag):
+            return not_modified(etag, ANALYTICS_CACHE_CONTROL)
+        
+        # Usage by event type over the last 30 days
+        oldest_day = (datetime.utcnow() - timedelta(days=USAGE_WINDOW_DAYS - 1)).strftime('%Y-%m-%d')
         usage_by_type = {}
-        for event in recent_usage:
-            event_type = event['event_type']
-            quantity = float(event['quantity'])
-            if event_type not in usage_by_type:
-                usage_by_type[event_type] = 0
-            usage_by_type[event_type] += quantity
-        
-        # Recent activities
-        recent_activities = []
-        for i, event in enumerate(recent_usage[:10]):
-            recent_activities.append({
-                'id': i,
-                'type': 'usage_event',
-                'description': f"{event['event_type']} - {event['quantity']} units",
-                'customer_id': event['customer_id'],
-                'timestamp': event['timestamp'],
-                'time_ago': get_time_ago(event['timestamp'])
-            })
+        for day, usage in item['usage_by_day'].items():
+            if day < oldest_day:
+                continue
+            for event_type, units in usage.items():
+                usage_by_type[event_type] = usage_by_type.get(event_type, 0) + int(units)
         
-        return {
+        total_revenue = int(item['total_revenue'])
+        total_invoices = int(item['total_invoices'])
+        
+        # Approximate distinct customers and quantity percentiles, merged from
+        # the daily sketches on the platform-wide rollups
+        usage_sketches = summarize_sketches(query_rollups(rollups_table, ALL_CUSTOMERS, 'day', oldest_day, today))
+        
+        recent_activities = [
+            dict(activity, id=i, time_ago=get_time_ago(activity['timestamp']))
+            for i, activity in enumerate(item['recent_activities'])
+        ]
+        
+        return with_validators({
             'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({
                 'metrics': {
-                    'total_revenue': total_revenue,
-                    'total_customers': total_customers,
+                    'total_revenue': money_json(total_revenue),
+                    'total_customers': int(item['total_customers']),
                     'total_invoices': total_invoices,
-                    'avg_invoice_amount': total_revenue / max(total_invoices, 1)
+                    'avg_invoice_amount': money_json(total_revenue // max(total_invoices, 1))
                 },
-                'monthly_revenue': monthly_revenue,
-                'usage_by_type': usage_by_type,
+                'monthly_revenue': {month: money_json(units) for month, units in sorted(item['monthly_revenue'].items())},
+                'usage_by_type': {event_type: quantity_json(units) for event_type, units in usage_by_type.items()},
+                'usage_sketches': usage_sketches,
                 'recent_activities': recent_activities,
-                'customers': customers[:20],  # Latest 20 customers
-                'invoices': invoices[:10]     # Latest 10 invoices
+                'customers': item['recent_customers'],
+                'invoices': [invoice_json(invoice) for invoice in item['recent_invoices']],
+                'updated_at': item.get('updated_at'),
+                'version': int(item.get('version', 0))
             }, default=str)
-        }
+        }, etag, ANALYTICS_CACHE_CONTROL)
         
     except Exception as e:
         return {
@@ -218,10 +524,32 @@ def get_analytics(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
+def process_analytics_stream(event, context):
+    """Fold Invoices, Customers and UsageEvents stream records into the analytics view
+
+    Stream delivery is at-least-once: a batch retried after its update was
+    written is counted twice. scripts/backfill_analytics.py rebuilds exact totals.
+    New usage events are also merged into the daily sketches, and a retried
+    batch is merged again: distinct counts are unaffected, but the t-digest
+    counts those events twice and the top-customer counters add their
+    quantity twice, so percentiles and top-customer figures are approximate
+    under retries as well as by construction.
+    """
+    # Sketches first, so a client holding the new view version's ETag never
+    # misses the sketch updates from the same batch
+    sketch_errors = apply_usage_sketches(rollups_table, fold_usage_sketches(usage_event_inserts(event.get('Records', []))))
+    if sketch_errors:
+        print(f"Failed to update {sketch_errors} usage sketches")
+    delta = fold_stream_records(event.get('Records', []))
+    view = update_analytics_view(analytics_view_table, delta)
+    print(f"Applied {len(event.get('Records', []))} stream records to analytics view version {view['version']}")
+    return {'records': len(event.get('Records', [])), 'version': view['version']}
+
 def get_time_ago(timestamp_str):
     """Calculate time ago from timestamp"""
     try:
-        timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+        # Usage event sort keys carry a uniqueness suffix after the ISO time
+        timestamp = datetime.fromisoformat(sort_key_timestamp(timestamp_str).replace('Z', '+00:00'))
         now = datetime.utcnow().replace(tzinfo=timestamp.tzinfo)
         diff = now - timestamp
         
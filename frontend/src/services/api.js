@@ -3,21 +3,30 @@ const API_BASE_URL = process.env.REACT_APP_API_URL || '/api';
 class ApiService {
   constructor() {
     this.token = null;
+    // Last ETag and body per GET url, so polling revalidates instead of refetching
+    this.validated = new Map();
   }
 
   async request(endpoint, options = {}) {
     const url = `${API_BASE_URL}${endpoint}`;
+    const isGet = !options.method || options.method === 'GET';
+    const cached = isGet ? this.validated.get(url) : undefined;
     const config = {
+      ...options,
       headers: {
         'Content-Type': 'application/json',
         ...(this.token && { 'Authorization': `Bearer ${this.token}` }),
+        ...(cached && { 'If-None-Match': cached.etag }),
         ...options.headers,
       },
-      ...options,
     };
 
     const response = await fetch(url, config);
     
+    if (response.status === 304 && cached) {
+      return cached.data;
+    }
+    
     if (!response.ok) {
       if (response.status === 401) {
         this.token = null;
@@ -27,7 +36,12 @@ class ApiService {
       throw new Error(`HTTP error! status: ${response.status}`);
     }
     
-    return await response.json();
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (isGet && etag) {
+      this.validated.set(url, { etag, data });
+    }
+    return data;
   }
 
   async login(email, password) {
@@ -51,6 +65,7 @@ class ApiService {
 
   async logout() {
     this.token = null;
+    this.validated.clear();
     localStorage.removeItem('auth_token');
   }
 
@@ -1,53 +1,318 @@
 import json
-import boto3
-from datetime import datetime
-from decimal import Decimal
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
 import os
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from utils import aws
+from utils.dynamo import batch_write_items, iter_items
+from utils.money import QUANTITY_SCALE, quantity_json, to_quantity_units
+from utils.sort_keys import new_sort_key, sort_key_range, sort_key_timestamp
+from utils.rollups import aggregate_rollups, apply_rollups, query_rollups
+from utils.timeseries import (
+    MAX_SERIES_POINTS, RESOLUTIONS, RESOLUTION_SOURCES,
+    build_series, choose_resolution, count_buckets, floor_to, next_bucket, parse_utc
+)
 
 # Get stage from environment
 STAGE = os.environ.get('STAGE', 'prod')
 
 # Stage-specific table names
 USAGE_EVENTS_TABLE = f'UsageEvents-{STAGE}'
+USAGE_ROLLUPS_TABLE = f'UsageRollups-{STAGE}'
 
-dynamodb = boto3.resource('dynamodb')
+# Largest number of events accepted by a single POST /usage/batch request
+MAX_BATCH_EVENTS = 1000
+
+# Range covered by GET /customers/{customer_id}/usage when none is given
+DEFAULT_USAGE_RANGE_DAYS = 30
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
+}
+
+# Checks metadata the way boto3 will serialize it, before anything is written
+serializer = TypeSerializer()
+
+# Built from the shared boto3 session on first use, not at import
+dynamodb = aws.LazyResource('dynamodb')
+usage_table = aws.table(USAGE_EVENTS_TABLE)
+rollups_table = aws.table(USAGE_ROLLUPS_TABLE)
+
+def build_usage_event(payload):
+    """Validate a usage payload and build the UsageEvents item
+
+    Returns (item, error) where exactly one of the two is None.
+    """
+    if not isinstance(payload, dict):
+        return None, 'Usage event must be a JSON object'
+
+    for field in ('customer_id', 'event_type', 'quantity'):
+        if field not in payload:
+            return None, f'Missing required field: {field}'
+
+    try:
+        quantity = Decimal(str(payload['quantity']))
+    except (InvalidOperation, ValueError):
+        return None, 'Quantity must be a number'
+    if not quantity.is_finite() or quantity <= 0:
+        return None, 'Quantity must be positive'
+    # Billing counts thousandths of a unit: raw events are rounded one by one
+    # and rollups once per bucket, so finer quantities would bill differently
+    if (quantity * QUANTITY_SCALE) % 1:
+        return None, 'Quantity must have at most 3 decimal places'
+
+    # JSON floats become Decimals; anything DynamoDB would still refuse is
+    # rejected here so it cannot fail a batch write halfway through
+    try:
+        metadata = json.loads(json.dumps(payload.get('metadata', {}), allow_nan=False), parse_float=Decimal)
+        serializer.serialize(metadata)
+    except (TypeError, ValueError, ArithmeticError):
+        return None, 'Metadata must be JSON with finite numbers DynamoDB can store'
+
+    usage_event = {
+        'customer_id': str(payload['customer_id']),
+        'timestamp': new_sort_key(),
+        'event_type': str(payload['event_type']),
+        'quantity': quantity,
+        'metadata': metadata
+    }
+    return usage_event, None
 
 def ingest_usage(event, context):
-    """Minimal usage ingestion for Day 7 demo"""
+    """Record a single usage event"""
     try:
-        body = json.loads(event['body'])
-        usage_table = dynamodb.Table(USAGE_EVENTS_TABLE)
-        
-        usage_event = {
-            'customer_id': body.get('customer_id', 'demo-customer'),
-            'timestamp': datetime.utcnow().isoformat(),
-            'event_type': body.get('event_type', 'api_call'),
-            'quantity': Decimal(str(body.get('quantity', 1))),
-            'metadata': body.get('metadata', {})
-        }
-        
+        try:
+            body = json.loads(event['body'])
+        except (TypeError, ValueError):
+            return {
+                'statusCode': 400,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': 'Invalid JSON in request body'})
+            }
+
+        usage_event, error = build_usage_event(body)
+        if error:
+            return {
+                'statusCode': 400,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': error})
+            }
+
         usage_table.put_item(Item=usage_event)
+        rollup_errors = apply_rollups(rollups_table, aggregate_rollups([usage_event]))
         
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-            },
+            'headers': CORS_HEADERS,
             'body': json.dumps({
                 'message': 'Usage recorded successfully',
+                'customer_id': usage_event['customer_id'],
+                'timestamp': usage_event['timestamp'],
+                'rollup_errors': rollup_errors
+            })
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def ingest_usage_batch(event, context):
+    """Record many usage events with chunked BatchWriteItem calls"""
+    try:
+        try:
+            body = json.loads(event['body'])
+        except (TypeError, ValueError):
+            return {
+                'statusCode': 400,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': 'Invalid JSON in request body'})
+            }
+
+        events = body.get('events') if isinstance(body, dict) else None
+        if not isinstance(events, list) or not events:
+            return {
+                'statusCode': 400,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': 'Request body must contain a non-empty events list'})
+            }
+        if len(events) > MAX_BATCH_EVENTS:
+            return {
+                'statusCode': 413,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': f'Batch exceeds {MAX_BATCH_EVENTS} events'})
+            }
+
+        # Validate everything up front so only well-formed events are written
+        results = []
+        items = []
+        item_indexes = []
+        for index, payload in enumerate(events):
+            usage_event, error = build_usage_event(payload)
+            if error:
+                results.append({'index': index, 'status': 'rejected', 'error': error})
+                continue
+            results.append({
+                'index': index,
+                'status': 'accepted',
+                'customer_id': usage_event['customer_id'],
                 'timestamp': usage_event['timestamp']
             })
+            items.append(usage_event)
+            item_indexes.append(index)
+
+        failed = batch_write_items(dynamodb, USAGE_EVENTS_TABLE, items, ('customer_id', 'timestamp'))
+        for item_position, error in failed.items():
+            result = results[item_indexes[item_position]]
+            result['status'] = 'failed'
+            result['error'] = error
+
+        # Roll up only what was stored, pre-aggregated so each bucket is one update
+        written = [item for position, item in enumerate(items) if position not in failed]
+        rollup_errors = apply_rollups(rollups_table, aggregate_rollups(written))
+
+        accepted = sum(1 for result in results if result['status'] == 'accepted')
+        
+        return {
+            'statusCode': 200 if accepted == len(results) else 207,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({
+                'message': f'Recorded {accepted} of {len(results)} usage events',
+                'accepted': accepted,
+                'rejected': sum(1 for result in results if result['status'] == 'rejected'),
+                'failed': len(failed),
+                'rollup_errors': rollup_errors,
+                'results': results
+            })
         }
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-            },
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def get_customer_usage(event, context):
+    """Usage time series for a customer at a requested resolution
+
+    Query parameters: `start_date` and `end_date` (ISO 8601, default the last
+    30 days) and `resolution` (minute, hour, day or month; default the finest
+    one that fits in MAX_SERIES_POINTS). Hour, day and month series are built
+    from the usage rollups, so their cost depends on the number of buckets
+    rather than the number of events; minute series read raw events. The range
+    is widened to whole buckets.
+    """
+    try:
+        customer_id = event['pathParameters']['customer_id']
+        params = event.get('queryStringParameters') or {}
+        
+        try:
+            end_date = parse_utc(params['end_date']) if params.get('end_date') else datetime.utcnow()
+            start_date = parse_utc(params['start_date']) if params.get('start_date') \
+                else end_date - timedelta(days=DEFAULT_USAGE_RANGE_DAYS)
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': 'start_date and end_date must be ISO 8601 datetimes'})
+            }
+        if start_date > end_date:
+            return {
+                'statusCode': 400,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': 'start_date must not be after end_date'})
+            }
+        
+        resolution = params.get('resolution') or choose_resolution(start_date, end_date)
+        if resolution not in RESOLUTIONS:
+            return {
+                'statusCode': 400,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({'error': f"resolution must be one of: {', '.join(RESOLUTIONS)}"})
+            }
+        if count_buckets(start_date, end_date, resolution) > MAX_SERIES_POINTS:
+            return {
+                'statusCode': 400,
+                'headers': CORS_HEADERS,
+                'body': json.dumps({
+                    'error': f'Range has more than {MAX_SERIES_POINTS} {resolution} buckets; use a coarser resolution'
+                })
+            }
+        
+        # Whole buckets only, so the first and last points are never partial
+        start_date = floor_to(start_date, resolution)
+        end_date = next_bucket(floor_to(end_date, resolution), resolution) - timedelta(microseconds=1)
+        
+        # Fold usage into {bucket label: {event_type: quantity units}} plus totals
+        granularity = RESOLUTION_SOURCES[resolution]
+        label_length = len(start_date.strftime(RESOLUTIONS[resolution]))
+        if granularity is None:
+            events = iter_items(
+                usage_table.query,
+                KeyConditionExpression=Key('customer_id').eq(customer_id) &
+                Key('timestamp').between(*sort_key_range(start_date, end_date)),
+                ProjectionExpression='#ts, event_type, quantity',
+                ExpressionAttributeNames={'#ts': 'timestamp'}
+            )
+            points = (
+                (sort_key_timestamp(item['timestamp']), item['event_type'], item['quantity'], 1)
+                for item in events
+            )
+        else:
+            bucket_format = RESOLUTIONS[granularity]
+            rollups = query_rollups(
+                rollups_table, customer_id, granularity,
+                start_date.strftime(bucket_format), end_date.strftime(bucket_format)
+            )
+            points = (
+                (item['bucket'], item['event_type'], item['quantity'], int(item['event_count']))
+                for item in rollups
+            )
+        
+        totals = {}
+        daily_breakdown = {}
+        usage_summary = {}
+        total_events = 0
+        for bucket, event_type, quantity, event_count in points:
+            units = to_quantity_units(quantity)
+            bucket_usage = totals.setdefault(bucket[:label_length], {})
+            bucket_usage[event_type] = bucket_usage.get(event_type, 0) + units
+            day_usage = daily_breakdown.setdefault(bucket[:10], {})
+            day_usage[event_type] = day_usage.get(event_type, 0) + units
+            summary = usage_summary.setdefault(event_type, {'total_quantity': 0, 'event_count': 0})
+            summary['total_quantity'] += units
+            summary['event_count'] += event_count
+            total_events += event_count
+        
+        return {
+            'statusCode': 200,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({
+                'customer_id': customer_id,
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'resolution': resolution,
+                'source': 'events' if granularity is None else f'{granularity}_rollups',
+                'usage_summary': {
+                    event_type: dict(summary, total_quantity=quantity_json(summary['total_quantity']))
+                    for event_type, summary in usage_summary.items()
+                },
+                'daily_breakdown': {
+                    day: {event_type: quantity_json(units) for event_type, units in usage.items()}
+                    for day, usage in sorted(daily_breakdown.items())
+                },
+                'total_events': total_events,
+                'series': build_series(totals, start_date, end_date, resolution)
+            })
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': CORS_HEADERS,
             'body': json.dumps({'error': str(e)})
         }
 
@@ -79,20 +344,12 @@ def get_analytics(event, context):
         
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-            },
+            'headers': CORS_HEADERS,
             'body': json.dumps(analytics_data, default=str)
         }
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-            },
+            'headers': CORS_HEADERS,
             'body': json.dumps({'error': str(e)})
         }
\ No newline at end of file
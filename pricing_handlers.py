@@ -1,20 +1,65 @@
 import json
-import boto3
 import os
 from datetime import datetime
+from decimal import Decimal
+from boto3.dynamodb.types import TypeSerializer
+from utils import aws
 from utils.pricing import (
     calculate_squill_billing, 
     calculate_client_billing, 
     validate_subscription_limits,
     get_pricing_tier_info,
+    compile_client_plan,
     SUBSCRIPTION_TIERS
 )
+from utils.cache import MISSING, TTLCache
+from utils.dynamo import batch_get_items, gather, key_id
+from utils.money import to_quantity_units, units_to_json
+from utils.etags import version_etag, content_etag, etag_matches, not_modified, with_validators
 
-# Initialize DynamoDB resource
-region = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
-dynamodb = boto3.resource('dynamodb', region_name=region)
-subscriptions_table = dynamodb.Table(f'Subscriptions-{os.environ.get("STAGE", "dev")}')
-pricing_rules_table = dynamodb.Table(f'PricingRules-{os.environ.get("STAGE", "dev")}')
+# DynamoDB tables, created from the shared resource on first use
+dynamodb = aws.LazyResource('dynamodb')
+subscriptions_table = aws.table(f'Subscriptions-{os.environ.get("STAGE", "dev")}')
+pricing_rules_table = aws.table(f'PricingRules-{os.environ.get("STAGE", "dev")}')
+serializer = TypeSerializer()
+
+# Subscriptions and pricing rules change rarely but are read on every pricing
+# call, so warm containers keep them for a short TTL. Writes made through this
+# container update the cache immediately; other containers see them within the TTL.
+CACHE_TTL_SECONDS = int(os.environ.get('PRICING_CACHE_TTL_SECONDS', '60'))
+subscription_cache = TTLCache(maxsize=2048, ttl=CACHE_TTL_SECONDS)
+pricing_rules_cache = TTLCache(maxsize=2048, ttl=CACHE_TTL_SECONDS)
+
+# Clients may reuse a subscription for as long as a warm container would
+SUBSCRIPTION_CACHE_CONTROL = f'private, max-age={CACHE_TTL_SECONDS}'
+
+# Largest number of entries accepted by a single POST /pricing/calculate/batch request
+MAX_PRICING_BATCH = 100
+
+
+def item_version(item):
+    """Version of a stored record, used to keep stale reads out of the cache"""
+    return item.get('updated_at') or item.get('created_at')
+
+
+def load_subscription(client_id):
+    """Subscription item for a client, or None if it does not exist"""
+    # Missing subscriptions are not cached so a new client is visible at once
+    return subscription_cache.get_or_load(
+        client_id,
+        lambda: subscriptions_table.get_item(Key={'client_id': client_id}).get('Item'),
+        version_of=item_version,
+        cache_missing=False
+    )
+
+
+def load_client_plan(client_id):
+    """Compiled pricing plan for a client, or None if it has no custom rules"""
+    def load():
+        item = pricing_rules_table.get_item(Key={'client_id': client_id}).get('Item')
+        return compile_client_plan(item['rules'], item_version(item)) if item else None
+    
+    return pricing_rules_cache.get_or_load(client_id, load, version_of=lambda plan: plan.version)
 
 
 def create_subscription(event, context):
@@ -56,6 +101,7 @@ def create_subscription(event, context):
         }
         
         subscriptions_table.put_item(Item=subscription_data)
+        subscription_cache.put(subscription_data['client_id'], subscription_data, item_version(subscription_data))
         
         return {
             'statusCode': 201,
@@ -76,24 +122,38 @@ def get_subscription(event, context):
     try:
         client_id = event['pathParameters']['client_id']
         
-        response = subscriptions_table.get_item(Key={'client_id': client_id})
+        subscription = load_subscription(client_id)
         
-        if 'Item' not in response:
+        if subscription is None:
             return {
                 'statusCode': 404,
                 'headers': {'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({'error': 'Subscription not found'})
             }
         
-        subscription = response['Item']
+        version = item_version(subscription)
+        if version:
+            etag = version_etag(client_id, version, subscription['subscription_tier'])
+            if etag_matches(event, etag):
+                return not_modified(etag, SUBSCRIPTION_CACHE_CONTROL)
+        
+        # Copy so the cached item is never mutated
+        subscription = dict(subscription)
         tier_info = get_pricing_tier_info(subscription['subscription_tier'])
         subscription['tier_details'] = tier_info
+        body = json.dumps(subscription, default=str)
         
-        return {
+        # Items written without a timestamp fall back to a content hash
+        if not version:
+            etag = content_etag(body)
+            if etag_matches(event, etag):
+                return not_modified(etag, SUBSCRIPTION_CACHE_CONTROL)
+        
+        return with_validators({
             'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(subscription, default=str)
-        }
+            'body': body
+        }, etag, SUBSCRIPTION_CACHE_CONTROL)
         
     except Exception as e:
         return {
@@ -103,6 +163,35 @@ def get_subscription(event, context):
         }
 
 
+def usage_units_from(request):
+    """(usage_units, client_usage_units) of a pricing request, in quantity units"""
+    # Pricing runs on integer quantity units; JSON numbers are converted once here
+    try:
+        usage_units = {metric: to_quantity_units(usage) for metric, usage in request['usage_data'].items()}
+        client_usage_units = {
+            event_type: [to_quantity_units(quantity) for quantity in quantities]
+            for event_type, quantities in request.get('client_usage_events', {}).items()
+        }
+    except (AttributeError, TypeError, ValueError, ArithmeticError):
+        raise ValueError('Usage quantities must be numbers')
+    return usage_units, client_usage_units
+
+
+def price_usage(client_id, subscription_tier, pricing_rules, usage_units, client_usage_units):
+    """Pricing response for one client, amounts converted to JSON numbers"""
+    squill_billing = calculate_squill_billing(subscription_tier, usage_units)
+    client_billing = calculate_client_billing(pricing_rules, client_usage_units)
+    within_limits, violations = validate_subscription_limits(subscription_tier, usage_units)
+    return {
+        'client_id': client_id,
+        'subscription_tier': subscription_tier,
+        'squill_billing': units_to_json(squill_billing),
+        'client_billing': units_to_json(client_billing),
+        'within_limits': within_limits,
+        'limit_violations': units_to_json(violations) if not within_limits else []
+    }
+
+
 def calculate_pricing(event, context):
     """Calculate pricing for given usage"""
     try:
@@ -116,44 +205,175 @@ def calculate_pricing(event, context):
             }
         
         client_id = body['client_id']
-        usage_data = body['usage_data']
         
-        subscription_response = subscriptions_table.get_item(Key={'client_id': client_id})
-        if 'Item' not in subscription_response:
+        # Custom pricing rules are optional; default pricing applies if they cannot be read
+        def load_rules():
+            try:
+                return load_client_plan(client_id)
+            except Exception:
+                return None
+        
+        # The two reads are independent, so they overlap instead of chaining
+        subscription, pricing_rules = gather(lambda: load_subscription(client_id), load_rules)
+        if subscription is None:
             return {
                 'statusCode': 404,
                 'headers': {'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({'error': 'Subscription not found'})
             }
         
-        subscription = subscription_response['Item']
-        subscription_tier = subscription['subscription_tier']
+        try:
+            usage_units, client_usage_units = usage_units_from(body)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
         
-        squill_billing = calculate_squill_billing(subscription_tier, usage_data)
+        return {
+            'statusCode': 200,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(
+                price_usage(client_id, subscription['subscription_tier'], pricing_rules, usage_units, client_usage_units),
+                default=str
+            )
+        }
         
-        pricing_rules = None
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def load_pricing_batch(client_ids):
+    """Subscriptions and compiled pricing plans for many clients
+
+    Cached entries are used as they are; everything else is read in one
+    BatchGetItem pass over both tables and cached like single reads.
+    Returns (subscriptions, plans, errors): the subscription item or None,
+    the client's plan or None for default pricing, and the reason for every
+    client whose subscription could not be read.
+    """
+    subscriptions = {}
+    plans = {}
+    for client_id in client_ids:
+        subscription = subscription_cache.get(client_id, MISSING)
+        if subscription is not MISSING:
+            subscriptions[client_id] = subscription
+        plan = pricing_rules_cache.get(client_id, MISSING)
+        if plan is not MISSING:
+            plans[client_id] = plan
+    
+    found, failed = batch_get_items(dynamodb, {
+        subscriptions_table.name: [{'client_id': c} for c in client_ids if c not in subscriptions],
+        pricing_rules_table.name: [{'client_id': c} for c in client_ids if c not in plans]
+    })
+    
+    errors = {}
+    for client_id in client_ids:
+        key = key_id({'client_id': client_id})
+        if client_id not in subscriptions and key in failed[subscriptions_table.name]:
+            errors[client_id] = failed[subscriptions_table.name][key]
+        elif client_id not in subscriptions:
+            item = found[subscriptions_table.name].get(key)
+            subscriptions[client_id] = item
+            # Missing subscriptions are not cached, as in load_subscription
+            if item is not None:
+                subscription_cache.put(client_id, item, item_version(item))
+        
+        if client_id in plans:
+            continue
+        # As in calculate_pricing, unreadable or invalid rules fall back to default pricing
+        plans[client_id] = None
+        item = found[pricing_rules_table.name].get(key)
+        if item is None:
+            if key not in failed[pricing_rules_table.name]:
+                pricing_rules_cache.put(client_id, None)
+            continue
         try:
-            rules_response = pricing_rules_table.get_item(Key={'client_id': client_id})
-            if 'Item' in rules_response:
-                pricing_rules = rules_response['Item']['rules']
+            plans[client_id] = compile_client_plan(item['rules'], item_version(item))
         except Exception:
-            pass
+            continue
+        pricing_rules_cache.put(client_id, plans[client_id], plans[client_id].version)
+    
+    return subscriptions, plans, errors
+
+
+def calculate_pricing_batch(event, context):
+    """Calculate pricing for many clients, reading their records in one batch"""
+    try:
+        try:
+            body = json.loads(event['body'])
+        except (TypeError, ValueError):
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Invalid JSON in request body'})
+            }
         
-        client_usage_events = body.get('client_usage_events', {})
-        client_billing = calculate_client_billing(pricing_rules, client_usage_events)
+        entries = body.get('entries') if isinstance(body, dict) else None
+        if not isinstance(entries, list) or not entries:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Request body must contain a non-empty entries list'})
+            }
+        if len(entries) > MAX_PRICING_BATCH:
+            return {
+                'statusCode': 413,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Batch exceeds {MAX_PRICING_BATCH} entries'})
+            }
+        
+        # Validate everything up front so only well-formed entries are read and priced
+        results = []
+        valid = []
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict) or not isinstance(entry.get('client_id'), str) \
+                    or not entry['client_id'] or 'usage_data' not in entry:
+                results.append({'index': index, 'status': 'rejected', 'error': 'Missing client_id or usage_data'})
+                continue
+            try:
+                usage_units, client_usage_units = usage_units_from(entry)
+            except ValueError as e:
+                results.append({'index': index, 'status': 'rejected', 'client_id': entry['client_id'], 'error': str(e)})
+                continue
+            results.append(None)
+            valid.append((index, entry['client_id'], usage_units, client_usage_units))
         
-        within_limits, violations = validate_subscription_limits(subscription_tier, usage_data)
+        subscriptions, plans, errors = load_pricing_batch(list(dict.fromkeys(entry[1] for entry in valid)))
+        
+        for index, client_id, usage_units, client_usage_units in valid:
+            if client_id in errors:
+                results[index] = {'index': index, 'status': 'failed', 'client_id': client_id, 'error': errors[client_id]}
+            elif subscriptions[client_id] is None:
+                results[index] = {
+                    'index': index, 'status': 'not_found', 'client_id': client_id, 'error': 'Subscription not found'
+                }
+            else:
+                try:
+                    priced = price_usage(
+                        client_id, subscriptions[client_id]['subscription_tier'], plans[client_id],
+                        usage_units, client_usage_units
+                    )
+                except Exception as e:
+                    results[index] = {'index': index, 'status': 'failed', 'client_id': client_id, 'error': str(e)}
+                else:
+                    results[index] = {'index': index, 'status': 'priced', **priced}
+        
+        counts = {status: sum(1 for result in results if result['status'] == status)
+                  for status in ('priced', 'not_found', 'rejected', 'failed')}
         
         return {
-            'statusCode': 200,
+            'statusCode': 200 if counts['priced'] == len(results) else 207,
             'headers': {'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({
-                'client_id': client_id,
-                'subscription_tier': subscription_tier,
-                'squill_billing': squill_billing,
-                'client_billing': client_billing,
-                'within_limits': within_limits,
-                'limit_violations': violations if not within_limits else []
+                'message': f"Priced {counts['priced']} of {len(results)} entries",
+                **counts,
+                'results': results
             }, default=str)
         }
         
@@ -164,12 +384,12 @@ def calculate_pricing(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
-
 def update_pricing_rules(event, context):
     """Update pricing rules for a client"""
     try:
         client_id = event['pathParameters']['client_id']
-        body = json.loads(event['body'])
+        # Rates are stored as given, and DynamoDB takes Decimals but not floats
+        body = json.loads(event['body'], parse_float=Decimal)
         
         if 'pricing_rules' not in body:
             return {
@@ -178,8 +398,19 @@ def update_pricing_rules(event, context):
                 'body': json.dumps({'error': 'Missing pricing_rules'})
             }
         
-        subscription_response = subscriptions_table.get_item(Key={'client_id': client_id})
-        if 'Item' not in subscription_response:
+        # Reject rules that cannot be compiled before they reach the pricing path
+        updated_at = datetime.utcnow().isoformat()
+        try:
+            plan = compile_client_plan(body['pricing_rules'], updated_at)
+            serializer.serialize(body['pricing_rules'])
+        except (AttributeError, KeyError, TypeError, ValueError, ArithmeticError) as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Invalid pricing rules: {e}'})
+            }
+        
+        if load_subscription(client_id) is None:
             return {
                 'statusCode': 404,
                 'headers': {'Access-Control-Allow-Origin': '*'},
@@ -189,10 +420,11 @@ def update_pricing_rules(event, context):
         pricing_data = {
             'client_id': client_id,
             'rules': body['pricing_rules'],
-            'updated_at': datetime.utcnow().isoformat()
+            'updated_at': updated_at
         }
         
         pricing_rules_table.put_item(Item=pricing_data)
+        pricing_rules_cache.put(client_id, plan, plan.version)
         
         return {
             'statusCode': 200,
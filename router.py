@@ -0,0 +1,95 @@
+import importlib
+import json
+import re
+
+# HTTP routes of serverless.yml, dispatched inside one function when the
+# API is deployed in router mode (`--param="lambdaMode=router"`). Every
+# endpoint shares the container's boto3 session and caches. POST /billing/run
+# is not here: it belongs to runBillingCycle in both modes, which has the
+# timeout and the self-invoke permission billing runs need.
+ROUTES = [
+    ('POST', '/usage', 'handler.ingest_usage'),
+    ('POST', '/usage/batch', 'handler.ingest_usage_batch'),
+    ('POST', '/customers', 'handler.create_customer'),
+    ('GET', '/customers/{customer_id}', 'handler.get_customer'),
+    ('PUT', '/customers/{customer_id}', 'handler.update_customer'),
+    ('GET', '/customers/{customer_id}/usage', 'handler.get_customer_usage'),
+    ('POST', '/subscriptions', 'pricing_handlers.create_subscription'),
+    ('GET', '/subscriptions/{client_id}', 'pricing_handlers.get_subscription'),
+    ('POST', '/pricing/calculate', 'pricing_handlers.calculate_pricing'),
+    ('POST', '/pricing/calculate/batch', 'pricing_handlers.calculate_pricing_batch'),
+    ('PUT', '/pricing/rules/{client_id}', 'pricing_handlers.update_pricing_rules'),
+    ('POST', '/billing/generate', 'billing_handlers.generate_invoice'),
+    ('GET', '/invoices/{customer_id}', 'billing_handlers.get_invoices'),
+    ('GET', '/analytics', 'billing_handlers.get_analytics')
+]
+
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+
+
+def compile_route(template):
+    """Regex for a path template; `{name}` matches one path segment"""
+    pattern = re.sub(r'\\\{(\w+)\\\}', r'(?P<\1>[^/]+)', re.escape(template))
+    return re.compile(f'^{pattern}$')
+
+
+def resolve_handler(target):
+    """Handler function for a `module.function` target, or None if it does not exist"""
+    module_name, _, function_name = target.rpartition('.')
+    return getattr(importlib.import_module(module_name), function_name, None)
+
+
+compiled_routes = [(method, template, compile_route(template), target) for method, template, target in ROUTES]
+
+# Imported during the init phase, so no request waits on a module import
+handlers = {target: resolve_handler(target) for _, _, target in ROUTES}
+
+
+def match_route(method, path):
+    """(target, template, path parameters) for a request, or None"""
+    path = '/' + path.strip('/')
+    for route_method, template, pattern, target in compiled_routes:
+        match = pattern.match(path)
+        if match and route_method == method:
+            return target, template, match.groupdict()
+    return None
+
+
+def allowed_methods(path):
+    """Methods routed for a path, to tell a 405 from a 404"""
+    path = '/' + path.strip('/')
+    return [route_method for route_method, _, pattern, _ in compiled_routes if pattern.match(path)]
+
+
+def error_response(status_code, message, headers=None):
+    return {
+        'statusCode': status_code,
+        'headers': {**CORS_HEADERS, **(headers or {})},
+        'body': json.dumps({'error': message})
+    }
+
+
+def route(event, context):
+    """Single entry point for every HTTP endpoint
+
+    API Gateway sends the whole API to this function through a `{proxy+}`
+    route. The event is rewritten to look like the one the endpoint's own
+    function would receive (resource template and path parameters) before
+    it is passed on, so handlers behave the same in both deploy modes.
+    """
+    method = (event.get('httpMethod') or '').upper()
+    path = event.get('path') or '/'
+    matched = match_route(method, path)
+    if matched is None:
+        allowed = allowed_methods(path)
+        if allowed:
+            return error_response(405, 'Method not allowed', {'Allow': ', '.join(allowed)})
+        return error_response(404, 'Route not found')
+
+    target, template, path_parameters = matched
+    handler = handlers[target]
+    if handler is None:
+        print(f"No handler for {method} {template}: {target} is not defined")
+        return error_response(501, 'Not implemented')
+
+    return handler(dict(event, resource=template, pathParameters=path_parameters or None), context)
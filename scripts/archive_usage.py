@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+import boto3
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.archive import (
+    DEFAULT_EXPIRE_AFTER_DAYS, ArchiveStore, archive_month, expire_archived_events, month_bounds
+)
+from utils.dynamo import DEFAULT_SCAN_SEGMENTS
+
+
+def previous_month(now=None):
+    """The most recent closed month as `YYYY-MM`"""
+    now = now or datetime.utcnow()
+    if now.month == 1:
+        return f'{now.year - 1}-12'
+    return f'{now.year}-{now.month - 1:02d}'
+
+
+def run_archive(stage, month, archive_url, endpoint_url=None, segments=DEFAULT_SCAN_SEGMENTS,
+                expire=False, expire_after_days=DEFAULT_EXPIRE_AFTER_DAYS, overwrite=False):
+    """Compact a closed month of UsageEvents into the Parquet archive"""
+    _, month_end = month_bounds(month)
+    if month_end >= datetime.utcnow():
+        raise ValueError(f"{month} is not closed yet")
+
+    dynamodb = boto3.resource('dynamodb')
+    usage_table_name = f'UsageEvents-{stage}'
+    usage_table = dynamodb.Table(usage_table_name)
+    rollups_table = dynamodb.Table(f'UsageRollups-{stage}')
+    store = ArchiveStore(archive_url, endpoint_url)
+
+    def progress(customer_id, entry):
+        print(f"  {customer_id}: {entry['rows']:,} events", file=sys.stderr)
+
+    manifest = archive_month(store, usage_table, rollups_table, month, segments, progress, overwrite)
+    print(f"Archived {manifest['rows']:,} usage events for {len(manifest['customers']):,} customers "
+          f"in {month} to {archive_url}")
+
+    if expire:
+        failed = expire_archived_events(dynamodb, usage_table_name, usage_table, manifest, expire_after_days)
+        print(f"Set {expire_after_days}-day TTL on archived events ({failed:,} failed)")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compact a closed month of usage events into Parquet')
+    parser.add_argument('--stage', default=os.environ.get('STAGE', 'dev'))
+    parser.add_argument('--month', default=previous_month(), help='YYYY-MM (default: last month)')
+    parser.add_argument('--archive', default=os.environ.get('USAGE_ARCHIVE_URL'),
+                        help='local directory or s3://bucket/prefix (default: $USAGE_ARCHIVE_URL)')
+    parser.add_argument('--endpoint-url', help='S3-compatible endpoint, e.g. http://localhost:9000')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SCAN_SEGMENTS)
+    parser.add_argument('--expire', action='store_true', help='set a TTL on the archived DynamoDB items')
+    parser.add_argument('--expire-after-days', type=int, default=DEFAULT_EXPIRE_AFTER_DAYS)
+    parser.add_argument('--overwrite', action='store_true', help='re-archive a month that already has a manifest')
+    args = parser.parse_args()
+
+    if not args.archive:
+        parser.error('--archive or USAGE_ARCHIVE_URL is required')
+
+    run_archive(
+        args.stage, args.month, args.archive, args.endpoint_url, args.segments,
+        args.expire, args.expire_after_days, args.overwrite
+    )
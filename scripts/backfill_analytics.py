@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+import boto3
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.analytics import VIEW_ID, apply_view_delta, empty_delta, empty_view, fold_change
+from utils.dynamo import DEFAULT_SCAN_SEGMENTS, parallel_scan
+
+
+def backfill_analytics(stage, segments=DEFAULT_SCAN_SEGMENTS):
+    """Rebuild the AnalyticsView document from full table scans
+
+    The view is overwritten with absolute totals, so run this while writes
+    are paused (or before enabling the analytics stream) to avoid losing
+    updates made by the stream consumer in the meantime.
+    """
+    dynamodb = boto3.resource('dynamodb')
+    view_table = dynamodb.Table(f'AnalyticsView-{stage}')
+    sources = {
+        'invoices': dynamodb.Table(f'Invoices-{stage}'),
+        'customers': dynamodb.Table(f'Customers-{stage}'),
+        'usage_events': dynamodb.Table(f'UsageEvents-{stage}')
+    }
+
+    delta = empty_delta()
+    scanned = {}
+    for source, table in sources.items():
+        scanned[source] = 0
+        for item in parallel_scan(table, segments):
+            fold_change(delta, source, None, item)
+            scanned[source] += 1
+
+    current = view_table.get_item(Key={'view_id': VIEW_ID}).get('Item')
+    view = apply_view_delta(empty_view(), delta)
+    view.update({'view_id': VIEW_ID, 'version': int(current['version']) + 1 if current else 1})
+    view_table.put_item(Item=view)
+
+    print(f"Rebuilt analytics view from {scanned['invoices']:,} invoices, "
+          f"{scanned['customers']:,} customers and {scanned['usage_events']:,} usage events")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rebuild the analytics view from the source tables')
+    parser.add_argument('--stage', default=os.environ.get('STAGE', 'dev'))
+    parser.add_argument('--segments', type=int, default=DEFAULT_SCAN_SEGMENTS)
+    args = parser.parse_args()
+    backfill_analytics(args.stage, args.segments)
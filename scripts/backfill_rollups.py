@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import boto3
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.dynamo import DEFAULT_SCAN_SEGMENTS, parallel_scan
+from utils.rollups import aggregate_rollups
+
+
+def backfill_rollups(stage, segments=DEFAULT_SCAN_SEGMENTS):
+    """Rebuild UsageRollups from raw UsageEvents
+
+    Rollup totals are overwritten with absolute values, so run this while
+    ingestion is paused (or before enabling rollups) to avoid losing the
+    ADDs made by concurrent writers. The platform-wide sketch items are not
+    rebuilt, and other attributes on the rebuilt items are left as they are.
+    """
+    dynamodb = boto3.resource('dynamodb')
+    usage_table = dynamodb.Table(f'UsageEvents-{stage}')
+    rollups_table = dynamodb.Table(f'UsageRollups-{stage}')
+
+    # Events stream out of a parallel scan and are folded as they arrive
+    totals = aggregate_rollups(parallel_scan(
+        usage_table,
+        segments,
+        ProjectionExpression='customer_id, #ts, event_type, quantity',
+        ExpressionAttributeNames={'#ts': 'timestamp'}
+    ))
+    # Every event lands in exactly one daily rollup
+    scanned = sum(total['event_count'] for (_, key), total in totals.items() if key.startswith('day#'))
+
+    # Totals are SET attribute by attribute, so nothing else stored on a
+    # rollup item is wiped out the way a whole-item put would
+    for (customer_id, key), total in totals.items():
+        granularity, bucket, event_type = key.split('#', 2)
+        rollups_table.update_item(
+            Key={'customer_id': customer_id, 'rollup_key': key},
+            UpdateExpression='SET #granularity = :granularity, #bucket = :bucket, #event_type = :event_type, '
+                             '#quantity = :quantity, #event_count = :event_count',
+            ExpressionAttributeNames={
+                '#granularity': 'granularity',
+                '#bucket': 'bucket',
+                '#event_type': 'event_type',
+                '#quantity': 'quantity',
+                '#event_count': 'event_count'
+            },
+            ExpressionAttributeValues={
+                ':granularity': granularity,
+                ':bucket': bucket,
+                ':event_type': event_type,
+                ':quantity': total['quantity'],
+                ':event_count': total['event_count']
+            }
+        )
+
+    print(f"Rebuilt {len(totals):,} rollup items from {scanned:,} usage events")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rebuild usage rollups from raw events')
+    parser.add_argument('--stage', default=os.environ.get('STAGE', 'dev'))
+    parser.add_argument('--segments', type=int, default=DEFAULT_SCAN_SEGMENTS)
+    args = parser.parse_args()
+    backfill_rollups(args.stage, args.segments)
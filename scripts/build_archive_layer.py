@@ -0,0 +1,71 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_DIR = os.path.join(ROOT, 'layers', 'archive')
+
+# Lambda's limit on a function plus all of its layers, unzipped
+LAMBDA_UNZIPPED_LIMIT = 250 * 1024 * 1024
+
+# Parts of the wheels no function imports at runtime
+PRUNE_DIRS = ('tests', 'include', '__pycache__')
+PRUNE_SUFFIXES = ('.pyx', '.pxd', '.pxi', '.h', '.cc')
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(folder, name))
+        for folder, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def prune(target):
+    """Drop test suites, headers and Cython sources from the installed packages"""
+    for folder, dirs, names in os.walk(target):
+        for name in [name for name in dirs if name in PRUNE_DIRS]:
+            shutil.rmtree(os.path.join(folder, name))
+            dirs.remove(name)
+        for name in names:
+            if name.endswith(PRUNE_SUFFIXES):
+                os.remove(os.path.join(folder, name))
+
+
+def build_layer(python_version='3.12', platform='manylinux2014_x86_64'):
+    """Install the archive layer's requirements into layers/archive/python
+
+    Lambda adds /opt/python (the layer's python/ directory) to sys.path.
+    Wheels are fetched for the Lambda runtime rather than this machine, so
+    the layer can be built from any OS.
+    """
+    target = os.path.join(LAYER_DIR, 'python')
+    shutil.rmtree(target, ignore_errors=True)
+    subprocess.run([
+        sys.executable, '-m', 'pip', 'install', '--quiet',
+        '--requirement', os.path.join(LAYER_DIR, 'requirements.txt'),
+        '--target', target,
+        '--platform', platform,
+        '--implementation', 'cp',
+        '--python-version', python_version,
+        '--only-binary=:all:',
+        '--upgrade',
+    ], check=True)
+    prune(target)
+    return directory_size(target)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the pyarrow layer for the functions that read the usage archive')
+    parser.add_argument('--python-version', default='3.12')
+    parser.add_argument('--platform', default='manylinux2014_x86_64',
+                        help='manylinux2014_aarch64 for arm64 functions')
+    args = parser.parse_args()
+
+    size = build_layer(args.python_version, args.platform)
+    print(f"Built {os.path.relpath(LAYER_DIR, ROOT)}: {size / 1024 / 1024:.0f} MB unzipped "
+          f"of Lambda's {LAMBDA_UNZIPPED_LIMIT // 1024 // 1024} MB")
+    if size > LAMBDA_UNZIPPED_LIMIT:
+        sys.exit("The layer exceeds Lambda's unzipped size limit")
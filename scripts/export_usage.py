@@ -0,0 +1,73 @@
+import argparse
+import os
+import sys
+import boto3
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.dynamo import DEFAULT_SCAN_SEGMENTS
+from utils.export import (
+    DEFAULT_CHUNK_ROWS, EXPORT_FORMATS, S3MultipartWriter,
+    export_usage, iter_usage_events, open_sink
+)
+from utils.timeseries import parse_utc
+
+
+def format_for(target):
+    """Export format implied by a target's file extension"""
+    extension = os.path.splitext(target)[1].lstrip('.').lower()
+    return {'json': 'ndjson', 'jsonl': 'ndjson', 'pq': 'parquet'}.get(extension, extension)
+
+
+def run_export(stage, start, end, target, export_format, customer_id=None,
+               segments=DEFAULT_SCAN_SEGMENTS, chunk_rows=DEFAULT_CHUNK_ROWS, endpoint_url=None):
+    """Export one customer's (or every customer's) usage events for a period"""
+    dynamodb = boto3.resource('dynamodb')
+    usage_table = dynamodb.Table(f'UsageEvents-{stage}')
+    s3 = boto3.client('s3', endpoint_url=endpoint_url) if target.startswith('s3://') else None
+
+    def progress(rows, seconds):
+        print(f"  {rows:,} rows  {rows / seconds if seconds else 0:,.0f} rows/s", file=sys.stderr)
+
+    sink = open_sink(target, s3)
+    try:
+        stats = export_usage(
+            iter_usage_events(usage_table, start, end, customer_id, segments),
+            export_format, sink, chunk_rows, progress
+        )
+    except BaseException:
+        if isinstance(sink, S3MultipartWriter):
+            sink.abort()
+        else:
+            sink.close()
+        raise
+    # The Parquet writer may already have closed a local file
+    size = os.path.getsize(target) if sink.closed and s3 is None else sink.tell()
+    sink.close()
+
+    print(f"Exported {stats['rows']:,} usage events to {target} ({size / 1024 / 1024:.1f} MiB) "
+          f"in {stats['seconds']:.1f}s, {stats['rows_per_second']:,.0f} rows/s")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stream usage events to NDJSON, CSV or Parquet')
+    parser.add_argument('--stage', default=os.environ.get('STAGE', 'dev'))
+    parser.add_argument('--customer', help='export one customer (default: every customer)')
+    parser.add_argument('--start', required=True, help='ISO 8601 start, inclusive')
+    parser.add_argument('--end', required=True, help='ISO 8601 end, inclusive')
+    parser.add_argument('--output', required=True, help='local path or s3://bucket/key')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help='default: from the output extension')
+    parser.add_argument('--endpoint-url', help='S3-compatible endpoint, e.g. http://localhost:9000')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SCAN_SEGMENTS)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    export_format = args.format or format_for(args.output)
+    if export_format not in EXPORT_FORMATS:
+        parser.error(f"cannot infer a format from {args.output}; pass --format")
+
+    run_export(
+        args.stage, parse_utc(args.start), parse_utc(args.end), args.output, export_format,
+        args.customer, args.segments, args.chunk_rows, args.endpoint_url
+    )
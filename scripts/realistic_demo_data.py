@@ -1,177 +1,336 @@
-import boto3
+import argparse
 import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from decimal import Decimal
-import random
+from multiprocessing import get_context
+import boto3
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.dynamo import BATCH_WRITE_LIMIT, batch_write_items
+from utils.rollups import aggregate_rollups, apply_rollups
+from utils.sort_keys import new_sort_key
+
+# Realistic SaaS client companies using Squill
+COMPANIES = [
+    {
+        'customer_id': 'taskflow-saas',
+        'name': 'TaskFlow SaaS',
+        'email': 'billing@taskflow.io',
+        'pricing_tier': 'pro',
+        'industry': 'Project Management',
+        'monthly_customers': 2500,
+        'created_days_ago': 180
+    },
+    {
+        'customer_id': 'cloudstore-platform',
+        'name': 'CloudStore Platform',
+        'email': 'finance@cloudstore.com',
+        'pricing_tier': 'enterprise',
+        'industry': 'E-commerce',
+        'monthly_customers': 15000,
+        'created_days_ago': 365
+    },
+    {
+        'customer_id': 'fintech-startup',
+        'name': 'PayEasy FinTech',
+        'email': 'accounts@payeasy.co',
+        'pricing_tier': 'basic',
+        'industry': 'Financial Services',
+        'monthly_customers': 800,
+        'created_days_ago': 90
+    },
+    {
+        'customer_id': 'healthtech-app',
+        'name': 'MediConnect Health',
+        'email': 'billing@mediconnect.health',
+        'pricing_tier': 'pro',
+        'industry': 'Healthcare',
+        'monthly_customers': 5000,
+        'created_days_ago': 240
+    }
+]
+
+# Realistic usage patterns by industry
+USAGE_PATTERNS = {
+    'Project Management': {
+        'api_calls_per_customer': 150,  # Task updates, notifications
+        'storage_per_customer': 0.05,   # Documents, files
+        'peak_hours': [9, 10, 14, 15, 16]  # Business hours
+    },
+    'E-commerce': {
+        'api_calls_per_customer': 300,  # Orders, inventory, payments
+        'storage_per_customer': 0.2,    # Product images, logs
+        'peak_hours': [12, 13, 19, 20, 21]  # Lunch & evening shopping
+    },
+    'Financial Services': {
+        'api_calls_per_customer': 80,   # Transactions, balance checks
+        'storage_per_customer': 0.01,   # Transaction logs
+        'peak_hours': [8, 9, 17, 18]    # Morning & evening banking
+    },
+    'Healthcare': {
+        'api_calls_per_customer': 200,  # Appointments, records
+        'storage_per_customer': 0.15,   # Medical records, images
+        'peak_hours': [8, 9, 10, 14, 15, 16]  # Clinic hours
+    }
+}
+
+# Per-process state of the DynamoDB writer workers, set by init_writer
+_writer = {}
+
+
+class RateLimiter:
+    """Paces work to a target number of events per second (None for no limit)"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self, count=1):
+        """Block until `count` more events may be sent"""
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        # An idle limiter does not bank credit for a later burst
+        self.next_at = max(self.next_at, now) + count * self.interval
+
+
+def company_day_events(company, day, days_back, base_date, seed, scale=1):
+    """One company's usage events for one day of the dataset, in time order
+
+    Every (company, day) draws from its own generator seeded from `seed`, so
+    the events are the same however the days are spread across workers.
+    `scale` multiplies the number of API call events while keeping the
+    day's total calls.
+    """
+    rng = random.Random(f"{seed}:{company['customer_id']}:{day}")
+    pattern = USAGE_PATTERNS[company['industry']]
+    customer_count = company['monthly_customers']
+    current_date = base_date + timedelta(days=day)
+
+    # Weekend reduction (20% less usage)
+    weekend_factor = 0.2 if current_date.weekday() >= 5 else 1.0
+
+    # Growth trend (companies grow over time)
+    growth_factor = 1 + (day / days_back) * 0.4
+
+    # Daily API calls based on customer count and pattern
+    base_api_calls = customer_count * pattern['api_calls_per_customer']
+    daily_api_calls = int(base_api_calls * growth_factor * weekend_factor * rng.uniform(0.8, 1.2))
+
+    # Storage usage (more stable)
+    daily_storage = customer_count * pattern['storage_per_customer'] * growth_factor * rng.uniform(0.95, 1.05)
+
+    # Distribute API calls throughout the day with peak hours
+    events_per_day = rng.randint(8, 24) * scale
+    hour_weights = [3 if h in pattern['peak_hours'] else 1 for h in range(24)]
+
+    events = []
+    for _ in range(events_per_day):
+        hour = rng.choices(range(24), weights=hour_weights)[0]
+        event_time = current_date.replace(hour=hour, minute=rng.randint(0, 59), second=rng.randint(0, 59))
+
+        # API call event with realistic metadata
+        api_calls_this_event = daily_api_calls // events_per_day + round(rng.randint(-50, 50) / scale)
+
+        events.append({
+            'customer_id': company['customer_id'],
+            'event_time': event_time,
+            'event_type': 'api_call',
+            'quantity': Decimal(str(max(1, api_calls_this_event))),
+            'metadata': {
+                'endpoint_category': rng.choice(['auth', 'data', 'analytics', 'notifications']),
+                'region': rng.choice(['us-east-1', 'eu-west-1', 'ap-southeast-1']),
+                'client_version': rng.choice(['v1.2.3', 'v1.2.4', 'v1.3.0'])
+            }
+        })
+    events.sort(key=lambda usage_event: usage_event['event_time'])
+
+    # Daily storage snapshot
+    events.append({
+        'customer_id': company['customer_id'],
+        'event_time': current_date.replace(hour=23, minute=59),
+        'event_type': 'storage_gb',
+        'quantity': Decimal(str(round(daily_storage, 3))),
+        'metadata': {
+            'measurement_type': 'daily_snapshot',
+            'data_types': ['user_data', 'system_logs', 'backups']
+        }
+    })
+    return events
+
+
+def usage_item(usage_event):
+    """UsageEvents item for a generated event, keyed as ingestion keys it"""
+    return {
+        'customer_id': usage_event['customer_id'],
+        'timestamp': new_sort_key(usage_event['event_time']),
+        'event_type': usage_event['event_type'],
+        'quantity': usage_event['quantity'],
+        'metadata': usage_event['metadata']
+    }
+
+
+def ingest_payload(usage_event):
+    """Body for POST /usage, plus the event's generated `timestamp` for pacing replays"""
+    quantity = usage_event['quantity']
+    return {
+        'customer_id': usage_event['customer_id'],
+        'event_type': usage_event['event_type'],
+        'quantity': int(quantity) if quantity == quantity.to_integral_value() else float(quantity),
+        'metadata': usage_event['metadata'],
+        'timestamp': usage_event['event_time'].isoformat()
+    }
+
+
+def ndjson_day(task):
+    """Worker: one company day as NDJSON lines"""
+    return [json.dumps(ingest_payload(usage_event)) for usage_event in company_day_events(*task)]
+
+
+def init_writer(stage, rate):
+    """Worker initializer: this process's own DynamoDB resource and share of the target rate"""
+    dynamodb = boto3.resource('dynamodb')
+    _writer.update(
+        dynamodb=dynamodb,
+        usage_table_name=f'UsageEvents-{stage}',
+        rollups_table=dynamodb.Table(f'UsageRollups-{stage}'),
+        limiter=RateLimiter(rate)
+    )
+
+
+def write_day(task):
+    """Worker: store one company day with BatchWriteItem and roll it up like ingestion
+
+    Returns (events written, events failed, rollup items that failed).
+    """
+    items = [usage_item(usage_event) for usage_event in company_day_events(*task)]
+    written = []
+    for start in range(0, len(items), BATCH_WRITE_LIMIT):
+        chunk = items[start:start + BATCH_WRITE_LIMIT]
+        _writer['limiter'].wait(len(chunk))
+        failed = batch_write_items(_writer['dynamodb'], _writer['usage_table_name'], chunk,
+                                   ('customer_id', 'timestamp'))
+        written.extend(item for index, item in enumerate(chunk) if index not in failed)
+    rollup_errors = apply_rollups(_writer['rollups_table'], aggregate_rollups(written))
+    return len(written), len(items) - len(written), rollup_errors
+
 
 class SquillDemoDataGenerator:
-    """Generate realistic demo data for Squill SaaS billing platform"""
-    
-    def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb')
-        self.customers_table = self.dynamodb.Table('Customers')
-        self.usage_table = self.dynamodb.Table('UsageEvents')
-    
-    def create_saas_client_companies(self):
+    """Generate realistic demo data for Squill SaaS billing platform
+
+    Runs are reproducible: every random draw comes from `seed`, and dates are
+    anchored to `end_date` (default: today, midnight UTC).
+    """
+
+    def __init__(self, stage='dev', seed=42, end_date=None, workers=None, rate=None, scale=1):
+        self.stage = stage
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.end_date = end_date or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.workers = workers or os.cpu_count() or 1
+        self.rate = rate
+        self.scale = scale
+
+    def create_saas_client_companies(self, write=True):
         """Create realistic SaaS client companies using Squill"""
-        companies = [
-            {
-                'customer_id': 'taskflow-saas',
-                'name': 'TaskFlow SaaS',
-                'email': 'billing@taskflow.io',
-                'pricing_tier': 'pro',
-                'industry': 'Project Management',
-                'monthly_customers': 2500,
-                'created_at': (datetime.utcnow() - timedelta(days=180)).isoformat()
-            },
-            {
-                'customer_id': 'cloudstore-platform',
-                'name': 'CloudStore Platform',
-                'email': 'finance@cloudstore.com',
-                'pricing_tier': 'enterprise',
-                'industry': 'E-commerce',
-                'monthly_customers': 15000,
-                'created_at': (datetime.utcnow() - timedelta(days=365)).isoformat()
-            },
-            {
-                'customer_id': 'fintech-startup',
-                'name': 'PayEasy FinTech',
-                'email': 'accounts@payeasy.co',
-                'pricing_tier': 'basic',
-                'industry': 'Financial Services',
-                'monthly_customers': 800,
-                'created_at': (datetime.utcnow() - timedelta(days=90)).isoformat()
-            },
-            {
-                'customer_id': 'healthtech-app',
-                'name': 'MediConnect Health',
-                'email': 'billing@mediconnect.health',
-                'pricing_tier': 'pro',
-                'industry': 'Healthcare',
-                'monthly_customers': 5000,
-                'created_at': (datetime.utcnow() - timedelta(days=240)).isoformat()
-            }
-        ]
-        
-        for company in companies:
-            self.customers_table.put_item(Item=company)
-            print(f"Created SaaS client: {company['name']} ({company['pricing_tier']} tier)")
-        
+        companies = []
+        for company in COMPANIES:
+            company = dict(company)
+            created_days_ago = company.pop('created_days_ago')
+            company['created_at'] = (self.end_date - timedelta(days=created_days_ago)).isoformat()
+            companies.append(company)
+
+        if write:
+            customers_table = boto3.resource('dynamodb').Table(f'Customers-{self.stage}')
+            for company in companies:
+                customers_table.put_item(Item=company)
+                print(f"Created SaaS client: {company['name']} ({company['pricing_tier']} tier)")
+
         return companies
-    
+
+    def day_tasks(self, companies, days_back):
+        """(company, day) work items, day by day so output follows the calendar"""
+        base_date = self.end_date - timedelta(days=days_back)
+        return [
+            (company, day, days_back, base_date, self.seed, self.scale)
+            for day in range(days_back)
+            for company in companies
+        ]
+
+    def pool(self, **kwargs):
+        # Spawned workers never share a parent's boto3 connections
+        return ProcessPoolExecutor(self.workers, mp_context=get_context('spawn'), **kwargs)
+
     def generate_realistic_usage_patterns(self, companies, days_back=90):
-        """Generate realistic usage patterns for SaaS companies"""
-        
-        # Define realistic usage patterns by industry
-        usage_patterns = {
-            'Project Management': {
-                'api_calls_per_customer': 150,  # Task updates, notifications
-                'storage_per_customer': 0.05,   # Documents, files
-                'peak_hours': [9, 10, 14, 15, 16]  # Business hours
-            },
-            'E-commerce': {
-                'api_calls_per_customer': 300,  # Orders, inventory, payments
-                'storage_per_customer': 0.2,    # Product images, logs
-                'peak_hours': [12, 13, 19, 20, 21]  # Lunch & evening shopping
-            },
-            'Financial Services': {
-                'api_calls_per_customer': 80,   # Transactions, balance checks
-                'storage_per_customer': 0.01,   # Transaction logs
-                'peak_hours': [8, 9, 17, 18]    # Morning & evening banking
-            },
-            'Healthcare': {
-                'api_calls_per_customer': 200,  # Appointments, records
-                'storage_per_customer': 0.15,   # Medical records, images
-                'peak_hours': [8, 9, 10, 14, 15, 16]  # Clinic hours
-            }
-        }
-        
-        base_date = datetime.utcnow() - timedelta(days=days_back)
-        
-        for company in companies:
-            pattern = usage_patterns[company['industry']]
-            customer_count = company['monthly_customers']
-            
-            print(f"Generating usage for {company['name']} ({customer_count:,} customers)")
-            
-            for day in range(days_back):
-                current_date = base_date + timedelta(days=day)
-                
-                # Weekend reduction (20% less usage)
-                weekend_factor = 0.2 if current_date.weekday() >= 5 else 1.0
-                
-                # Growth trend (companies grow over time)
-                growth_factor = 1 + (day / days_back) * 0.4
-                
-                # Daily API calls based on customer count and pattern
-                base_api_calls = customer_count * pattern['api_calls_per_customer']
-                daily_api_calls = int(base_api_calls * growth_factor * weekend_factor * random.uniform(0.8, 1.2))
-                
-                # Storage usage (more stable)
-                daily_storage = customer_count * pattern['storage_per_customer'] * growth_factor * random.uniform(0.95, 1.05)
-                
-                # Distribute API calls throughout the day with peak hours
-                events_per_day = random.randint(8, 24)
-                
-                for event in range(events_per_day):
-                    # Peak hour weighting
-                    hour = random.choices(
-                        range(24),
-                        weights=[3 if h in pattern['peak_hours'] else 1 for h in range(24)]
-                    )[0]
-                    
-                    event_time = current_date.replace(
-                        hour=hour,
-                        minute=random.randint(0, 59),
-                        second=random.randint(0, 59)
-                    )
-                    
-                    # API call event with realistic metadata
-                    api_calls_this_event = daily_api_calls // events_per_day + random.randint(-50, 50)
-                    
-                    self.usage_table.put_item(Item={
-                        'customer_id': company['customer_id'],
-                        'timestamp': event_time.isoformat(),
-                        'event_type': 'api_call',
-                        'quantity': Decimal(str(max(1, api_calls_this_event))),
-                        'metadata': {
-                            'endpoint_category': random.choice(['auth', 'data', 'analytics', 'notifications']),
-                            'region': random.choice(['us-east-1', 'eu-west-1', 'ap-southeast-1']),
-                            'client_version': random.choice(['v1.2.3', 'v1.2.4', 'v1.3.0'])
-                        }
-                    })
-                
-                # Daily storage snapshot
-                self.usage_table.put_item(Item={
-                    'customer_id': company['customer_id'],
-                    'timestamp': current_date.replace(hour=23, minute=59).isoformat(),
-                    'event_type': 'storage_gb',
-                    'quantity': Decimal(str(round(daily_storage, 3))),
-                    'metadata': {
-                        'measurement_type': 'daily_snapshot',
-                        'data_types': ['user_data', 'system_logs', 'backups']
-                    }
-                })
-        
-        print(f"Generated {days_back} days of realistic SaaS usage data")
-    
+        """Write realistic usage patterns for SaaS companies with batch writes across a process pool"""
+        tasks = self.day_tasks(companies, days_back)
+        rate = self.rate / self.workers if self.rate else None
+        totals = [0, 0, 0]
+        started = time.perf_counter()
+
+        with self.pool(initializer=init_writer, initargs=(self.stage, rate)) as executor:
+            for index, counts in enumerate(executor.map(write_day, tasks, chunksize=len(companies)), 1):
+                totals = [total + count for total, count in zip(totals, counts)]
+                if index % (len(companies) * 10) == 0:
+                    elapsed = time.perf_counter() - started
+                    print(f"  {index // len(companies)}/{days_back} days  {totals[0]:,} events  "
+                          f"{totals[0] / elapsed:,.0f} events/s")
+
+        written, failed, rollup_errors = totals
+        elapsed = time.perf_counter() - started
+        print(f"Generated {days_back} days of realistic SaaS usage data: {written:,} events in {elapsed:.1f}s "
+              f"({written / elapsed if elapsed else 0:,.0f} events/s), {failed:,} failed, "
+              f"{rollup_errors:,} rollup errors")
+        return totals
+
+    def emit_ndjson(self, sink, days_back=90):
+        """Write every event as an ingest payload per line instead of storing it
+
+        Lines are in calendar order and paced to the target rate, ready to be
+        replayed against POST /usage or, in groups, POST /usage/batch.
+        """
+        companies = self.create_saas_client_companies(write=False)
+        limiter = RateLimiter(self.rate)
+        emitted = 0
+        started = time.perf_counter()
+
+        with self.pool() as executor:
+            for lines in executor.map(ndjson_day, self.day_tasks(companies, days_back), chunksize=len(companies)):
+                for line in lines:
+                    limiter.wait()
+                    sink.write(line + '\n')
+                emitted += len(lines)
+
+        elapsed = time.perf_counter() - started
+        print(f"Emitted {emitted:,} usage events in {elapsed:.1f}s "
+              f"({emitted / elapsed if elapsed else 0:,.0f} events/s)", file=sys.stderr)
+        return emitted
+
     def create_sample_invoices(self, companies):
         """Create sample invoice data for demonstration"""
         invoices = []
-        
+
         for company in companies:
             # Generate last 3 months of invoices
             for month_offset in range(3):
-                invoice_date = datetime.utcnow() - timedelta(days=30 * month_offset)
-                
+                invoice_date = self.end_date - timedelta(days=30 * month_offset)
+
                 # Calculate realistic billing amounts based on tier
                 tier_multipliers = {'basic': 1, 'pro': 3.5, 'enterprise': 12}
                 base_amount = 99 * tier_multipliers[company['pricing_tier']]
-                
+
                 # Add usage overages
-                overage_amount = random.uniform(50, 500) if month_offset == 0 else random.uniform(20, 200)
+                overage_amount = self.rng.uniform(50, 500) if month_offset == 0 else self.rng.uniform(20, 200)
                 total_amount = base_amount + overage_amount
-                
+
                 invoice = {
                     'invoice_id': f"INV-{company['customer_id']}-{invoice_date.strftime('%Y%m')}",
                     'customer_id': company['customer_id'],
@@ -181,36 +340,53 @@ class SquillDemoDataGenerator:
                     'generated_at': invoice_date.isoformat()
                 }
                 invoices.append(invoice)
-        
+
         return invoices
-    
-    def run_full_demo_setup(self):
+
+    def run_full_demo_setup(self, days_back=90):
         """Run complete realistic demo data setup"""
         print("Setting up Squill SaaS Demo Environment...")
         print("=" * 50)
-        
+
         # Create SaaS client companies
         companies = self.create_saas_client_companies()
-        
+
         # Generate realistic usage patterns
-        self.generate_realistic_usage_patterns(companies, days_back=90)
-        
+        self.generate_realistic_usage_patterns(companies, days_back=days_back)
+
         # Create sample invoices
         invoices = self.create_sample_invoices(companies)
-        
+
         print("\n📋 Demo Environment Summary:")
         print(f"• {len(companies)} SaaS client companies created")
-        print(f"• 90 days of realistic usage data generated")
+        print(f"• {days_back} days of realistic usage data generated")
         print(f"• {len(invoices)} sample invoices created")
         print("\n🎯 Companies by tier:")
-        
+
         for tier in ['basic', 'pro', 'enterprise']:
             tier_companies = [c for c in companies if c['pricing_tier'] == tier]
             print(f"  • {tier.title()}: {len(tier_companies)} companies")
-        
+
         print("\n✅ Squill demo environment ready!")
         return companies, invoices
 
 if __name__ == "__main__":
-    generator = SquillDemoDataGenerator()
-    generator.run_full_demo_setup()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Seeded demo data and usage load generator')
+    parser.add_argument('--stage', default=os.environ.get('STAGE', 'dev'))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--end-date', type=datetime.fromisoformat, help='YYYY-MM-DD the data ends at (default: today)')
+    parser.add_argument('--scale', type=int, default=1, help='multiply API call events per day, same daily totals')
+    parser.add_argument('--rate', type=float, help='target events per second (default: as fast as possible)')
+    parser.add_argument('--workers', type=int, help='generator processes (default: CPU count)')
+    parser.add_argument('--output', help='write NDJSON ingest payloads here ("-" for stdout) instead of DynamoDB')
+    args = parser.parse_args()
+
+    generator = SquillDemoDataGenerator(args.stage, args.seed, args.end_date, args.workers, args.rate, args.scale)
+    if args.output == '-':
+        generator.emit_ndjson(sys.stdout, args.days)
+    elif args.output:
+        with open(args.output, 'w') as f:
+            generator.emit_ndjson(f, args.days)
+    else:
+        generator.run_full_demo_setup(args.days)
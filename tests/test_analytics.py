@@ -0,0 +1,141 @@
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+from utils.analytics import (
+    RECENT_ACTIVITY_LIMIT,
+    RECENT_INVOICE_LIMIT,
+    apply_view_delta,
+    empty_delta,
+    empty_view,
+    fold_change,
+    fold_stream_records,
+    update_analytics_view
+)
+
+serializer = TypeSerializer()
+TODAY = datetime(2024, 1, 20)
+
+
+def _record(table, old=None, new=None):
+    images = {}
+    if old:
+        images['OldImage'] = {k: serializer.serialize(v) for k, v in old.items()}
+    if new:
+        images['NewImage'] = {k: serializer.serialize(v) for k, v in new.items()}
+    return {
+        'eventName': 'MODIFY' if old and new else ('INSERT' if new else 'REMOVE'),
+        'eventSourceARN': f'arn:aws:dynamodb:us-east-1:123456789012:table/{table}-dev/stream/2024-01-01T00:00:00.000',
+        'dynamodb': images
+    }
+
+
+def _invoice(invoice_id, units, created_at='2024-01-15T00:00:00'):
+    return {'invoice_id': invoice_id, 'customer_id': 'c1', 'total_amount': Decimal(units),
+            'money_scale': Decimal('1000000'), 'created_at': created_at}
+
+
+class TestAnalyticsView:
+    
+    def test_fold_stream_records(self):
+        """Test inserts, regenerated invoices and removals fold into one delta"""
+        records = [
+            _record('Invoices', new=_invoice('INV-1', 1000000)),
+            _record('Invoices', old=_invoice('INV-1', 1000000), new=_invoice('INV-1', 1500000)),
+            _record('Invoices', old=_invoice('INV-0', 250000, '2023-12-31T00:00:00')),
+            _record('Customers', new={'customer_id': 'c2', 'name': 'New Co', 'created_at': '2024-01-15'}),
+            _record('UsageEvents', new={'customer_id': 'c1', 'timestamp': '2024-01-15T10:00:00.000000#a1',
+                                        'event_type': 'api_call', 'quantity': Decimal('2.5')}),
+            _record('UsageRollups', new={'customer_id': 'c1', 'rollup_key': 'x'})
+        ]
+        
+        delta = fold_stream_records(records)
+        
+        assert delta['total_revenue'] == 1500000 - 250000
+        assert delta['total_invoices'] == 0
+        assert delta['monthly_revenue'] == {'2024-01': 1500000, '2023-12': -250000}
+        assert delta['total_customers'] == 1
+        assert delta['usage_by_day'] == {'2024-01-15': {'api_call': 2500}}
+        assert delta['removed_invoices'] == {'INV-0'}
+        assert delta['recent_activities'][0]['description'] == 'api_call - 2.5 units'
+    
+    def test_fold_keeps_recent_lists_bounded(self):
+        """Test a full-table fold holds O(limit) recent entries, not one per item"""
+        delta = empty_delta()
+        for index in range(1000):
+            fold_change(delta, 'usage_events', None, {
+                'customer_id': 'c1', 'timestamp': f'2024-01-{index % 19 + 1:02d}T10:00:00.{index:06d}#a',
+                'event_type': 'api_call', 'quantity': Decimal('1')
+            })
+            fold_change(delta, 'invoices', None, _invoice(f'INV-{index % 300}', 1000, f'2024-01-15T{index % 300:06d}'))
+        
+        assert len(delta['recent_activities']) < 2 * RECENT_ACTIVITY_LIMIT
+        assert len(delta['recent_invoices']) < 2 * RECENT_INVOICE_LIMIT
+        assert delta['total_invoices'] == 1000
+        
+        updated = apply_view_delta(empty_view(), delta, TODAY)
+        assert [a['timestamp'][:26] for a in updated['recent_activities']] == [
+            f'2024-01-19T10:00:00.{index:06d}' for index in range(987, 987 - 19 * 10, -19)
+        ]
+        assert [i['invoice_id'] for i in updated['recent_invoices']] == [f'INV-{n}' for n in range(299, 289, -1)]
+    
+    def test_apply_delta_prunes_and_bounds_view(self):
+        """Test totals add up, old usage days drop out and ring buffers stay bounded"""
+        view = empty_view()
+        view.update({
+            'total_revenue': Decimal('500'),
+            'usage_by_day': {'2023-11-01': {'api_call': Decimal('1000')}, '2024-01-19': {'api_call': Decimal('1000')}},
+            'recent_invoices': [{'invoice_id': 'INV-1', 'created_at': '2024-01-01'}]
+        })
+        delta = fold_stream_records(
+            [_record('Invoices', old=_invoice('INV-1', 100, '2024-01-01'), new=_invoice('INV-1', 300, '2024-01-01'))] +
+            [_record('UsageEvents', new={'customer_id': 'c1', 'timestamp': f'2024-01-19T10:00:{i:02d}',
+                                         'event_type': 'api_call', 'quantity': Decimal('1')}) for i in range(15)]
+        )
+        
+        updated = apply_view_delta(view, delta, TODAY)
+        
+        assert updated['total_revenue'] == 700
+        assert updated['usage_by_day'] == {'2024-01-19': {'api_call': 16000}}
+        assert len(updated['recent_activities']) == 10
+        assert updated['recent_activities'][0]['timestamp'] == '2024-01-19T10:00:14'
+        assert [i['invoice_id'] for i in updated['recent_invoices']] == ['INV-1']
+        assert updated['recent_invoices'][0]['total_amount'] == 300
+    
+    def test_update_retries_on_version_conflict(self):
+        """Test a lost version race re-reads the view and re-applies the delta"""
+        table = MagicMock()
+        table.get_item.side_effect = [
+            {'Item': dict(empty_view(), view_id='global', version=Decimal('4'), total_customers=Decimal('10'))},
+            {'Item': dict(empty_view(), view_id='global', version=Decimal('5'), total_customers=Decimal('11'))}
+        ]
+        conflict = ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': ''}}, 'PutItem')
+        table.put_item.side_effect = [conflict, None]
+        delta = fold_stream_records([_record('Customers', new={'customer_id': 'c3'})])
+        
+        updated = update_analytics_view(table, delta, TODAY)
+        
+        assert updated['version'] == 6
+        assert updated['total_customers'] == 12
+        assert table.put_item.call_args.kwargs['ExpressionAttributeValues'] == {':version': 5}
+    
+    def test_first_update_creates_view(self):
+        """Test the first update only succeeds if no view exists yet"""
+        table = MagicMock()
+        table.get_item.return_value = {}
+        
+        updated = update_analytics_view(table, fold_stream_records([]), TODAY)
+        
+        assert updated['version'] == 1
+        assert table.put_item.call_args.kwargs['ConditionExpression'] == 'attribute_not_exists(view_id)'
+    
+    def test_other_errors_propagate(self):
+        """Test non-conflict errors fail the batch so the stream retries it"""
+        table = MagicMock()
+        table.get_item.return_value = {}
+        table.put_item.side_effect = ClientError({'Error': {'Code': 'ValidationException', 'Message': ''}}, 'PutItem')
+        
+        with pytest.raises(ClientError):
+            update_analytics_view(table, fold_stream_records([]), TODAY)
@@ -0,0 +1,121 @@
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+from utils.archive import (
+    ArchiveStore,
+    archive_customer_month,
+    archive_month,
+    archived_usage_summary,
+    expire_archived_events,
+    manifest_cache,
+    manifest_path,
+    month_bounds,
+    months_between,
+    partition_path
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_manifest_cache():
+    """Start every test without cached manifests"""
+    manifest_cache.clear()
+
+
+class TestArchive:
+
+    def test_month_helpers(self):
+        """Test month bounds and the months a range touches"""
+        assert month_bounds('2023-12') == (datetime(2023, 12, 1), datetime(2023, 12, 31, 23, 59, 59, 999999))
+        assert months_between(datetime(2023, 11, 20), datetime(2024, 1, 5)) == ['2023-11', '2023-12', '2024-01']
+
+    def test_partition_path_quotes_customer(self):
+        """Test customer ids cannot escape their partition directory"""
+        assert partition_path('2024-01', 'acme/../x') == 'usage/month=2024-01/customer_id=acme%2F..%2Fx/events.parquet'
+
+    def test_unarchived_month_is_not_served(self, tmp_path):
+        """Test ranges touching a month without a manifest fall back to DynamoDB"""
+        store = ArchiveStore(str(tmp_path))
+        store.write_json(manifest_path('2023-12'), {'month': '2023-12', 'customers': {}})
+
+        assert archived_usage_summary(store, 'c1', datetime(2023, 12, 1), datetime(2024, 1, 31)) is None
+        # Customers without usage in an archived month read nothing
+        assert archived_usage_summary(store, 'c1', *month_bounds('2023-12')) == ({}, 0)
+
+    def test_s3_store_reads_manifest(self):
+        """Test manifests are read from the bucket prefix"""
+        s3 = MagicMock()
+        s3.get_object.return_value = {'Body': MagicMock(read=lambda: b'{"month": "2024-01"}')}
+        store = ArchiveStore('s3://archive/usage-dev', s3=s3)
+
+        assert store.read_json(manifest_path('2024-01')) == {'month': '2024-01'}
+        assert s3.get_object.call_args.kwargs == {
+            'Bucket': 'archive', 'Key': 'usage-dev/usage/month=2024-01/_manifest.json'
+        }
+
+    def test_archived_month_is_not_overwritten(self, tmp_path):
+        """Test re-archiving needs an explicit overwrite once raw events may be gone"""
+        store = ArchiveStore(str(tmp_path))
+        store.write_json(manifest_path('2024-01'), {'month': '2024-01', 'customers': {}})
+
+        with pytest.raises(ValueError):
+            archive_month(store, MagicMock(), MagicMock(), '2024-01')
+
+    def test_expire_sets_ttl_on_archived_events_only(self):
+        """Test the TTL is written only for events up to the archived sort key"""
+        usage_table = MagicMock()
+        usage_table.query.return_value = {'Items': [
+            {'customer_id': 'c1', 'timestamp': '2024-01-10T00:00:00.000000#a', 'quantity': Decimal('1')},
+            {'customer_id': 'c1', 'timestamp': '2024-01-31T00:00:00.000000#b', 'quantity': Decimal('2')}
+        ]}
+        dynamodb = MagicMock()
+        dynamodb.batch_write_item.return_value = {}
+        manifest = {'month': '2024-01', 'customers': {
+            'c1': {'rows': 1, 'usage': {'api_call': 1000}, 'last_sort_key': '2024-01-10T00:00:00.000000#a'},
+            'c2': {'rows': 0, 'usage': {}, 'last_sort_key': None}
+        }}
+
+        failed = expire_archived_events(dynamodb, 'UsageEvents-dev', usage_table, manifest, expire_after_days=7)
+
+        assert failed == 0
+        usage_table.query.assert_called_once()
+        requests = dynamodb.batch_write_item.call_args.kwargs['RequestItems']['UsageEvents-dev']
+        assert len(requests) == 1
+        assert requests[0]['PutRequest']['Item']['expires_at'] > datetime.utcnow().timestamp()
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
+
+
+class TestParquetRoundTrip:
+
+    def test_archived_events_are_summarized_by_range(self, tmp_path):
+        """Test events written to Parquet read back through archived_usage_summary, pruned to the range"""
+        pq = pytest.importorskip('pyarrow.parquet')
+        usage_table = MagicMock()
+        usage_table.query.return_value = {'Items': [
+            {'customer_id': 'c1', 'timestamp': f'2024-01-{day:02d}T12:00:00.000000#n{day}',
+             'event_type': 'api_call' if day % 2 else 'storage_gb', 'quantity': Decimal('1.5'), 'metadata': {}}
+            for day in range(1, 11)
+        ]}
+        store = ArchiveStore(str(tmp_path))
+
+        entry = archive_customer_month(store, usage_table, '2024-01', 'c1', chunk_rows=2)
+        store.write_json(manifest_path('2024-01'), {'month': '2024-01', 'customers': {'c1': entry}})
+
+        assert entry['rows'] == 10
+        assert entry['usage'] == {'api_call': 7500, 'storage_gb': 7500}
+        metadata = pq.ParquetFile(str(tmp_path / partition_path('2024-01', 'c1'))).metadata
+        assert metadata.num_row_groups == 5
+        # Time-ordered row groups carry narrow event_time statistics to prune on
+        event_time = metadata.schema.names.index('event_time')
+        assert metadata.row_group(1).column(event_time).statistics.min.startswith('2024-01-03')
+        assert metadata.row_group(1).column(event_time).statistics.max.startswith('2024-01-04')
+
+        assert archived_usage_summary(store, 'c1', *month_bounds('2024-01')) == (
+            {'api_call': 7500, 'storage_gb': 7500}, 10
+        )
+        # Days 3 to 6 only: two row groups, split across event types
+        assert archived_usage_summary(store, 'c1', datetime(2024, 1, 3), datetime(2024, 1, 6, 23, 59)) == (
+            {'api_call': 3000, 'storage_gb': 3000}, 4
+        )
@@ -0,0 +1,376 @@
+import pytest
+import json
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+from boto3.dynamodb.conditions import ConditionExpressionBuilder
+from billing_handlers import (
+    MAX_BILLING_RUN_CONTINUATIONS, generate_invoice, aggregate_usage_events, run_billing_cycle, billing_period_dates,
+    get_analytics, get_invoices, continue_billing_run
+)
+from utils.analytics import empty_view
+from utils.dynamo import encode_page_token
+from utils.sort_keys import new_sort_key
+from utils.sketches import HyperLogLog, TDigest
+
+class TestBillingHandlers:
+    
+    @patch('billing_handlers.usage_table')
+    def test_aggregate_usage_events_follows_pages(self, mock_table):
+        """Test raw usage aggregation pages through every result"""
+        mock_table.query.side_effect = [
+            {'Items': [{'event_type': 'api_call', 'quantity': Decimal('100')},
+                       {'event_type': 'api_call', 'quantity': Decimal('25')}],
+             'LastEvaluatedKey': {'customer_id': 'customer-123', 'timestamp': '2024-01-10T00:00:00'}},
+            {'Items': [{'event_type': 'storage_gb', 'quantity': Decimal('2.5')}]}
+        ]
+        
+        usage_summary, total_events = aggregate_usage_events(
+            'customer-123', datetime(2024, 1, 1), datetime(2024, 1, 31)
+        )
+        
+        assert usage_summary == {'api_call': 125000, 'storage_gb': 2500}  # quantity units
+        assert total_events == 3
+        first_call, second_call = mock_table.query.call_args_list
+        assert first_call.kwargs['ProjectionExpression'] == 'event_type, quantity'
+        assert 'ExclusiveStartKey' not in first_call.kwargs
+        assert second_call.kwargs['ExclusiveStartKey']['timestamp'] == '2024-01-10T00:00:00'
+    
+    @patch('billing_handlers.usage_table')
+    def test_aggregate_usage_events_includes_last_microsecond(self, mock_table):
+        """Test the period's upper bound covers keys written in its last microsecond"""
+        mock_table.query.return_value = {'Items': []}
+        start_date, end_date = billing_period_dates('2024-01')
+        
+        aggregate_usage_events('customer-123', start_date, end_date)
+        
+        condition = mock_table.query.call_args.kwargs['KeyConditionExpression']
+        values = ConditionExpressionBuilder().build_expression(condition, is_key_condition=True).attribute_value_placeholders
+        lower, upper = sorted(value for value in values.values() if value != 'customer-123')
+        assert lower <= new_sort_key(end_date) <= upper
+        assert new_sort_key(datetime(2024, 2, 1)) > upper
+    
+    @patch('billing_handlers.archived_usage_summary')
+    @patch('billing_handlers.usage_archive')
+    @patch('billing_handlers.usage_table')
+    def test_aggregate_usage_events_reads_archive(self, mock_table, mock_archive, mock_archived):
+        """Test archived months are summed from the archive instead of DynamoDB"""
+        mock_archived.return_value = ({'api_call': 5000}, 2)
+        
+        assert aggregate_usage_events('c1', *billing_period_dates('2023-11')) == ({'api_call': 5000}, 2)
+        mock_table.query.assert_not_called()
+        
+        mock_archived.return_value = None
+        mock_table.query.return_value = {'Items': []}
+        
+        assert aggregate_usage_events('c1', *billing_period_dates('2023-11')) == ({}, 0)
+        mock_table.query.assert_called_once()
+    
+    @patch('billing_handlers.invoices_table')
+    @patch('billing_handlers.rollups_table')
+    @patch('billing_handlers.customers_table')
+    def test_generate_invoice_from_rollups(self, mock_customers, mock_rollups, mock_invoices):
+        """Test invoices are priced from daily rollups"""
+        mock_customers.get_item.return_value = {
+            'Item': {'customer_id': 'customer-123', 'name': 'Test Company', 'email': 'test@company.com'}
+        }
+        mock_rollups.query.return_value = {'Items': [
+            {'event_type': 'api_call', 'quantity': Decimal('150'), 'event_count': 3},
+            {'event_type': 'api_call', 'quantity': Decimal('75'), 'event_count': 2}
+        ]}
+        
+        response = generate_invoice({'body': json.dumps({'customer_id': 'customer-123'})}, {})
+        
+        assert response['statusCode'] == 201
+        body = json.loads(response['body'])
+        assert body['total_events'] == 5
+        assert body['total_amount'] == 1.25  # 225 calls, 100 free, 125 * $0.01
+        assert body['usage_summary'] == {'api_call': 225}
+        assert 'money_scale' not in body
+        
+        # Stored amounts stay in integer units so DynamoDB never sees a float
+        stored = mock_invoices.put_item.call_args.kwargs['Item']
+        assert stored['total_amount'] == 1250000
+        assert stored['money_scale'] == 1000000
+        assert stored['usage_summary'] == {'api_call': 225000}
+    
+    @patch('billing_handlers.rollups_table')
+    @patch('billing_handlers.invoices_table')
+    @patch('billing_handlers.analytics_view_table')
+    def test_analytics_reads_one_view_item(self, mock_view, mock_invoices, mock_rollups):
+        """Test analytics is served from a single get_item on the precomputed view"""
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        customers, quantities = HyperLogLog(), TDigest()
+        for i in range(100):
+            customers.add(f'customer-{i % 5}')
+            quantities.add(i + 1)
+        mock_rollups.query.return_value = {'Items': [{
+            'event_type': 'api_call', 'quantity': Decimal('5050'), 'event_count': 100,
+            'distinct_customers': customers.to_bytes(), 'quantity_digest': quantities.to_bytes(),
+            'top_customers': {'customer-3': [Decimal('1020000'), Decimal('0')]}
+        }]}
+        mock_view.get_item.return_value = {'Item': {
+            'view_id': 'global', 'version': Decimal('7'),
+            'total_revenue': Decimal('1000000'), 'total_invoices': Decimal('3'), 'total_customers': Decimal('2'),
+            'monthly_revenue': {'2024-01': Decimal('300000'), '2023-12': Decimal('700000')},
+            'usage_by_day': {today: {'api_call': Decimal('1500')}, '2000-01-01': {'api_call': Decimal('9000')}},
+            'recent_activities': [], 'recent_customers': [],
+            'recent_invoices': [{'invoice_id': 'a', 'total_amount': Decimal('100000'),
+                                 'money_scale': Decimal('1000000'), 'created_at': '2024-01-31T00:00:00'}]
+        }}
+        
+        response = get_analytics({}, {})
+        
+        body = json.loads(response['body'])
+        assert body['metrics']['total_revenue'] == 1.0
+        assert body['metrics']['total_invoices'] == 3
+        assert body['monthly_revenue'] == {'2023-12': 0.7, '2024-01': 0.3}
+        assert body['usage_by_type'] == {'api_call': 1.5}  # days outside the window are ignored
+        assert body['invoices'][0]['total_amount'] == 0.1
+        assert body['version'] == 7
+        assert body['usage_sketches']['distinct_customers'] == 5
+        assert body['usage_sketches']['event_types']['api_call']['quantity_p50'] == pytest.approx(50.5, abs=1)
+        assert body['usage_sketches']['event_types']['api_call']['top_customers'] == [
+            {'customer_id': 'customer-3', 'quantity': 1020, 'max_error': 0}
+        ]
+        mock_view.get_item.assert_called_once_with(Key={'view_id': 'global'})
+        mock_invoices.scan.assert_not_called()
+    
+    @patch('billing_handlers.rollups_table')
+    @patch('billing_handlers.analytics_view_table')
+    def test_analytics_before_view_exists(self, mock_view, mock_rollups):
+        """Test an empty dashboard is returned until the view is first written"""
+        mock_view.get_item.return_value = {}
+        mock_rollups.query.return_value = {'Items': []}
+        
+        body = json.loads(get_analytics({}, {})['body'])
+        
+        assert body['metrics']['total_revenue'] == 0.0
+        assert body['invoices'] == []
+        assert body['usage_sketches'] == {'distinct_customers': 0, 'event_types': {}}
+    
+    @patch('billing_handlers.rollups_table')
+    @patch('billing_handlers.analytics_view_table')
+    def test_analytics_not_modified_skips_rebuild(self, mock_view, mock_rollups):
+        """Test an unchanged view version answers If-None-Match with 304 before any other read"""
+        mock_view.get_item.return_value = {'Item': dict(empty_view(), view_id='global', version=Decimal('7'))}
+        mock_rollups.query.return_value = {'Items': []}
+        
+        first = get_analytics({}, {})
+        etag = first['headers']['ETag']
+        mock_rollups.query.reset_mock()
+        
+        response = get_analytics({'headers': {'If-None-Match': etag}}, {})
+        
+        assert response['statusCode'] == 304
+        assert response['body'] == ''
+        assert response['headers']['Access-Control-Expose-Headers'] == 'ETag'
+        mock_rollups.query.assert_not_called()
+        
+        mock_view.get_item.return_value['Item']['version'] = Decimal('8')
+        assert get_analytics({'headers': {'If-None-Match': etag}}, {})['statusCode'] == 200
+    
+    @patch('billing_handlers.invoices_table')
+    def test_get_invoices_not_modified(self, mock_invoices):
+        """Test an unchanged invoice page is revalidated by content hash"""
+        mock_invoices.query.return_value = {'Items': [{'invoice_id': 'INV-1', 'status': 'pending'}]}
+        event = {'pathParameters': {'customer_id': 'c1'}}
+        
+        etag = get_invoices(event, {})['headers']['ETag']
+        
+        assert get_invoices(dict(event, headers={'If-None-Match': f'W/{etag}'}), {})['statusCode'] == 304
+        mock_invoices.query.return_value = {'Items': [{'invoice_id': 'INV-1', 'status': 'paid'}]}
+        assert get_invoices(dict(event, headers={'If-None-Match': etag}), {})['statusCode'] == 200
+    
+    @patch('billing_handlers.invoices_table')
+    def test_get_invoices_pages_with_gsi(self, mock_invoices):
+        """Test invoices are queried newest first from the GSI, one page at a time"""
+        last_key = {'invoice_id': 'INV-1', 'customer_id': 'c1', 'created_at': '2024-01-31T00:00:00'}
+        mock_invoices.query.return_value = {'Items': [{'invoice_id': 'INV-1'}], 'LastEvaluatedKey': last_key}
+        
+        response = get_invoices({
+            'pathParameters': {'customer_id': 'c1'},
+            'queryStringParameters': {'limit': '1'}
+        }, {})
+        
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        assert body['count'] == 1
+        kwargs = mock_invoices.query.call_args.kwargs
+        assert kwargs['IndexName'] == 'customer_id-created_at-index'
+        assert kwargs['ScanIndexForward'] is False
+        assert kwargs['Limit'] == 1
+        mock_invoices.scan.assert_not_called()
+        
+        mock_invoices.query.return_value = {'Items': []}
+        response = get_invoices({
+            'pathParameters': {'customer_id': 'c1'},
+            'queryStringParameters': {'next_token': body['next_token']}
+        }, {})
+        
+        assert json.loads(response['body'])['next_token'] is None
+        assert mock_invoices.query.call_args.kwargs['ExclusiveStartKey'] == last_key
+    
+    @pytest.mark.parametrize('params', [
+        {'limit': '0'},
+        {'limit': '101'},
+        {'limit': 'ten'},
+        {'next_token': 'garbage'},
+        {'next_token': encode_page_token({'invoice_id': 'INV-9', 'customer_id': 'other', 'created_at': 'x'})}
+    ])
+    @patch('billing_handlers.invoices_table')
+    def test_get_invoices_rejects_bad_paging(self, mock_invoices, params):
+        """Test invalid limits and cursors return 400 without querying"""
+        response = get_invoices({'pathParameters': {'customer_id': 'c1'}, 'queryStringParameters': params}, {})
+        
+        assert response['statusCode'] == 400
+        mock_invoices.query.assert_not_called()
+    
+    def test_generate_invoice_rejects_bad_period(self):
+        """Test unknown billing periods are a client error"""
+        response = generate_invoice({'body': json.dumps({'customer_id': 'c1', 'billing_period': 'last_year'})}, {})
+        
+        assert response['statusCode'] == 400
+    
+    @patch('billing_handlers.rollups_table')
+    @patch('billing_handlers.customers_table')
+    def test_generate_invoice_customer_not_found(self, mock_customers, mock_rollups):
+        """Test invoice generation for an unknown customer"""
+        mock_customers.get_item.return_value = {}
+        mock_rollups.query.side_effect = RuntimeError('throttled')
+        
+        response = generate_invoice({'body': json.dumps({'customer_id': 'missing'})}, {})
+        
+        # The concurrent usage read failing does not hide the missing customer
+        assert response['statusCode'] == 404
+    
+    def test_billing_period_dates(self):
+        """Test billing periods cover whole calendar months"""
+        start, end = billing_period_dates('previous_month', now=datetime(2024, 1, 15, 13, 45))
+        
+        assert start == datetime(2023, 12, 1)
+        assert end == datetime(2023, 12, 31, 23, 59, 59, 999999)
+        
+        start, end = billing_period_dates('current_month', now=datetime(2024, 2, 10, 8, 0))
+        
+        assert start == datetime(2024, 2, 1)
+        assert end.date() == datetime(2024, 2, 29).date()
+        
+        start, end = billing_period_dates('2023-02')
+        
+        assert (start, end.date()) == (datetime(2023, 2, 1), datetime(2023, 2, 28).date())
+    
+    @patch('billing_handlers.billing_runs_table')
+    @patch('billing_handlers.create_invoice')
+    @patch('billing_handlers.customers_table')
+    def test_run_billing_cycle_resumes_from_checkpoint(self, mock_customers, mock_create_invoice, mock_runs):
+        """Test a billing run skips customers already completed in the same run"""
+        customers = [
+            {'customer_id': f'customer-{i}', 'name': f'Customer {i}', 'email': f'c{i}@example.com'}
+            for i in range(10)
+        ]
+        # Each scan segment returns its share of the table
+        mock_customers.scan.side_effect = lambda **kwargs: {
+            'Items': customers[kwargs['Segment']::kwargs['TotalSegments']]
+        }
+        mock_runs.query.return_value = {'Items': [
+            {'customer_id': 'customer-0', 'status': 'completed'},
+            {'customer_id': 'customer-1', 'status': 'completed'},
+            {'customer_id': 'customer-2', 'status': 'failed'}
+        ]}
+        mock_create_invoice.side_effect = lambda customer, *args: {'invoice_id': f"INV-{customer['customer_id']}"}
+        
+        response = run_billing_cycle({'run_id': 'billing-test', 'max_workers': 4}, None)
+        
+        assert response['statusCode'] == 200
+        summary = json.loads(response['body'])
+        assert summary['complete'] is True
+        assert summary['invoiced'] == 8
+        assert summary['skipped_already_completed'] == 2
+        assert summary['failed'] == 0
+        assert mock_create_invoice.call_count == 8
+        assert mock_runs.put_item.call_count == 8
+        assert mock_customers.scan.call_count == 4
+        assert 'p95' in summary['latency_ms']
+    
+    @patch('billing_handlers.billing_runs_table')
+    @patch('billing_handlers.create_invoice')
+    @patch('billing_handlers.customers_table')
+    def test_run_billing_cycle_stops_before_timeout(self, mock_customers, mock_create_invoice, mock_runs):
+        """Test a billing run stops handing out work when the Lambda is about to time out"""
+        mock_customers.scan.side_effect = lambda **kwargs: {'Items': [
+            {'customer_id': 'customer-1', 'name': 'Customer 1', 'email': 'c1@example.com'}
+        ] if kwargs['Segment'] == 0 else []}
+        mock_runs.query.return_value = {'Items': []}
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 1000
+        
+        response = run_billing_cycle({'run_id': 'billing-test'}, context)
+        
+        summary = json.loads(response['body'])
+        assert summary['complete'] is False
+        mock_create_invoice.assert_not_called()
+    
+    @patch('billing_handlers.continue_billing_run')
+    @patch('billing_handlers.billing_runs_table')
+    @patch('billing_handlers.create_invoice')
+    @patch('billing_handlers.customers_table')
+    def test_run_billing_cycle_continues_after_deadline(self, mock_customers, mock_create_invoice, mock_runs,
+                                                        mock_continue):
+        """Test a run that reaches its deadline re-invokes itself with the same run id"""
+        mock_customers.scan.side_effect = lambda **kwargs: {'Items': [
+            {'customer_id': f'customer-{i}', 'name': f'Customer {i}', 'email': f'c{i}@example.com'}
+            for i in range(3)
+        ] if kwargs['Segment'] == 0 else []}
+        mock_runs.query.return_value = {'Items': []}
+        mock_create_invoice.side_effect = lambda customer, *args: {'invoice_id': f"INV-{customer['customer_id']}"}
+        context = MagicMock()
+        context.get_remaining_time_in_millis.side_effect = [600000, 1000, 1000]
+        
+        response = run_billing_cycle({'run_id': 'billing-test', 'billing_period': 'previous_month',
+                                      'continuation': 2}, context)
+        
+        summary = json.loads(response['body'])
+        assert summary['complete'] is False and summary['continued'] is True
+        assert summary['invoiced'] == 1
+        continued_context, params = mock_continue.call_args.args
+        assert continued_context is context
+        assert params['run_id'] == 'billing-test'
+        assert params['continuation'] == 3
+        assert params['billing_period'] == billing_period_dates('previous_month')[0].strftime('%Y-%m')
+    
+    @patch('billing_handlers.continue_billing_run')
+    @patch('billing_handlers.billing_runs_table')
+    @patch('billing_handlers.create_invoice')
+    @patch('billing_handlers.customers_table')
+    def test_run_billing_cycle_stops_continuing_at_cap(self, mock_customers, mock_create_invoice, mock_runs,
+                                                       mock_continue):
+        mock_customers.scan.side_effect = lambda **kwargs: {'Items': [
+            {'customer_id': f'customer-{i}', 'name': f'Customer {i}', 'email': f'c{i}@example.com'}
+            for i in range(2)
+        ] if kwargs['Segment'] == 0 else []}
+        mock_runs.query.return_value = {'Items': []}
+        mock_create_invoice.side_effect = lambda customer, *args: {'invoice_id': f"INV-{customer['customer_id']}"}
+        context = MagicMock()
+        context.get_remaining_time_in_millis.side_effect = [600000, 1000]
+        
+        response = run_billing_cycle({'run_id': 'billing-test', 'continuation': MAX_BILLING_RUN_CONTINUATIONS},
+                                     context)
+        
+        assert json.loads(response['body'])['continued'] is False
+        mock_continue.assert_not_called()
+    
+    @patch('billing_handlers.aws.client')
+    def test_continue_billing_run_invokes_asynchronously(self, mock_client):
+        context = MagicMock(invoked_function_arn='arn:aws:lambda:us-east-1:123:function:squill-dev-runBillingCycle')
+        
+        continue_billing_run(context, {'run_id': 'billing-test', 'continuation': 1})
+        
+        mock_client.assert_called_once_with('lambda')
+        kwargs = mock_client.return_value.invoke.call_args.kwargs
+        assert kwargs['FunctionName'] == context.invoked_function_arn
+        assert kwargs['InvocationType'] == 'Event'
+        assert json.loads(kwargs['Payload']) == {'run_id': 'billing-test', 'continuation': 1}
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
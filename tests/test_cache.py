@@ -0,0 +1,69 @@
+import pytest
+from utils.cache import TTLCache
+
+
+class FakeClock:
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    
+    def test_hit_and_miss_counters(self):
+        """Test lookups are counted"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.put('a', 1)
+        
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+    
+    def test_entries_expire(self):
+        """Test entries are dropped after the TTL"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+        cache.put('a', 1)
+        
+        clock.now = 59
+        assert cache.get('a') == 1
+        clock.now = 60
+        assert cache.get('a') is None
+    
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.stats()['evictions'] == 1
+    
+    def test_older_version_does_not_replace_newer(self):
+        """Test a stale read cannot overwrite a newer cached write"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.put('a', 'new', version='2024-01-02T00:00:00')
+        cache.put('a', 'old', version='2024-01-01T00:00:00')
+        
+        assert cache.get('a') == 'new'
+    
+    def test_get_or_load_caches_missing_records(self):
+        """Test absent records are cached unless told otherwise"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        calls = []
+        loader = lambda: calls.append(1)
+        
+        assert cache.get_or_load('a', loader) is None
+        assert cache.get_or_load('a', loader) is None
+        assert len(calls) == 1
+        
+        cache.get_or_load('b', loader, cache_missing=False)
+        cache.get_or_load('b', loader, cache_missing=False)
+        assert len(calls) == 3
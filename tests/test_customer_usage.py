@@ -0,0 +1,144 @@
+import pytest
+import json
+import sys
+import os
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+# Add parent directory to path to import handler
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mock DynamoDB before importing handler
+with patch('boto3.resource'):
+    from handler import get_customer_usage
+
+from utils.timeseries import build_series, choose_resolution, count_buckets, parse_utc
+
+
+def _event(**params):
+    return {'pathParameters': {'customer_id': 'test-customer-123'}, 'queryStringParameters': params or None}
+
+
+class TestTimeSeries:
+    
+    def test_count_buckets(self):
+        start, end = datetime(2024, 1, 1, 0, 30), datetime(2024, 3, 31, 23, 59)
+        
+        assert count_buckets(start, end, 'day') == 91
+        assert count_buckets(start, end, 'hour') == 91 * 24
+        assert count_buckets(start, end, 'month') == 3
+        assert count_buckets(datetime(2023, 11, 5), datetime(2024, 2, 1), 'month') == 4
+    
+    def test_choose_resolution_bounds_points(self):
+        assert choose_resolution(datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 17)) == 'minute'
+        assert choose_resolution(datetime(2024, 1, 1), datetime(2024, 1, 31)) == 'hour'
+        assert choose_resolution(datetime(2024, 1, 1), datetime(2024, 3, 31)) == 'day'
+        assert choose_resolution(datetime(2000, 1, 1), datetime(2024, 1, 1)) == 'month'
+    
+    def test_build_series_zero_fills(self):
+        series = build_series(
+            {'2024-01-01': {'api_call': 2000}, '2024-01-03': {'storage_gb': 1500}},
+            datetime(2024, 1, 1, 12), datetime(2024, 1, 3), 'day'
+        )
+        
+        assert series['timestamps'] == ['2024-01-01T00:00:00', '2024-01-02T00:00:00', '2024-01-03T00:00:00']
+        assert series['usage'] == {'api_call': [2, 0, 0], 'storage_gb': [0, 0, 1.5]}
+    
+    def test_parse_utc(self):
+        assert parse_utc('2024-01-15T12:00:00+02:00') == datetime(2024, 1, 15, 10)
+        assert parse_utc('2024-01-15') == datetime(2024, 1, 15)
+
+
+class TestCustomerUsage:
+    
+    @patch('handler.usage_table')
+    @patch('handler.rollups_table')
+    def test_day_series_from_rollups(self, mock_rollups, mock_usage):
+        """Test a 90-day chart is built from daily rollups, not raw events"""
+        mock_rollups.query.return_value = {'Items': [
+            {'bucket': '2024-01-15', 'event_type': 'api_call', 'quantity': Decimal('150'), 'event_count': Decimal('30')},
+            {'bucket': '2024-01-15', 'event_type': 'storage_gb', 'quantity': Decimal('2.5'), 'event_count': Decimal('1')},
+            {'bucket': '2024-03-01', 'event_type': 'api_call', 'quantity': Decimal('10'), 'event_count': Decimal('2')}
+        ]}
+        
+        response = get_customer_usage(_event(start_date='2024-01-01T00:00:00', end_date='2024-03-30T23:59:59'), {})
+        
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        assert body['resolution'] == 'day'
+        assert body['source'] == 'day_rollups'
+        assert len(body['series']['timestamps']) == 90
+        assert body['series']['usage']['api_call'][14] == 150
+        assert body['usage_summary']['api_call'] == {'total_quantity': 160, 'event_count': 32}
+        assert body['usage_summary']['storage_gb']['total_quantity'] == 2.5
+        assert body['daily_breakdown']['2024-01-15'] == {'api_call': 150, 'storage_gb': 2.5}
+        assert body['total_events'] == 33
+        key_condition = mock_rollups.query.call_args.kwargs['KeyConditionExpression']
+        assert key_condition.get_expression()['values'][1].get_expression()['values'][1:] == \
+            ('day#2024-01-01', 'day#2024-03-30~')
+        mock_usage.query.assert_not_called()
+    
+    @patch('handler.rollups_table')
+    def test_month_series_folds_daily_rollups(self, mock_rollups):
+        mock_rollups.query.return_value = {'Items': [
+            {'bucket': '2024-01-15', 'event_type': 'api_call', 'quantity': Decimal('5'), 'event_count': 1},
+            {'bucket': '2024-01-20', 'event_type': 'api_call', 'quantity': Decimal('7'), 'event_count': 1}
+        ]}
+        
+        response = get_customer_usage(_event(start_date='2024-01-01', end_date='2024-02-10', resolution='month'), {})
+        
+        body = json.loads(response['body'])
+        assert body['series'] == {'timestamps': ['2024-01-01T00:00:00', '2024-02-01T00:00:00'],
+                                  'usage': {'api_call': [12, 0]}}
+    
+    @patch('handler.usage_table')
+    def test_minute_series_reads_raw_events(self, mock_usage):
+        mock_usage.query.return_value = {'Items': [
+            {'timestamp': '2024-01-15T10:30:05.000000#0000000000000001', 'event_type': 'api_call', 'quantity': Decimal('1')},
+            {'timestamp': '2024-01-15T10:30:59.000000#0000000000000002', 'event_type': 'api_call', 'quantity': Decimal('2')},
+            {'timestamp': '2024-01-15T10:32:00.000000', 'event_type': 'api_call', 'quantity': Decimal('4')}
+        ]}
+        
+        response = get_customer_usage(_event(start_date='2024-01-15T10:30:00', end_date='2024-01-15T10:32:30'), {})
+        
+        body = json.loads(response['body'])
+        assert body['resolution'] == 'minute'
+        assert body['source'] == 'events'
+        assert body['series']['usage']['api_call'] == [3, 0, 4]
+        assert body['total_events'] == 3
+    
+    @patch('handler.usage_table')
+    @patch('handler.rollups_table')
+    def test_mid_bucket_range_is_widened_to_whole_buckets(self, mock_rollups, mock_usage):
+        """Test a range starting and ending mid-bucket reads and reports whole buckets"""
+        mock_rollups.query.return_value = {'Items': []}
+        mock_usage.query.return_value = {'Items': []}
+        
+        response = get_customer_usage(_event(start_date='2024-01-15T08:00:00', end_date='2024-03-10T12:00:00',
+                                             resolution='month'), {})
+        
+        body = json.loads(response['body'])
+        assert (body['start_date'], body['end_date']) == ('2024-01-01T00:00:00', '2024-03-31T23:59:59.999999')
+        key_condition = mock_rollups.query.call_args.kwargs['KeyConditionExpression']
+        assert key_condition.get_expression()['values'][1].get_expression()['values'][1:] == \
+            ('day#2024-01-01', 'day#2024-03-31~')
+        
+        response = get_customer_usage(_event(start_date='2024-01-15T10:30:45', end_date='2024-01-15T10:32:10'), {})
+        
+        body = json.loads(response['body'])
+        assert body['resolution'] == 'minute'
+        key_condition = mock_usage.query.call_args.kwargs['KeyConditionExpression']
+        assert key_condition.get_expression()['values'][1].get_expression()['values'][1:] == \
+            ('2024-01-15T10:30:00', '2024-01-15T10:32:59.999999~')
+    
+    @pytest.mark.parametrize('params', [
+        {'start_date': 'yesterday'},
+        {'start_date': '2024-02-01', 'end_date': '2024-01-01'},
+        {'resolution': 'week'},
+        {'start_date': '2024-01-01', 'end_date': '2024-12-31', 'resolution': 'minute'}
+    ])
+    def test_invalid_parameters(self, params):
+        response = get_customer_usage(_event(**params), {})
+        
+        assert response['statusCode'] == 400
@@ -0,0 +1,73 @@
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from scripts.realistic_demo_data import (
+    COMPANIES, RateLimiter, SquillDemoDataGenerator, company_day_events, ndjson_day
+)
+
+END_DATE = datetime(2024, 4, 1)
+
+
+class TestLoadGenerator:
+
+    def test_runs_are_reproducible(self):
+        """Test the same seed and end date produce the same events and invoices"""
+        first, second = (SquillDemoDataGenerator(seed=7, end_date=END_DATE) for _ in range(2))
+        companies = first.create_saas_client_companies(write=False)
+
+        assert [ndjson_day(task) for task in first.day_tasks(companies, 3)] == \
+            [ndjson_day(task) for task in second.day_tasks(companies, 3)]
+        assert first.create_sample_invoices(companies) == second.create_sample_invoices(companies)
+
+    def test_days_do_not_depend_on_order(self):
+        """Test a company day is the same whichever worker generates it, and when"""
+        generator = SquillDemoDataGenerator(seed=7, end_date=END_DATE)
+        tasks = generator.day_tasks(generator.create_saas_client_companies(write=False), 5)
+
+        forwards = [ndjson_day(task) for task in tasks]
+        backwards = [ndjson_day(task) for task in reversed(tasks)]
+
+        assert forwards == backwards[::-1]
+
+    def test_events_are_ingest_payloads_in_time_order(self):
+        generator = SquillDemoDataGenerator(end_date=END_DATE)
+        task = generator.day_tasks(generator.create_saas_client_companies(write=False), 1)[0]
+
+        payloads = [json.loads(line) for line in ndjson_day(task)]
+
+        assert {'customer_id', 'event_type', 'quantity'} <= set(payloads[0])
+        assert [p['timestamp'] for p in payloads] == sorted(p['timestamp'] for p in payloads)
+        assert payloads[-1]['event_type'] == 'storage_gb'
+        assert all(p['quantity'] > 0 for p in payloads)
+
+    def test_scale_adds_events_not_usage(self):
+        base_date = datetime(2024, 1, 1)
+        events = company_day_events(COMPANIES[1], 3, 90, base_date, 42)
+        scaled = company_day_events(COMPANIES[1], 3, 90, base_date, 42, scale=50)
+
+        calls = float(sum(e['quantity'] for e in events if e['event_type'] == 'api_call'))
+        scaled_calls = float(sum(e['quantity'] for e in scaled if e['event_type'] == 'api_call'))
+        assert len(scaled) - 1 == (len(events) - 1) * 50
+        assert scaled_calls == pytest.approx(calls, rel=0.05)
+
+
+class TestRateLimiter:
+
+    @patch('scripts.realistic_demo_data.time')
+    def test_paces_to_target_rate(self, mock_time):
+        clock = [100.0]
+        mock_time.monotonic.side_effect = lambda: clock[0]
+        mock_time.sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+        limiter = RateLimiter(rate=50)
+
+        for _ in range(4):
+            limiter.wait(25)
+
+        assert clock[0] == pytest.approx(101.5)
+
+    @patch('scripts.realistic_demo_data.time')
+    def test_unlimited_never_sleeps(self, mock_time):
+        RateLimiter(rate=None).wait(1000)
+
+        mock_time.sleep.assert_not_called()
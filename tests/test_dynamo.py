@@ -0,0 +1,239 @@
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
+from utils.dynamo import (
+    batch_get_items, batch_write_items, chunked, decode_page_token, encode_page_token, gather, key_id,
+    parallel_scan, query_page
+)
+
+
+def _items(count):
+    return [{'customer_id': 'customer-1', 'timestamp': f'2024-01-01T00:00:{i:02d}'} for i in range(count)]
+
+
+class TestBatchWriteItems:
+    
+    def test_chunked(self):
+        """Test chunking respects the chunk size"""
+        assert [len(c) for c in chunked(list(range(60)), 25)] == [25, 25, 10]
+    
+    @patch('utils.dynamo.time.sleep')
+    def test_retries_unprocessed_items(self, mock_sleep):
+        """Test unprocessed items are retried until written"""
+        items = _items(3)
+        dynamodb = MagicMock()
+        dynamodb.batch_write_item.side_effect = [
+            {'UnprocessedItems': {'UsageEvents': [{'PutRequest': {'Item': items[1]}}]}},
+            {'UnprocessedItems': {}}
+        ]
+        
+        failed = batch_write_items(dynamodb, 'UsageEvents', items, ('customer_id', 'timestamp'))
+        
+        assert failed == {}
+        assert dynamodb.batch_write_item.call_count == 2
+        retry_request = dynamodb.batch_write_item.call_args_list[1].kwargs['RequestItems']
+        assert retry_request['UsageEvents'] == [{'PutRequest': {'Item': items[1]}}]
+        mock_sleep.assert_called_once()
+    
+    @patch('utils.dynamo.time.sleep')
+    def test_reports_items_left_unprocessed(self, mock_sleep):
+        """Test items still unprocessed after the last attempt are reported"""
+        items = _items(2)
+        dynamodb = MagicMock()
+        dynamodb.batch_write_item.return_value = {
+            'UnprocessedItems': {'UsageEvents': [{'PutRequest': {'Item': items[0]}}]}
+        }
+        
+        failed = batch_write_items(dynamodb, 'UsageEvents', items, ('customer_id', 'timestamp'), max_attempts=3)
+        
+        assert list(failed) == [0]
+        assert dynamodb.batch_write_item.call_count == 3
+    
+    def test_client_error_fails_chunk(self):
+        """Test a rejected request marks every item in its chunk as failed"""
+        dynamodb = MagicMock()
+        dynamodb.batch_write_item.side_effect = ClientError(
+            {'Error': {'Code': 'ValidationException', 'Message': 'Bad request'}}, 'BatchWriteItem'
+        )
+        
+        failed = batch_write_items(dynamodb, 'UsageEvents', _items(30), ('customer_id', 'timestamp'))
+        
+        assert len(failed) == 30
+        assert failed[0] == 'Bad request'
+
+
+
+class TestBatchGetItems:
+    
+    @patch('utils.dynamo.time.sleep')
+    def test_reads_tables_and_retries_unprocessed_keys(self, mock_sleep):
+        """Test keys from several tables share a request and unprocessed keys are retried"""
+        dynamodb = MagicMock()
+        dynamodb.batch_get_item.side_effect = [
+            {
+                'Responses': {'Subscriptions': [{'client_id': 'c1', 'subscription_tier': 'basic'}], 'PricingRules': []},
+                'UnprocessedKeys': {'Subscriptions': {'Keys': [{'client_id': 'c2'}]}}
+            },
+            {'Responses': {'Subscriptions': [{'client_id': 'c2', 'subscription_tier': 'pro'}]}, 'UnprocessedKeys': {}}
+        ]
+        
+        found, failed = batch_get_items(dynamodb, {
+            'Subscriptions': [{'client_id': 'c1'}, {'client_id': 'c2'}, {'client_id': 'c1'}],
+            'PricingRules': [{'client_id': 'c1'}]
+        })
+        
+        assert found['Subscriptions'][key_id({'client_id': 'c2'})]['subscription_tier'] == 'pro'
+        assert set(found['Subscriptions']) == {key_id({'client_id': 'c1'}), key_id({'client_id': 'c2'})}
+        assert found['PricingRules'] == {}
+        assert failed == {'Subscriptions': {}, 'PricingRules': {}}
+        first_request = dynamodb.batch_get_item.call_args_list[0].kwargs['RequestItems']
+        assert first_request['Subscriptions'] == {'Keys': [{'client_id': 'c1'}, {'client_id': 'c2'}]}
+        mock_sleep.assert_called_once()
+    
+    def test_requests_hold_at_most_100_keys(self):
+        dynamodb = MagicMock()
+        dynamodb.batch_get_item.return_value = {'Responses': {}}
+        
+        batch_get_items(dynamodb, {'Subscriptions': [{'client_id': f'c{i}'} for i in range(250)]})
+        
+        sizes = sorted(len(call.kwargs['RequestItems']['Subscriptions']['Keys'])
+                       for call in dynamodb.batch_get_item.call_args_list)
+        assert sizes == [50, 100, 100]
+    
+    @patch('utils.dynamo.time.sleep')
+    def test_reports_keys_that_could_not_be_read(self, mock_sleep):
+        dynamodb = MagicMock()
+        dynamodb.batch_get_item.return_value = {
+            'Responses': {}, 'UnprocessedKeys': {'Subscriptions': {'Keys': [{'client_id': 'c1'}]}}
+        }
+        
+        found, failed = batch_get_items(dynamodb, {'Subscriptions': [{'client_id': 'c1'}]}, max_attempts=3)
+        
+        assert failed['Subscriptions'] == {key_id({'client_id': 'c1'}): 'Unprocessed after retries'}
+        assert dynamodb.batch_get_item.call_count == 3
+        
+        dynamodb.batch_get_item.side_effect = ClientError(
+            {'Error': {'Code': 'ValidationException', 'Message': 'Bad request'}}, 'BatchGetItem'
+        )
+        found, failed = batch_get_items(dynamodb, {'Subscriptions': [{'client_id': 'c1'}]})
+        
+        assert failed['Subscriptions'] == {key_id({'client_id': 'c1'}): 'Bad request'}
+
+class TestPageTokens:
+    
+    def test_token_round_trip(self):
+        key = {'invoice_id': 'INV-1', 'customer_id': 'c1', 'created_at': '2024-01-31T00:00:00'}
+        
+        token = encode_page_token(key)
+        
+        assert '=' not in token and '/' not in token
+        assert decode_page_token(token) == key
+        assert encode_page_token(None) is None
+    
+    @pytest.mark.parametrize('token', ['not a token', 'W10', 'eyJhIjoxfQ'])
+    def test_invalid_tokens_rejected(self, token):
+        with pytest.raises(ValueError, match='Invalid next_token'):
+            decode_page_token(token)
+    
+    def test_query_page_resumes_from_token(self):
+        operation = MagicMock(return_value={'Items': [{'n': 2}], 'LastEvaluatedKey': {'k': 'b'}})
+        
+        items, next_token = query_page(operation, 1, encode_page_token({'k': 'a'}), IndexName='idx')
+        
+        assert items == [{'n': 2}]
+        assert decode_page_token(next_token) == {'k': 'b'}
+        operation.assert_called_once_with(IndexName='idx', Limit=1, ExclusiveStartKey={'k': 'a'})
+
+
+class TestParallelScan:
+    
+    def _table(self, segments, pages_per_segment):
+        """Fake table whose segments each return `pages_per_segment` pages of two items"""
+        def scan(**kwargs):
+            segment = kwargs['Segment']
+            assert kwargs['TotalSegments'] == segments
+            page = kwargs.get('ExclusiveStartKey', {}).get('page', 0)
+            response = {'Items': [{'id': f'{segment}-{page}-{i}'} for i in range(2)]}
+            if page + 1 < pages_per_segment:
+                response['LastEvaluatedKey'] = {'page': page + 1}
+            return response
+        table = MagicMock()
+        table.scan.side_effect = scan
+        return table
+    
+    def test_reads_every_segment_and_page(self):
+        table = self._table(segments=4, pages_per_segment=3)
+        
+        items = list(parallel_scan(table, 4, ProjectionExpression='id'))
+        
+        assert sorted(item['id'] for item in items) == sorted(
+            f'{s}-{p}-{i}' for s in range(4) for p in range(3) for i in range(2)
+        )
+        assert table.scan.call_count == 12
+        assert all(call.kwargs['ProjectionExpression'] == 'id' for call in table.scan.call_args_list)
+    
+    def test_single_segment_is_a_plain_scan(self):
+        table = MagicMock()
+        table.scan.return_value = {'Items': [{'id': 1}]}
+        
+        assert list(parallel_scan(table, 1)) == [{'id': 1}]
+        assert 'Segment' not in table.scan.call_args.kwargs
+    
+    def test_segment_error_is_raised(self):
+        table = MagicMock()
+        table.scan.side_effect = lambda **kwargs: {'Items': []} if kwargs['Segment'] else \
+            (_ for _ in ()).throw(RuntimeError('throttled'))
+        
+        with pytest.raises(RuntimeError, match='throttled'):
+            list(parallel_scan(table, 3))
+    
+    def test_closing_early_stops_workers(self):
+        table = self._table(segments=2, pages_per_segment=1000)
+        
+        scan = parallel_scan(table, 2)
+        first = next(scan)
+        scan.close()
+        
+        assert first['id'].endswith('-0-0')
+        assert table.scan.call_count < 2000
+
+
+class TestGather:
+    
+    def test_results_in_call_order(self):
+        assert gather(lambda: 1, lambda: 2, lambda: 3) == [1, 2, 3]
+    
+    def test_calls_overlap(self):
+        """Test the wait is the slowest call, not the sum"""
+        started = time.perf_counter()
+        gather(*[lambda: time.sleep(0.05)] * 4)
+        
+        assert time.perf_counter() - started < 0.15
+    
+    def test_first_error_is_raised_after_every_call(self):
+        finished = threading.Event()
+        
+        def slow():
+            time.sleep(0.02)
+            finished.set()
+        
+        with pytest.raises(ValueError, match='first'):
+            gather(lambda: (_ for _ in ()).throw(ValueError('first')), slow)
+        assert finished.is_set()
+    
+    def test_return_exceptions(self):
+        error = RuntimeError('throttled')
+        
+        def fail():
+            raise error
+        
+        assert gather(lambda: 'item', fail, return_exceptions=True) == ['item', error]
+    
+    def test_sequential_when_disabled(self):
+        threads = []
+        with patch('utils.dynamo.CONCURRENT_READS', False):
+            gather(*[lambda: threads.append(threading.current_thread())] * 3)
+        
+        assert threads == [threading.main_thread()] * 3
@@ -0,0 +1,130 @@
+import pytest
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+from utils.export import S3MultipartWriter, export_usage, iter_usage_events, open_sink
+
+
+def _usage_events(count):
+    return [
+        {'customer_id': f'customer-{i % 3}', 'event_type': 'api_call', 'quantity': Decimal('1.5'),
+         'timestamp': f'2024-01-15T10:00:{i % 60:02d}.000000#node{i:08x}', 'metadata': {'endpoint': '/users'}}
+        for i in range(count)
+    ]
+
+
+def _lazy(events, consumed):
+    for usage_event in events:
+        consumed.append(usage_event)
+        yield usage_event
+
+
+class TestExport:
+
+    def test_ndjson_streams_in_chunks(self):
+        """Test events are pulled and written one chunk at a time"""
+        consumed, sink = [], io.BytesIO()
+        seen = []
+
+        stats = export_usage(
+            _lazy(_usage_events(25), consumed), 'ndjson', sink, chunk_rows=10,
+            progress=lambda rows, seconds: seen.append((rows, len(consumed)))
+        )
+
+        assert stats['rows'] == 25
+        assert 'rows_per_second' in stats
+        # Only a chunk's worth of events is read ahead of what was written
+        assert [rows for rows, _ in seen] == [10, 20, 25]
+        assert all(read - rows <= 10 for rows, read in seen)
+        lines = sink.getvalue().decode().splitlines()
+        assert json.loads(lines[0]) == {
+            'customer_id': 'customer-0', 'event_type': 'api_call', 'quantity': 1.5,
+            'event_time': '2024-01-15T10:00:00.000000', 'sort_key': '2024-01-15T10:00:00.000000#node00000000',
+            'metadata': {'endpoint': '/users'}
+        }
+
+    def test_csv_writes_one_header(self):
+        """Test CSV chunks share a single header row"""
+        sink = io.BytesIO()
+
+        export_usage(_usage_events(5), 'csv', sink, chunk_rows=2)
+
+        rows = list(csv.DictReader(io.StringIO(sink.getvalue().decode())))
+        assert len(rows) == 5
+        assert rows[0]['quantity'] == '1.5'
+        assert json.loads(rows[0]['metadata']) == {'endpoint': '/users'}
+
+    def test_parquet_requires_pyarrow(self, monkeypatch):
+        """Test a clear error when the optional pyarrow dependency is missing"""
+        monkeypatch.setitem(sys.modules, 'pyarrow', None)
+
+        with pytest.raises(RuntimeError, match='pyarrow'):
+            export_usage(_usage_events(1), 'parquet', io.BytesIO())
+
+    def test_unknown_format(self):
+        """Test unsupported formats are rejected"""
+        with pytest.raises(ValueError):
+            export_usage([], 'xml', io.BytesIO())
+
+    def test_customer_export_queries_key_range(self):
+        """Test one customer's export is a key-range query, a tenant export a parallel scan"""
+        table = MagicMock()
+        table.query.return_value = {'Items': []}
+        table.scan.return_value = {'Items': []}
+
+        list(iter_usage_events(table, datetime(2024, 1, 1), datetime(2024, 1, 31), 'customer-1'))
+        list(iter_usage_events(table, datetime(2024, 1, 1), datetime(2024, 1, 31), segments=1))
+
+        table.query.assert_called_once()
+        assert 'FilterExpression' in table.scan.call_args.kwargs
+
+
+class TestS3MultipartWriter:
+
+    def test_small_export_is_single_put(self):
+        """Test exports under one part skip the multipart upload"""
+        s3 = MagicMock()
+        sink = open_sink('s3://exports/usage.ndjson', s3)
+
+        sink.write(b'{}\n')
+        sink.close()
+
+        s3.put_object.assert_called_once_with(Bucket='exports', Key='usage.ndjson', Body=b'{}\n')
+        s3.create_multipart_upload.assert_not_called()
+
+    def test_large_export_uploads_bounded_parts(self):
+        """Test data is uploaded in fixed-size parts and completed in order"""
+        s3 = MagicMock()
+        s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+        s3.upload_part.side_effect = lambda **kwargs: {'ETag': f"etag-{kwargs['PartNumber']}"}
+        sink = S3MultipartWriter(s3, 'exports', 'usage.csv', part_bytes=4)
+
+        sink.write(b'abcdef')
+        assert len(sink.buffer) == 2
+        sink.write(b'ghij')
+        sink.close()
+
+        assert [call.kwargs['Body'] for call in s3.upload_part.call_args_list] == [b'abcd', b'efgh', b'ij']
+        parts = s3.complete_multipart_upload.call_args.kwargs['MultipartUpload']['Parts']
+        assert [part['PartNumber'] for part in parts] == [1, 2, 3]
+
+    def test_abort_discards_upload(self):
+        """Test a failed export aborts its multipart upload instead of completing it"""
+        s3 = MagicMock()
+        s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+        s3.upload_part.return_value = {'ETag': 'etag'}
+        sink = S3MultipartWriter(s3, 'exports', 'usage.csv', part_bytes=4)
+
+        sink.write(b'abcdef')
+        sink.abort()
+        sink.close()
+
+        s3.abort_multipart_upload.assert_called_once()
+        s3.complete_multipart_upload.assert_not_called()
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
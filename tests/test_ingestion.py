@@ -2,6 +2,8 @@ import pytest
 import json
 import sys
 import os
+from datetime import datetime
+from decimal import Decimal
 from unittest.mock import patch, MagicMock
 
 # Add parent directory to path to import handler
@@ -9,7 +11,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Mock DynamoDB before importing handler
 with patch('boto3.resource'):
-    from handler import ingest_usage
+    from handler import ingest_usage, ingest_usage_batch, MAX_BATCH_EVENTS
+from billing_handlers import aggregate_usage_events
+from utils.rollups import aggregate_rollups, summarize_rollups
 
 class TestUsageIngestion:
     
@@ -79,6 +83,17 @@ class TestUsageIngestion:
         response_body = json.loads(response['body'])
         assert 'Invalid JSON' in response_body['error']
     
+    @patch('handler.rollups_table')
+    @patch('handler.usage_table')
+    def test_ingest_usage_reports_rollup_errors(self, mock_table, mock_rollups):
+        """Test a failed rollup update is reported like the batch endpoint does"""
+        mock_rollups.update_item.side_effect = RuntimeError('throttled')
+        
+        response = ingest_usage({'body': json.dumps({'customer_id': 'c1', 'event_type': 'api_call', 'quantity': 1})}, {})
+        
+        assert response['statusCode'] == 200
+        assert json.loads(response['body'])['rollup_errors'] == 2
+    
     @patch('handler.usage_table')
     def test_ingest_usage_with_metadata(self, mock_table):
         """Test ingestion with optional metadata"""
@@ -101,4 +116,126 @@ class TestUsageIngestion:
         
         assert response['statusCode'] == 200
         response_body = json.loads(response['body'])
-        assert response_body['customer_id'] == 'test-customer-456'
\ No newline at end of file
+        assert response_body['customer_id'] == 'test-customer-456'
+
+class TestBatchUsageIngestion:
+    
+    @patch('handler.dynamodb')
+    def test_batch_ingest_success(self, mock_dynamodb):
+        """Test batch ingestion writes events in 25-item chunks"""
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {}}
+        
+        events = [
+            {'customer_id': f'customer-{i}', 'event_type': 'api_call', 'quantity': 1}
+            for i in range(60)
+        ]
+        
+        response = ingest_usage_batch({'body': json.dumps({'events': events})}, {})
+        
+        assert response['statusCode'] == 200
+        response_body = json.loads(response['body'])
+        assert response_body['accepted'] == 60
+        assert len(response_body['results']) == 60
+        assert mock_dynamodb.batch_write_item.call_count == 3
+    
+    @patch('handler.dynamodb')
+    def test_batch_ingest_partial_rejection(self, mock_dynamodb):
+        """Test invalid events are reported per index without blocking the rest"""
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {}}
+        
+        events = [
+            {'customer_id': 'customer-1', 'event_type': 'api_call', 'quantity': 5},
+            {'customer_id': 'customer-1', 'event_type': 'api_call', 'quantity': -1},
+            {'customer_id': 'customer-2', 'event_type': 'storage_gb'}
+        ]
+        
+        response = ingest_usage_batch({'body': json.dumps({'events': events})}, {})
+        
+        assert response['statusCode'] == 207
+        results = json.loads(response['body'])['results']
+        assert [r['status'] for r in results] == ['accepted', 'rejected', 'rejected']
+        assert 'Quantity must be positive' in results[1]['error']
+        assert 'Missing required field' in results[2]['error']
+    
+    @patch('handler.rollups_table')
+    @patch('handler.dynamodb')
+    def test_batch_ingest_checks_metadata_per_event(self, mock_dynamodb, mock_rollups):
+        """Test float metadata is stored as Decimal and unstorable metadata only rejects its event"""
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {}}
+        events = [
+            {'customer_id': 'customer-1', 'event_type': 'api_call', 'quantity': 1, 'metadata': {'latency': 0.25}},
+            {'customer_id': 'customer-1', 'event_type': 'api_call', 'quantity': 1, 'metadata': {'score': float('inf')}}
+        ]
+        
+        response = ingest_usage_batch({'body': json.dumps({'events': events})}, {})
+        
+        assert response['statusCode'] == 207
+        results = json.loads(response['body'])['results']
+        assert [r['status'] for r in results] == ['accepted', 'rejected']
+        assert 'Metadata' in results[1]['error']
+        written = mock_dynamodb.batch_write_item.call_args.kwargs['RequestItems'].popitem()[1]
+        assert written[0]['PutRequest']['Item']['metadata'] == {'latency': Decimal('0.25')}
+    
+    @patch('handler.rollups_table')
+    @patch('handler.dynamodb')
+    def test_batch_ingest_updates_rollups_once_per_bucket(self, mock_dynamodb, mock_rollups):
+        """Test batch ingestion pre-aggregates rollups for written events only"""
+        events = [
+            {'customer_id': 'customer-1', 'event_type': 'api_call', 'quantity': 1}
+            for _ in range(10)
+        ]
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {}}
+        
+        response = ingest_usage_batch({'body': json.dumps({'events': events})}, {})
+        
+        assert response['statusCode'] == 200
+        # hourly + daily for the customer (one bucket each unless the hour or day rolls over)
+        assert mock_rollups.update_item.call_count in (2, 3, 4)
+        keys = [c.kwargs['Key'] for c in mock_rollups.update_item.call_args_list]
+        assert {key['customer_id'] for key in keys} == {'customer-1'}
+        quantities = [c.kwargs['ExpressionAttributeValues'][':event_count'] for c in mock_rollups.update_item.call_args_list]
+        assert sum(quantities) == 20
+    
+    def test_batch_ingest_empty(self):
+        """Test batch ingestion requires a non-empty events list"""
+        response = ingest_usage_batch({'body': json.dumps({'events': []})}, {})
+        
+        assert response['statusCode'] == 400
+    
+    def test_batch_ingest_too_large(self):
+        """Test batch ingestion enforces the per-request event limit"""
+        events = [{'customer_id': 'c', 'event_type': 'api_call', 'quantity': 1}] * (MAX_BATCH_EVENTS + 1)
+        
+        response = ingest_usage_batch({'body': json.dumps({'events': events})}, {})
+        
+        assert response['statusCode'] == 413
+    
+    @patch('billing_handlers.usage_archive', None)
+    @patch('billing_handlers.usage_table')
+    @patch('handler.rollups_table')
+    @patch('handler.dynamodb')
+    def test_sub_thousandth_quantities_rejected_so_usage_sources_agree(self, mock_dynamodb, mock_rollups,
+                                                                       mock_usage_table):
+        """Test raw events and rollups bill the same totals for what ingestion accepts"""
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {}}
+        quantities = ['0.0004', '0.001', '1.2345', '2.125', '0.333', '0.333', '0.333', '7']
+        events = [{'customer_id': 'c1', 'event_type': 'api_call', 'quantity': q} for q in quantities]
+        
+        response = ingest_usage_batch({'body': json.dumps({'events': events})}, {})
+        
+        results = json.loads(response['body'])['results']
+        assert [r['status'] for r in results] == ['rejected', 'accepted', 'rejected'] + ['accepted'] * 5
+        assert 'at most 3 decimal places' in results[0]['error']
+        
+        written = [request['PutRequest']['Item']
+                   for request in mock_dynamodb.batch_write_item.call_args.kwargs['RequestItems'].popitem()[1]]
+        mock_usage_table.query.return_value = {'Items': written}
+        rollup_items = [
+            {'event_type': key.split('#')[2], 'quantity': total['quantity'], 'event_count': total['event_count']}
+            for (customer_id, key), total in aggregate_rollups(written).items()
+            if customer_id == 'c1' and key.startswith('day#')
+        ]
+        
+        from_events = aggregate_usage_events('c1', datetime(2020, 1, 1), datetime(2100, 1, 1))
+        
+        assert from_events == summarize_rollups(rollup_items) == ({'api_call': 10125}, 6)
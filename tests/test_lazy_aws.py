@@ -0,0 +1,33 @@
+from unittest.mock import MagicMock, patch
+from utils import aws
+
+
+class TestLazyTable:
+    
+    def test_table_is_built_on_first_use(self):
+        """Test no resource is created until a table attribute is used"""
+        dynamodb = MagicMock()
+        with patch('utils.aws.resource', return_value=dynamodb) as resource:
+            table = aws.table('Invoices-test')
+            resource.assert_not_called()
+            
+            table.get_item(Key={'invoice_id': 'inv-1'})
+            table.put_item(Item={'invoice_id': 'inv-1'})
+        
+        resource.assert_called_once_with('dynamodb')
+        dynamodb.Table.assert_called_once_with('Invoices-test')
+        dynamodb.Table.return_value.get_item.assert_called_once_with(Key={'invoice_id': 'inv-1'})
+    
+    def test_dunder_lookups_do_not_build_the_table(self):
+        """Test copy/pickle style probes do not trigger AWS setup"""
+        with patch('utils.aws.resource') as resource:
+            table = aws.table('Invoices-test')
+            assert not hasattr(table, '__deepcopy__')
+            assert repr(table) == "LazyTable('Invoices-test')"
+        resource.assert_not_called()
+    
+    def test_client_reuses_the_resource_client(self):
+        """Test the low-level client shares the resource's connection pool"""
+        dynamodb = MagicMock()
+        with patch.dict(aws._resources, {'dynamodb': dynamodb}, clear=True), patch.dict(aws._clients, clear=True):
+            assert aws.client('dynamodb') is dynamodb.meta.client
@@ -1,12 +1,36 @@
 import pytest
 from decimal import Decimal
+import random
 from utils.pricing import (
     calculate_squill_billing,
     calculate_client_billing,
+    calculate_client_billing_batch,
+    calculate_squill_billing_batch,
     validate_subscription_limits,
     get_pricing_tier_info,
+    compile_pricing_rule,
+    compile_client_plan,
+    CompiledTiers,
+    SubscriptionPlan,
+    DEFAULT_CLIENT_PLAN,
+    SUBSCRIPTION_PLANS,
     SUBSCRIPTION_TIERS
 )
+from utils.money import (
+    to_money_units,
+    to_quantity_units,
+    from_money_units,
+    from_quantity_units,
+    multiply_units,
+    units_to_json
+)
+
+def quantities(usage):
+    """Usage dict with every value in quantity units"""
+    return {
+        key: [to_quantity_units(v) for v in value] if isinstance(value, list) else to_quantity_units(value)
+        for key, value in usage.items()
+    }
 
 class TestPricingEngine:
     
@@ -18,11 +42,11 @@ class TestPricingEngine:
             'storage_gb': 5
         }
         
-        result = calculate_squill_billing('basic', usage_data)
+        result = calculate_squill_billing('basic', quantities(usage_data))
         
         assert result['subscription_tier'] == 'basic'
-        assert result['monthly_fee'] == Decimal('99.00')
-        assert result['total_cost'] == Decimal('99.00')
+        assert result['monthly_fee'] == to_money_units('99.00')
+        assert result['total_cost'] == to_money_units('99.00')
         assert len(result['overages']) == 0
     
     def test_basic_tier_with_overages(self):
@@ -33,26 +57,25 @@ class TestPricingEngine:
             'storage_gb': 15     # 5 over limit
         }
         
-        result = calculate_squill_billing('basic', usage_data)
+        result = calculate_squill_billing('basic', quantities(usage_data))
         
         assert result['subscription_tier'] == 'basic'
-        assert result['monthly_fee'] == Decimal('99.00')
+        assert result['monthly_fee'] == to_money_units('99.00')
         
         # Check overages
         assert 'customers' in result['overages']
-        assert result['overages']['customers']['overage'] == 500
-        assert result['overages']['customers']['cost'] == Decimal('50.00')  # 500 * 0.10
+        assert result['overages']['customers']['overage'] == to_quantity_units(500)
+        assert result['overages']['customers']['cost'] == to_money_units('50.00')  # 500 * 0.10
         
         assert 'api_calls' in result['overages']
-        assert result['overages']['api_calls']['overage'] == 5000
-        assert result['overages']['api_calls']['cost'] == Decimal('5.00')  # 5000 * 0.001
+        assert result['overages']['api_calls']['overage'] == to_quantity_units(5000)
+        assert result['overages']['api_calls']['cost'] == to_money_units('5.00')  # 5000 * 0.001
         
         assert 'storage_gb' in result['overages']
-        assert result['overages']['storage_gb']['overage'] == 5
-        assert result['overages']['storage_gb']['cost'] == Decimal('5.00')  # 5 * 1.00
+        assert result['overages']['storage_gb']['overage'] == to_quantity_units(5)
+        assert result['overages']['storage_gb']['cost'] == to_money_units('5.00')  # 5 * 1.00
         
-        expected_total = Decimal('99.00') + Decimal('50.00') + Decimal('5.00') + Decimal('5.00')
-        assert result['total_cost'] == expected_total
+        assert result['total_cost'] == to_money_units('159.00')
     
     def test_enterprise_tier_no_overages(self):
         """Test enterprise tier has no overages"""
@@ -62,11 +85,11 @@ class TestPricingEngine:
             'storage_gb': 1000
         }
         
-        result = calculate_squill_billing('enterprise', usage_data)
+        result = calculate_squill_billing('enterprise', quantities(usage_data))
         
         assert result['subscription_tier'] == 'enterprise'
-        assert result['monthly_fee'] == Decimal('999.00')
-        assert result['total_cost'] == Decimal('999.00')
+        assert result['monthly_fee'] == to_money_units('999.00')
+        assert result['total_cost'] == to_money_units('999.00')
         assert len(result['overages']) == 0
     
     def test_client_billing_calculation(self):
@@ -81,40 +104,40 @@ class TestPricingEngine:
             'storage_gb': [2, 3]        # Total: 5
         }
         
-        result = calculate_client_billing(pricing_rules, usage_events)
+        result = calculate_client_billing(pricing_rules, quantities(usage_events))
         
         # API calls: 225 total, 100 free, 125 billable * $0.01 = $1.25
-        assert result['billing_details']['api_call']['total_quantity'] == 225
-        assert result['billing_details']['api_call']['billable_quantity'] == 125
-        assert result['billing_details']['api_call']['cost'] == Decimal('1.25')
+        assert result['billing_details']['api_call']['total_quantity'] == to_quantity_units(225)
+        assert result['billing_details']['api_call']['billable_quantity'] == to_quantity_units(125)
+        assert result['billing_details']['api_call']['cost'] == to_money_units('1.25')
         
         # Storage: 5 total, 1 free, 4 billable * $5.00 = $20.00
-        assert result['billing_details']['storage_gb']['total_quantity'] == 5
-        assert result['billing_details']['storage_gb']['billable_quantity'] == 4
-        assert result['billing_details']['storage_gb']['cost'] == Decimal('20.00')
+        assert result['billing_details']['storage_gb']['total_quantity'] == to_quantity_units(5)
+        assert result['billing_details']['storage_gb']['billable_quantity'] == to_quantity_units(4)
+        assert result['billing_details']['storage_gb']['cost'] == to_money_units('20.00')
         
-        assert result['total_cost'] == Decimal('21.25')
+        assert result['total_cost'] == to_money_units('21.25')
     
     def test_subscription_limits_validation(self):
         """Test subscription limits validation"""
         # Within limits
         usage_data = {'customers': 500, 'api_calls': 5000}
-        within_limits, violations = validate_subscription_limits('basic', usage_data)
+        within_limits, violations = validate_subscription_limits('basic', quantities(usage_data))
         
         assert within_limits is True
         assert len(violations) == 0
         
         # Over limits
         usage_data = {'customers': 1500, 'api_calls': 15000}
-        within_limits, violations = validate_subscription_limits('basic', usage_data)
+        within_limits, violations = validate_subscription_limits('basic', quantities(usage_data))
         
         assert within_limits is False
         assert len(violations) == 2
         
         customer_violation = next(v for v in violations if v['metric'] == 'customers')
-        assert customer_violation['usage'] == 1500
-        assert customer_violation['limit'] == 1000
-        assert customer_violation['overage'] == 500
+        assert customer_violation['usage'] == to_quantity_units(1500)
+        assert customer_violation['limit'] == to_quantity_units(1000)
+        assert customer_violation['overage'] == to_quantity_units(500)
     
     def test_get_pricing_tier_info(self):
         """Test getting pricing tier information"""
@@ -138,10 +161,248 @@ class TestPricingEngine:
             'api_call': [150],  # 150 total, 100 free, 50 billable * $0.01 = $0.50
         }
         
-        result = calculate_client_billing(None, usage_events)
+        result = calculate_client_billing(None, quantities(usage_events))
+        
+        assert result['billing_details']['api_call']['cost'] == to_money_units('0.50')
+        assert result['total_cost'] == to_money_units('0.50')
+    
+    def test_fractional_quantities_are_exact(self):
+        """Test fractional quantities price without float drift"""
+        # 0.1 + 0.2 GB in floats is 0.30000000000000004
+        result = calculate_client_billing(None, quantities({'storage_gb': [0.1, 0.2, 1.7], 'transaction': [10.5]}))
         
-        assert result['billing_details']['api_call']['cost'] == Decimal('0.50')
-        assert result['total_cost'] == Decimal('0.50')
+        assert result['billing_details']['storage_gb']['total_quantity'] == to_quantity_units('2.0')
+        assert result['billing_details']['storage_gb']['cost'] == to_money_units('5.00')
+        assert result['total_cost'] == to_money_units('5.15')  # + 0.5 transactions @ $0.30
+
+class TestTieredPricing:
+    
+    TIERS = [
+        {'up_to': 1000, 'rate': '0'},
+        {'up_to': 10000, 'rate': '0.01'},
+        {'up_to': 100000, 'rate': '0.008'},
+        {'up_to': None, 'rate': '0.005'}
+    ]
+    
+    def walk_graduated(self, quantity):
+        """Reference implementation walking every tier"""
+        cost, start = Decimal('0'), Decimal('0')
+        for tier in self.TIERS:
+            end = Decimal(str(tier['up_to'])) if tier['up_to'] is not None else Decimal(quantity)
+            portion = max(Decimal('0'), min(Decimal(quantity), end) - start)
+            cost += portion * Decimal(tier['rate'])
+            start = end
+        return cost
+    
+    def test_graduated_matches_tier_walk(self):
+        """Test compiled graduated pricing equals walking every tier"""
+        tiers = CompiledTiers(self.TIERS, 'graduated')
+        
+        for quantity in [0, 1, 999, 1000, 1001, 10000, 55555, 100000, 100001, 10 ** 7]:
+            assert tiers.cost(to_quantity_units(quantity)) == to_money_units(self.walk_graduated(quantity))
+    
+    def test_volume_pricing(self):
+        """Test volume pricing charges all units at the tier reached"""
+        tiers = CompiledTiers(self.TIERS, 'volume')
+        
+        assert tiers.cost(to_quantity_units(500)) == 0
+        assert tiers.cost(to_quantity_units(10000)) == to_money_units('100.00')   # still in the 0.01 tier
+        assert tiers.cost(to_quantity_units(10001)) == to_money_units('80.008')   # whole quantity at 0.008
+    
+    def test_volume_free_quantity(self):
+        """Test volume tiers only report free quantity while it stays in the zero-rate tier"""
+        tiers = CompiledTiers(self.TIERS, 'volume')
+        
+        assert tiers.free_quantity(to_quantity_units(500)) == to_quantity_units(500)
+        assert tiers.free_quantity(to_quantity_units(1000)) == to_quantity_units(1000)
+        assert tiers.free_quantity(to_quantity_units(1001)) == 0
+        assert CompiledTiers(self.TIERS, 'graduated').free_quantity(to_quantity_units(1001)) == to_quantity_units(1000)
+        
+        billing = calculate_client_billing(
+            {'transaction': {'mode': 'volume', 'tiers': self.TIERS}}, {'transaction': [to_quantity_units(5000)]}
+        )
+        details = billing['billing_details']['transaction']
+        assert details['free_quantity'] == 0
+        assert details['billable_quantity'] == to_quantity_units(5000)
+        assert details['cost'] == to_money_units('50.00')
+    
+    def test_invalid_tiers(self):
+        """Test malformed tiers are rejected when compiled"""
+        with pytest.raises(ValueError):
+            CompiledTiers([{'up_to': 100, 'rate': '0.01'}])
+        with pytest.raises(ValueError):
+            CompiledTiers([{'up_to': 100, 'rate': '0.01'}, {'up_to': 50, 'rate': '0.02'}, {'up_to': None, 'rate': '0'}])
+        with pytest.raises(ValueError):
+            CompiledTiers(self.TIERS, 'stairstep')
+    
+    def test_flat_rule_compiles_to_free_tier(self):
+        """Test flat rules keep their free tier semantics when compiled"""
+        tiers = compile_pricing_rule({'rate': Decimal('0.01'), 'free_tier': 100})
+        
+        assert tiers.cost(to_quantity_units(225)) == to_money_units('1.25')
+        assert tiers.free_quantity(to_quantity_units(225)) == to_quantity_units(100)
+    
+    def test_client_billing_with_tiers(self):
+        """Test tiered rules in client billing"""
+        pricing_rules = {'api_call': {'mode': 'graduated', 'tiers': self.TIERS}}
+        
+        result = calculate_client_billing(pricing_rules, quantities({'api_call': [20000, 5000]}))
+        
+        details = result['billing_details']['api_call']
+        assert details['cost'] == to_money_units('210')  # 9000 @ 0.01 + 15000 @ 0.008
+        assert details['free_quantity'] == to_quantity_units(1000)
+        assert details['rate'] == to_money_units('0.008')
+        assert result['total_cost'] == to_money_units('210')
+    
+    def test_squill_overage_tiers(self):
+        """Test graduated overage tiers replace the flat overage rate"""
+        plan = SubscriptionPlan('basic', {
+            **SUBSCRIPTION_TIERS['basic'],
+            'overage_tiers': {'api_calls': [
+                {'up_to': 1000, 'rate': '0.001'},
+                {'up_to': None, 'rate': '0.0005'}
+            ]}
+        })
+        
+        result = calculate_squill_billing(plan, quantities({'api_calls': 13000}))
+        
+        # 3000 over the limit: 1000 @ 0.001 + 2000 @ 0.0005
+        assert result['overages']['api_calls']['cost'] == to_money_units('2.0')
+        assert result['total_cost'] == to_money_units('101.0')
+
+class TestPricingPlans:
+    
+    def test_plans_are_immutable(self):
+        """Test compiled plans cannot be modified"""
+        plan = compile_client_plan({'api_call': {'rate': '0.01', 'free_tier': 100}})
+        
+        with pytest.raises(AttributeError):
+            plan.version = 2
+        with pytest.raises(AttributeError):
+            plan.rules['api_call'].rate = 0
+        with pytest.raises(TypeError):
+            plan.rules['storage_gb'] = None
+        with pytest.raises(AttributeError):
+            SUBSCRIPTION_PLANS['basic'].monthly_fee = 0
+    
+    def test_plan_results_match_rule_dicts(self):
+        """Test compiled plans price exactly like the rule dicts they came from"""
+        pricing_rules = {
+            'api_call': {'rate': Decimal('0.01'), 'free_tier': 100},
+            'storage_gb': {'mode': 'volume', 'tiers': [{'up_to': 10, 'rate': '5'}, {'up_to': None, 'rate': '4'}]}
+        }
+        usage_events = quantities({'api_call': [150, 75], 'storage_gb': [12], 'transaction': [5]})
+        usage_data = quantities({'api_calls': 150000})
+        
+        assert calculate_client_billing(compile_client_plan(pricing_rules), usage_events) == \
+            calculate_client_billing(pricing_rules, usage_events)
+        assert calculate_squill_billing(SUBSCRIPTION_PLANS['pro'], usage_data) == \
+            calculate_squill_billing('pro', usage_data)
+    
+    def test_default_plan_for_missing_rules(self):
+        """Test empty rules resolve to the precompiled default plan"""
+        assert compile_client_plan(None) is DEFAULT_CLIENT_PLAN
+        assert compile_client_plan({}) is DEFAULT_CLIENT_PLAN
+
+class TestMoneyUnits:
+    
+    def test_unit_conversions(self):
+        """Test fixed-point conversions round-trip"""
+        assert to_money_units(Decimal('0.0008')) == 800
+        assert to_quantity_units(2.5) == 2500
+        assert to_quantity_units(7) == 7000
+        assert from_money_units(21250000) == Decimal('21.25')
+        assert from_quantity_units(2500) == Decimal('2.5')
+    
+    def test_multiply_rounds_half_even(self):
+        """Test scalar multiplication rounds to the nearest even money unit"""
+        assert multiply_units(to_quantity_units(125), to_money_units('0.01')) == 1250000
+        assert multiply_units(1, 500) == 0       # 0.001 x 0.0005 = 0.5 units -> 0
+        assert multiply_units(3, 500) == 2       # 1.5 units -> 2
+        assert multiply_units(1, 1500) == 2      # 1.5 units -> 2
+    
+    def test_units_to_json(self):
+        """Test billing results convert to dollars and quantities only at the edge"""
+        result = calculate_client_billing(None, quantities({'api_call': [150], 'storage_gb': [2.5]}))
+        
+        converted = units_to_json(result)
+        
+        assert converted['total_cost'] == 8.0
+        assert converted['billing_details']['api_call'] == {
+            'total_quantity': 150, 'free_quantity': 100, 'billable_quantity': 50, 'rate': 0.01, 'cost': 0.5
+        }
+        assert converted['billing_details']['storage_gb']['total_quantity'] == 2.5
+
+class TestBatchPricingEngine:
+    
+    def setup_method(self):
+        pytest.importorskip('numpy')
+    
+    def test_client_batch_matches_scalar(self):
+        """Test batch client pricing equals the scalar engine line by line"""
+        rng = random.Random(7)
+        pricing_rules = {
+            'api_call': {'rate': Decimal('0.01'), 'free_tier': 100},
+            'storage_gb': {'rate': Decimal('5.00'), 'free_tier': 1},
+            'transaction': {'rate': Decimal('0.30'), 'free_tier': 10}
+        }
+        event_types = ['api_call', 'storage_gb', 'transaction', 'unpriced']
+        customers = [
+            [rng.randint(0, 10 ** 7), Decimal(rng.randint(0, 50000)) / 1000, rng.randint(0, 500), rng.randint(0, 9)]
+            for _ in range(500)
+        ]
+        
+        result = calculate_client_billing_batch(
+            pricing_rules, event_types,
+            [[to_quantity_units(q) for q in row] for row in customers]
+        )
+        
+        for row, usage in enumerate(customers):
+            scalar = calculate_client_billing(pricing_rules, {t: [to_quantity_units(q)] for t, q in zip(event_types, usage)})
+            for column, event_type in enumerate(event_types):
+                expected = scalar['billing_details'].get(event_type, {'cost': 0})['cost']
+                assert result['costs'][row, column] == expected
+            assert result['total_costs'][row] == scalar['total_cost']
+    
+    def test_squill_batch_matches_scalar(self):
+        """Test batch subscription pricing equals the scalar engine"""
+        rng = random.Random(11)
+        metrics = ['customers', 'api_calls', 'storage_gb']
+        tiers = [rng.choice(list(SUBSCRIPTION_TIERS)) for _ in range(300)]
+        usage = [[rng.randint(0, 20000), rng.randint(0, 200000), rng.randint(0, 200)] for _ in tiers]
+        
+        result = calculate_squill_billing_batch(
+            tiers, metrics, [[to_quantity_units(u) for u in row] for row in usage]
+        )
+        
+        for row, tier in enumerate(tiers):
+            scalar = calculate_squill_billing(tier, quantities(dict(zip(metrics, usage[row]))))
+            assert result['total_costs'][row] == scalar['total_cost']
+    
+    def test_client_batch_matches_scalar_with_tiers(self):
+        """Test batch pricing of graduated and volume tiers equals the scalar engine"""
+        rng = random.Random(3)
+        tiers = TestTieredPricing.TIERS
+        pricing_rules = {
+            'api_call': {'mode': 'graduated', 'tiers': tiers},
+            'transaction': {'mode': 'volume', 'tiers': tiers}
+        }
+        event_types = ['api_call', 'transaction']
+        customers = [[rng.randint(0, 300000), rng.randint(0, 300000)] for _ in range(500)]
+        
+        result = calculate_client_billing_batch(
+            pricing_rules, event_types,
+            [[to_quantity_units(q) for q in row] for row in customers]
+        )
+        
+        for row, usage in enumerate(customers):
+            scalar = calculate_client_billing(pricing_rules, {t: [to_quantity_units(q)] for t, q in zip(event_types, usage)})
+            assert result['total_costs'][row] == scalar['total_cost']
+    
+    def test_squill_batch_invalid_tier(self):
+        """Test batch subscription pricing rejects unknown tiers"""
+        with pytest.raises(ValueError, match="Invalid subscription tier"):
+            calculate_squill_billing_batch(['basic', 'gold'], ['customers'], [[1], [2]])
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
\ No newline at end of file
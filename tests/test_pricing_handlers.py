@@ -1,7 +1,19 @@
 import pytest
 import json
+from decimal import Decimal
 from unittest.mock import patch, MagicMock
-from pricing_handlers import create_subscription, get_subscription, calculate_pricing, update_pricing_rules
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+import pricing_handlers
+from pricing_handlers import (
+    create_subscription, get_subscription, calculate_pricing, calculate_pricing_batch, update_pricing_rules
+)
+
+@pytest.fixture(autouse=True)
+def clear_pricing_caches():
+    """Start every test with cold subscription and pricing rules caches"""
+    pricing_handlers.subscription_cache.clear()
+    pricing_handlers.pricing_rules_cache.clear()
 
 class TestPricingHandlers:
     
@@ -85,6 +97,31 @@ class TestPricingHandlers:
         assert body['client_id'] == 'client-123'
         assert 'tier_details' in body
     
+    @patch('pricing_handlers.subscriptions_table')
+    def test_get_subscription_revalidates_with_etag(self, mock_table):
+        """Test a matching If-None-Match gets a 304 and a new version a fresh ETag"""
+        mock_table.get_item.return_value = {'Item': {
+            'client_id': 'client-123', 'subscription_tier': 'basic', 'created_at': '2024-01-01T00:00:00'
+        }}
+        event = {'pathParameters': {'client_id': 'client-123'}}
+        
+        first = get_subscription(event, {})
+        etag = first['headers']['ETag']
+        assert first['headers']['Cache-Control'] == 'private, max-age=60'
+        
+        revalidated = get_subscription(dict(event, headers={'if-none-match': etag}), {})
+        
+        assert revalidated['statusCode'] == 304
+        assert revalidated['body'] == ''
+        assert revalidated['headers']['ETag'] == etag
+        
+        pricing_handlers.subscription_cache.clear()
+        mock_table.get_item.return_value['Item']['updated_at'] = '2024-02-01T00:00:00'
+        changed = get_subscription(dict(event, headers={'If-None-Match': etag}), {})
+        
+        assert changed['statusCode'] == 200
+        assert changed['headers']['ETag'] != etag
+    
     @patch('pricing_handlers.subscriptions_table')
     def test_get_subscription_not_found(self, mock_table):
         """Test subscription not found"""
@@ -135,8 +172,62 @@ class TestPricingHandlers:
         assert 'client_billing' in body
         assert 'within_limits' in body
     
+    @patch('pricing_handlers.pricing_rules_table')
+    @patch('pricing_handlers.subscriptions_table')
+    def test_calculate_pricing_repeat_call_hits_cache(self, mock_subscriptions, mock_rules):
+        """Test a repeat pricing call for the same client needs no DynamoDB reads"""
+        mock_subscriptions.get_item.return_value = {
+            'Item': {'client_id': 'client-123', 'subscription_tier': 'basic', 'created_at': '2024-01-01T00:00:00'}
+        }
+        mock_rules.get_item.return_value = {}  # No custom rules
+        
+        event = {
+            'body': json.dumps({
+                'client_id': 'client-123',
+                'usage_data': {'customers': 500},
+                'client_usage_events': {'api_call': [150]}
+            })
+        }
+        
+        first = calculate_pricing(event, {})
+        second = calculate_pricing(event, {})
+        
+        assert first['statusCode'] == second['statusCode'] == 200
+        assert first['body'] == second['body']
+        assert mock_subscriptions.get_item.call_count == 1
+        assert mock_rules.get_item.call_count == 1
+        assert pricing_handlers.subscription_cache.stats()['hits'] == 1
+    
+    @patch('pricing_handlers.pricing_rules_table')
     @patch('pricing_handlers.subscriptions_table')
-    def test_calculate_pricing_subscription_not_found(self, mock_table):
+    def test_update_pricing_rules_refreshes_cache(self, mock_subscriptions, mock_rules):
+        """Test updated rules are used by the next pricing call without a read"""
+        mock_subscriptions.get_item.return_value = {
+            'Item': {'client_id': 'client-123', 'subscription_tier': 'basic', 'created_at': '2024-01-01T00:00:00'}
+        }
+        mock_rules.get_item.return_value = {}
+        pricing_event = {
+            'body': json.dumps({
+                'client_id': 'client-123',
+                'usage_data': {'customers': 500},
+                'client_usage_events': {'api_call': [150]}
+            })
+        }
+        calculate_pricing(pricing_event, {})
+        
+        update_pricing_rules({
+            'pathParameters': {'client_id': 'client-123'},
+            'body': json.dumps({'pricing_rules': {'api_call': {'rate': '0.02', 'free_tier': 0}}})
+        }, {})
+        response = calculate_pricing(pricing_event, {})
+        
+        body = json.loads(response['body'])
+        assert body['client_billing']['total_cost'] == 3.0
+        assert mock_rules.get_item.call_count == 1
+    
+    @patch('pricing_handlers.pricing_rules_table')
+    @patch('pricing_handlers.subscriptions_table')
+    def test_calculate_pricing_subscription_not_found(self, mock_table, mock_rules):
         """Test pricing calculation with non-existent subscription"""
         mock_table.get_item.return_value = {}
         
@@ -192,6 +283,46 @@ class TestPricingHandlers:
         assert 'successfully' in body['message']
         mock_rules.put_item.assert_called_once()
     
+    @patch('pricing_handlers.pricing_rules_table')
+    @patch('pricing_handlers.subscriptions_table')
+    def test_update_pricing_rules_stores_decimal_rates(self, mock_subscriptions, mock_rules):
+        """Test fractional rates reach DynamoDB as Decimals, not floats"""
+        mock_subscriptions.get_item.return_value = {'Item': {'client_id': 'client-123'}}
+        
+        event = {
+            'pathParameters': {'client_id': 'client-123'},
+            'body': json.dumps({
+                'pricing_rules': {
+                    'storage_gb': {'rate': 5.00, 'free_tier': 1},
+                    'api_call': {'mode': 'graduated', 'tiers': [
+                        {'up_to': 1000, 'rate': 0},
+                        {'up_to': 100000, 'rate': 0.01},
+                        {'up_to': None, 'rate': 0.005}
+                    ]}
+                }
+            })
+        }
+        
+        response = update_pricing_rules(event, {})
+        
+        assert response['statusCode'] == 200
+        item = mock_rules.put_item.call_args.kwargs['Item']
+        TypeSerializer().serialize(item)
+        assert item['rules']['api_call']['tiers'][1]['rate'] == Decimal('0.01')
+    
+    @patch('pricing_handlers.subscriptions_table')
+    def test_update_pricing_rules_rejects_non_finite_rates(self, mock_table):
+        """Test rates DynamoDB cannot store are rejected before the write"""
+        event = {
+            'pathParameters': {'client_id': 'client-123'},
+            'body': '{"pricing_rules": {"api_call": {"rate": NaN}}}'
+        }
+        
+        response = update_pricing_rules(event, {})
+        
+        assert response['statusCode'] == 400
+        mock_table.get_item.assert_not_called()
+    
     @patch('pricing_handlers.subscriptions_table')
     def test_update_pricing_rules_client_not_found(self, mock_table):
         """Test pricing rules update with non-existent client"""
@@ -210,6 +341,23 @@ class TestPricingHandlers:
         body = json.loads(response['body'])
         assert 'Client subscription not found' in body['error']
     
+    def test_update_pricing_rules_invalid_tiers(self):
+        """Test pricing rules update with tiers that do not compile"""
+        event = {
+            'pathParameters': {'client_id': 'client-123'},
+            'body': json.dumps({
+                'pricing_rules': {
+                    'api_call': {'mode': 'graduated', 'tiers': [{'up_to': 1000, 'rate': 0.01}]}
+                }
+            })
+        }
+        
+        response = update_pricing_rules(event, {})
+        
+        assert response['statusCode'] == 400
+        body = json.loads(response['body'])
+        assert 'Invalid pricing rules' in body['error']
+    
     def test_update_pricing_rules_missing_rules(self):
         """Test pricing rules update with missing rules"""
         event = {
@@ -223,5 +371,110 @@ class TestPricingHandlers:
         body = json.loads(response['body'])
         assert 'Missing pricing_rules' in body['error']
 
+
+class TestCalculatePricingBatch:
+    
+    def _dynamodb(self, subscriptions, rules=()):
+        """BatchGetItem stub over the stage's Subscriptions and PricingRules tables"""
+        dynamodb = MagicMock()
+        
+        def batch_get_item(RequestItems):
+            tables = {pricing_handlers.subscriptions_table.name: subscriptions,
+                      pricing_handlers.pricing_rules_table.name: list(rules)}
+            return {'Responses': {
+                name: [item for item in tables[name] if {'client_id': item['client_id']} in request['Keys']]
+                for name, request in RequestItems.items()
+            }}
+        
+        dynamodb.batch_get_item.side_effect = batch_get_item
+        return dynamodb
+    
+    def test_results_in_input_order(self):
+        """Test every entry gets its own result, in request order"""
+        dynamodb = self._dynamodb(
+            [{'client_id': 'c1', 'subscription_tier': 'basic', 'created_at': '2024-01-01T00:00:00'},
+             {'client_id': 'c2', 'subscription_tier': 'pro', 'created_at': '2024-01-01T00:00:00'}],
+            [{'client_id': 'c2', 'rules': {'api_call': {'rate': '0.02', 'free_tier': 0}},
+              'updated_at': '2024-01-02T00:00:00'}]
+        )
+        event = {'body': json.dumps({'entries': [
+            {'client_id': 'c2', 'usage_data': {'api_calls': 1000}, 'client_usage_events': {'api_call': [100]}},
+            {'client_id': 'missing', 'usage_data': {}},
+            {'client_id': 'c1', 'usage_data': {'api_calls': 'lots'}},
+            {'usage_data': {}},
+            {'client_id': 'c1', 'usage_data': {'api_calls': 1000}, 'client_usage_events': {'api_call': [100]}}
+        ]})}
+        
+        with patch('pricing_handlers.dynamodb', dynamodb):
+            response = calculate_pricing_batch(event, {})
+        
+        assert response['statusCode'] == 207
+        body = json.loads(response['body'])
+        assert [r['status'] for r in body['results']] == ['priced', 'not_found', 'rejected', 'rejected', 'priced']
+        assert [r['index'] for r in body['results']] == [0, 1, 2, 3, 4]
+        assert (body['priced'], body['not_found'], body['rejected'], body['failed']) == (2, 1, 2, 0)
+        assert body['results'][0]['client_billing']['total_cost'] == 2.0
+        assert body['results'][4]['subscription_tier'] == 'basic'
+        # One pass over both tables; the rejected c1 entry does not add a second read
+        assert dynamodb.batch_get_item.call_count == 1
+    
+    @patch('pricing_handlers.pricing_rules_table')
+    @patch('pricing_handlers.subscriptions_table')
+    def test_matches_single_calculation(self, mock_subscriptions, mock_rules):
+        """Test a batch entry is priced exactly like POST /pricing/calculate"""
+        subscription = {'client_id': 'c1', 'subscription_tier': 'basic', 'created_at': '2024-01-01T00:00:00'}
+        mock_subscriptions.get_item.return_value = {'Item': subscription}
+        mock_rules.get_item.return_value = {}
+        request = {'client_id': 'c1', 'usage_data': {'api_calls': 15000, 'storage_gb': 12},
+                   'client_usage_events': {'api_call': [1500.5]}}
+        single = json.loads(calculate_pricing({'body': json.dumps(request)}, {})['body'])
+        
+        pricing_handlers.subscription_cache.clear()
+        pricing_handlers.pricing_rules_cache.clear()
+        mock_subscriptions.name, mock_rules.name = 'Subscriptions-dev', 'PricingRules-dev'
+        with patch('pricing_handlers.dynamodb', self._dynamodb([subscription])):
+            batch = json.loads(calculate_pricing_batch({'body': json.dumps({'entries': [request]})}, {})['body'])
+        
+        assert batch['results'][0] == {'index': 0, 'status': 'priced', **single}
+    
+    def test_cached_clients_are_not_read(self):
+        """Test warm cache entries skip the batch read"""
+        pricing_handlers.subscription_cache.put('c1', {'client_id': 'c1', 'subscription_tier': 'basic'})
+        pricing_handlers.pricing_rules_cache.put('c1', None)
+        dynamodb = self._dynamodb([])
+        
+        with patch('pricing_handlers.dynamodb', dynamodb):
+            response = calculate_pricing_batch({'body': json.dumps({'entries': [
+                {'client_id': 'c1', 'usage_data': {'api_calls': 10}}
+            ]})}, {})
+        
+        assert response['statusCode'] == 200
+        dynamodb.batch_get_item.assert_not_called()
+    
+    def test_unreadable_subscription_fails_entry(self):
+        """Test keys left unprocessed are reported per entry"""
+        dynamodb = MagicMock()
+        dynamodb.batch_get_item.side_effect = ClientError(
+            {'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'Throttled'}}, 'BatchGetItem'
+        )
+        
+        with patch('pricing_handlers.dynamodb', dynamodb):
+            response = calculate_pricing_batch({'body': json.dumps({'entries': [
+                {'client_id': 'c1', 'usage_data': {'api_calls': 10}}
+            ]})}, {})
+        
+        body = json.loads(response['body'])
+        assert response['statusCode'] == 207
+        assert body['results'][0] == {'index': 0, 'status': 'failed', 'client_id': 'c1', 'error': 'Throttled'}
+        assert pricing_handlers.subscription_cache.get('c1') is None
+    
+    @pytest.mark.parametrize('body, status', [
+        ('not json', 400),
+        (json.dumps({'entries': []}), 400),
+        (json.dumps({'entries': [{'client_id': 'c1', 'usage_data': {}}] * 101}), 413)
+    ])
+    def test_rejects_bad_requests(self, body, status):
+        assert calculate_pricing_batch({'body': body}, {})['statusCode'] == status
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
\ No newline at end of file
@@ -0,0 +1,136 @@
+import pytest
+import re
+import threading
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+from scripts.backfill_rollups import backfill_rollups
+from utils.rollups import (
+    ALL_CUSTOMERS,
+    aggregate_rollups,
+    apply_rollups,
+    query_rollups,
+    summarize_rollups
+)
+
+
+class TestRollups:
+    
+    def test_aggregate_rollups(self):
+        """Test events fold into hourly and daily buckets per customer"""
+        events = [
+            {'customer_id': 'c1', 'timestamp': '2024-01-15T10:05:00.000000#a', 'event_type': 'api_call', 'quantity': Decimal('10')},
+            {'customer_id': 'c1', 'timestamp': '2024-01-15T10:45:00.000000#b', 'event_type': 'api_call', 'quantity': Decimal('5')},
+            {'customer_id': 'c1', 'timestamp': '2024-01-15T11:00:00.000000#c', 'event_type': 'api_call', 'quantity': Decimal('1')},
+            {'customer_id': 'c2', 'timestamp': '2024-01-15T11:00:00', 'event_type': 'storage_gb', 'quantity': Decimal('2.5')}
+        ]
+        
+        deltas = aggregate_rollups(events)
+        
+        assert deltas[('c1', 'hour#2024-01-15T10#api_call')] == {'quantity': Decimal('15'), 'event_count': 2}
+        assert deltas[('c1', 'hour#2024-01-15T11#api_call')] == {'quantity': Decimal('1'), 'event_count': 1}
+        assert deltas[('c1', 'day#2024-01-15#api_call')] == {'quantity': Decimal('16'), 'event_count': 3}
+        assert deltas[('c2', 'day#2024-01-15#storage_gb')]['quantity'] == Decimal('2.5')
+        assert ALL_CUSTOMERS not in {customer_id for customer_id, _ in deltas}  # no platform-wide hot key
+    
+    def test_apply_rollups_uses_atomic_add(self):
+        """Test each rollup bucket is one ADD update"""
+        table = MagicMock()
+        deltas = {('c1', 'day#2024-01-15#api_call'): {'quantity': Decimal('15'), 'event_count': 2}}
+        
+        errors = apply_rollups(table, deltas)
+        
+        assert errors == 0
+        kwargs = table.update_item.call_args.kwargs
+        assert kwargs['Key'] == {'customer_id': 'c1', 'rollup_key': 'day#2024-01-15#api_call'}
+        assert 'ADD #quantity :quantity, #event_count :event_count' in kwargs['UpdateExpression']
+        assert kwargs['ExpressionAttributeValues'][':event_type'] == 'api_call'
+    
+    def test_apply_rollups_updates_concurrently(self):
+        """Test rollup updates overlap instead of running one after another"""
+        table = MagicMock()
+        barrier = threading.Barrier(2, timeout=5)
+        table.update_item.side_effect = lambda **kwargs: barrier.wait()
+        deltas = {
+            ('c1', 'hour#2024-01-15T10#api_call'): {'quantity': Decimal('15'), 'event_count': 2},
+            ('c1', 'day#2024-01-15#api_call'): {'quantity': Decimal('15'), 'event_count': 2}
+        }
+        
+        assert apply_rollups(table, deltas) == 0
+    
+    def test_apply_rollups_counts_failed_items(self):
+        """Test one failed update is counted without stopping the others"""
+        def update_item(Key, **kwargs):
+            if Key['rollup_key'].startswith('hour#'):
+                raise RuntimeError('throttled')
+        
+        table = MagicMock()
+        table.update_item.side_effect = update_item
+        deltas = {
+            ('c1', 'hour#2024-01-15T10#api_call'): {'quantity': Decimal('1'), 'event_count': 1},
+            ('c1', 'day#2024-01-15#api_call'): {'quantity': Decimal('1'), 'event_count': 1},
+            ('c2', 'day#2024-01-15#api_call'): {'quantity': Decimal('1'), 'event_count': 1}
+        }
+        
+        assert apply_rollups(table, deltas) == 1
+        assert table.update_item.call_count == 3
+    
+    def test_query_rollups_follows_pages(self):
+        """Test rollup queries read every page"""
+        table = MagicMock()
+        table.query.side_effect = [
+            {'Items': [{'event_type': 'api_call', 'quantity': Decimal('10'), 'event_count': 2}],
+             'LastEvaluatedKey': {'customer_id': 'c1', 'rollup_key': 'day#2024-01-15#api_call'}},
+            {'Items': [{'event_type': 'api_call', 'quantity': Decimal('5'), 'event_count': 1},
+                       {'event_type': 'storage_gb', 'quantity': Decimal('2.5'), 'event_count': 1}]}
+        ]
+        
+        items = query_rollups(table, 'c1', 'day', '2024-01-01', '2024-01-31')
+        usage_summary, total_events = summarize_rollups(items)
+        
+        assert table.query.call_count == 2
+        assert usage_summary == {'api_call': 15000, 'storage_gb': 2500}  # quantity units
+        assert total_events == 4
+
+
+class SetOnlyRollupsTable:
+    """Rollups table stand-in that applies `SET #a = :a, ...` updates to stored items"""
+    
+    def __init__(self, items):
+        self.items = {(item['customer_id'], item['rollup_key']): dict(item) for item in items}
+    
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        assert UpdateExpression.startswith('SET ')
+        item = self.items.setdefault((Key['customer_id'], Key['rollup_key']), dict(Key))
+        for name, value in re.findall(r'(#\w+) = (:\w+)', UpdateExpression):
+            item[ExpressionAttributeNames[name]] = ExpressionAttributeValues[value]
+    
+    def batch_writer(self):
+        raise AssertionError('Whole-item puts would drop the sketches')
+
+
+class TestBackfillRollups:
+    
+    @patch('scripts.backfill_rollups.parallel_scan')
+    @patch('scripts.backfill_rollups.boto3')
+    def test_backfill_keeps_sketches(self, mock_boto3, mock_scan, capsys):
+        """Test rebuilt totals leave the platform-wide sketch items alone"""
+        sketched = {
+            'customer_id': ALL_CUSTOMERS, 'rollup_key': 'day#2024-01-15#api_call',
+            'quantity': Decimal('999'), 'event_count': 99, 'sketch_version': 4,
+            'distinct_customers': b'hll', 'quantity_digest': b'digest', 'top_customers': {'c1': 5}
+        }
+        table = SetOnlyRollupsTable([sketched])
+        mock_boto3.resource.return_value.Table.return_value = table
+        mock_scan.return_value = iter([
+            {'customer_id': 'c1', 'timestamp': '2024-01-15T10:05:00.000000#a', 'event_type': 'api_call',
+             'quantity': Decimal('10')},
+            {'customer_id': 'c2', 'timestamp': '2024-01-15T12:00:00.000000#b', 'event_type': 'api_call',
+             'quantity': Decimal('5')}
+        ])
+        
+        backfill_rollups('dev', segments=1)
+        
+        assert table.items[(ALL_CUSTOMERS, 'day#2024-01-15#api_call')] == sketched
+        assert table.items[('c2', 'day#2024-01-15#api_call')]['event_count'] == 1
+        assert 'from 2 usage events' in capsys.readouterr().out
+        assert table.items[('c1', 'hour#2024-01-15T10#api_call')]['quantity'] == Decimal('10')
@@ -0,0 +1,94 @@
+import json
+import os
+import re
+from unittest.mock import MagicMock, patch
+import router
+from router import ROUTES, allowed_methods, match_route, route
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def proxy_event(method, path, **extra):
+    return dict(extra, httpMethod=method, path=path, resource='/{proxy+}', pathParameters={'proxy': path.lstrip('/')})
+
+
+def http_events(path):
+    """(METHOD, /path, module.function) for every http event in a functions file"""
+    routes = []
+    handler = None
+    with open(os.path.join(ROOT, path)) as f:
+        lines = f.read().splitlines()
+    for index, line in enumerate(lines):
+        found = re.match(r'^  handler:\s*(\S+)\s*$', line)
+        if found:
+            handler = found.group(1)
+        found = re.match(r'^\s+path:\s*(\S+)\s*$', line)
+        if found and handler:
+            method = re.match(r'^\s+method:\s*(\w+)', lines[index + 1]).group(1)
+            routes.append((method.upper(), '/' + found.group(1).lstrip('/'), handler))
+    return routes
+
+
+class TestRouter:
+    
+    def test_routes_match_split_functions(self):
+        """Test the router covers exactly the HTTP endpoints of split mode"""
+        expected = http_events('serverless/functions-split.yml')
+        assert sorted(ROUTES) == sorted(expected)
+    
+    def test_billing_runs_stay_with_their_own_function(self):
+        """Test POST /billing/run is left to runBillingCycle in router mode too"""
+        assert ('POST', '/billing/run', 'billing_handlers.run_billing_cycle') in \
+            http_events('serverless/functions-background.yml')
+        assert match_route('POST', '/billing/run') is None
+    
+    def test_match_route_extracts_path_parameters(self):
+        """Test templates match one path segment per parameter"""
+        assert match_route('GET', '/customers/cust-1/usage') == (
+            'handler.get_customer_usage', '/customers/{customer_id}/usage', {'customer_id': 'cust-1'}
+        )
+        assert match_route('GET', '/customers/cust-1/usage/extra') is None
+        assert match_route('GET', 'analytics/') == ('billing_handlers.get_analytics', '/analytics', {})
+    
+    def test_dispatch_rewrites_event_for_handler(self):
+        """Test handlers see the resource and path parameters of their own route"""
+        handler = MagicMock(return_value={'statusCode': 200})
+        with patch.dict(router.handlers, {'pricing_handlers.get_subscription': handler}):
+            event = proxy_event('GET', '/subscriptions/client-1', headers={'If-None-Match': '"abc"'})
+            response = route(event, {})
+        
+        assert response == {'statusCode': 200}
+        forwarded = handler.call_args[0][0]
+        assert forwarded['resource'] == '/subscriptions/{client_id}'
+        assert forwarded['pathParameters'] == {'client_id': 'client-1'}
+        assert forwarded['headers'] == {'If-None-Match': '"abc"'}
+    
+    def test_route_without_parameters_passes_none(self):
+        """Test routes without parameters get no pathParameters, as API Gateway sends"""
+        handler = MagicMock(return_value={'statusCode': 200})
+        with patch.dict(router.handlers, {'billing_handlers.get_analytics': handler}):
+            route(proxy_event('GET', '/analytics'), {})
+        
+        assert handler.call_args[0][0]['pathParameters'] is None
+    
+    def test_unknown_path_returns_404(self):
+        """Test unrouted paths are rejected"""
+        response = route(proxy_event('GET', '/nope'), {})
+        
+        assert response['statusCode'] == 404
+        assert response['headers']['Access-Control-Allow-Origin'] == '*'
+    
+    def test_wrong_method_returns_405(self):
+        """Test a known path with another method lists the allowed ones"""
+        response = route(proxy_event('DELETE', '/customers/cust-1'), {})
+        
+        assert response['statusCode'] == 405
+        assert response['headers']['Allow'] == 'GET, PUT'
+        assert allowed_methods('/usage') == ['POST']
+    
+    def test_missing_handler_returns_501(self):
+        """Test routes whose handler is not defined fail cleanly"""
+        with patch.dict(router.handlers, {'handler.create_customer': None}):
+            response = route(proxy_event('POST', '/customers', body=json.dumps({})), {})
+        
+        assert response['statusCode'] == 501
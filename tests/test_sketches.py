@@ -0,0 +1,235 @@
+import pytest
+import random
+from decimal import Decimal
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
+from utils.sketches import (
+    HyperLogLog,
+    SpaceSaving,
+    TDigest,
+    apply_usage_sketches,
+    fold_usage_sketches,
+    load_item_sketches,
+    summarize_sketches
+)
+
+
+def _usage_event(customer_id, quantity, timestamp='2024-01-15T10:00:00.000000#abc', event_type='api_call'):
+    return {'customer_id': customer_id, 'event_type': event_type, 'quantity': Decimal(str(quantity)),
+            'timestamp': timestamp}
+
+
+class TestHyperLogLog:
+
+    def test_count_within_error_bound(self):
+        """Test distinct counts stay within a few standard errors (~1.6% each)"""
+        sketch = HyperLogLog()
+        for i in range(50000):
+            sketch.add(f'customer-{i}')
+            sketch.add(f'customer-{i}')  # repeats do not count
+
+        assert sketch.count() == pytest.approx(50000, rel=0.05)
+
+    def test_small_counts_are_exact_enough(self):
+        """Test linear counting keeps small cardinalities close"""
+        sketch = HyperLogLog()
+        for i in range(20):
+            sketch.add(f'customer-{i}')
+
+        assert sketch.count() == 20
+
+    def test_merge_is_union(self):
+        """Test merged sketches count the union, serialized or not"""
+        left, right = HyperLogLog(), HyperLogLog()
+        for i in range(3000):
+            left.add(i)
+        for i in range(2000, 5000):
+            right.add(i)
+
+        merged = HyperLogLog.from_bytes(left.to_bytes()).merge(right)
+
+        assert merged.count() == pytest.approx(5000, rel=0.05)
+
+    def test_merge_rejects_mismatched_precision(self):
+        """Test sketches of different sizes cannot be merged"""
+        with pytest.raises(ValueError):
+            HyperLogLog(10).merge(HyperLogLog(12))
+
+
+class TestTDigest:
+
+    def test_quantiles_within_rank_error(self):
+        """Test p50/p95/p99 land within 1% rank of the exact value"""
+        rng = random.Random(7)
+        values = sorted(rng.expovariate(1 / 100) for _ in range(20000))
+        digest = TDigest()
+        for value in values:
+            digest.add(value)
+
+        for q in (0.5, 0.95, 0.99):
+            estimate = digest.quantile(q)
+            rank = sum(1 for value in values if value <= estimate) / len(values)
+            assert rank == pytest.approx(q, abs=0.01)
+
+    def test_round_trip_and_merge(self):
+        """Test digests survive serialization and merge into one distribution"""
+        low, high = TDigest(), TDigest()
+        for i in range(1, 501):
+            low.add(i)
+            high.add(i + 500)
+
+        merged = TDigest.from_bytes(low.to_bytes()).merge(TDigest.from_bytes(high.to_bytes()))
+
+        assert merged.count == 1000
+        assert merged.quantile(0) == 1
+        assert merged.quantile(1) == 1000
+        assert merged.quantile(0.5) == pytest.approx(500, abs=10)
+
+    def test_empty_digest(self):
+        """Test an empty digest has no quantiles"""
+        assert TDigest().quantile(0.5) is None
+
+
+class TestSpaceSaving:
+
+    def test_finds_heavy_hitters_in_long_tail(self):
+        """Test customers above 1/capacity of the total are always kept, with bounded error"""
+        rng = random.Random(3)
+        summary = SpaceSaving(capacity=20)
+        exact = {}
+        stream = [('noisy-1', 500), ('noisy-2', 300)] * 50 + [(f'tail-{rng.randint(0, 5000)}', 10) for _ in range(2000)]
+        rng.shuffle(stream)
+        for customer_id, weight in stream:
+            summary.add(customer_id, weight)
+            exact[customer_id] = exact.get(customer_id, 0) + weight
+
+        top = summary.top(2)
+
+        assert [customer_id for customer_id, count, error in top] == ['noisy-1', 'noisy-2']
+        for customer_id, count, error in top:
+            assert count - error <= exact[customer_id] <= count
+
+    def test_merge_keeps_combined_leaders(self):
+        """Test merged summaries rank keys by their combined counts"""
+        left, right = SpaceSaving(capacity=3), SpaceSaving(capacity=3)
+        for customer_id, weight in (('a', 50), ('b', 40), ('c', 5)):
+            left.add(customer_id, weight)
+        for customer_id, weight in (('b', 30), ('d', 45), ('e', 1)):
+            right.add(customer_id, weight)
+
+        merged = SpaceSaving.from_item(left.to_item(), capacity=3).merge(right)
+
+        assert [customer_id for customer_id, count, error in merged.top()] == ['b', 'a', 'd']
+        assert merged.top(1) == [('b', 70, 0)]
+
+
+class TestUsageSketches:
+
+    def test_fold_groups_by_day_and_type(self):
+        """Test sketches are keyed by event day and type"""
+        sketches = fold_usage_sketches([
+            _usage_event('c1', 10),
+            _usage_event('c2', 20),
+            _usage_event('c1', 5, event_type='storage_gb'),
+            _usage_event('c1', 1, timestamp='2024-01-16T00:00:00.000000#def')
+        ])
+
+        assert set(sketches) == {('2024-01-15', 'api_call'), ('2024-01-15', 'storage_gb'), ('2024-01-16', 'api_call')}
+        assert sketches[('2024-01-15', 'api_call')]['customers'].count() == 2
+        assert sketches[('2024-01-15', 'api_call')]['quantities'].count == 2
+        assert sketches[('2024-01-15', 'api_call')]['top_customers'].top(1) == [('c2', 20000, 0)]
+
+    def test_apply_merges_into_stored_sketch(self):
+        """Test stored sketches are merged and written back behind a version check"""
+        stored = fold_usage_sketches([_usage_event('c1', 10)])[('2024-01-15', 'api_call')]
+        table = MagicMock()
+        table.get_item.return_value = {'Item': {
+            'distinct_customers': stored['customers'].to_bytes(),
+            'quantity_digest': stored['quantities'].to_bytes(),
+            'top_customers': {'c1': [Decimal('10000'), Decimal('0')]},
+            'sketch_version': Decimal('3')
+        }}
+
+        errors = apply_usage_sketches(table, fold_usage_sketches([_usage_event('c2', 30)]))
+
+        assert errors == 0
+        kwargs = table.update_item.call_args.kwargs
+        assert kwargs['Key'] == {'customer_id': '#all', 'rollup_key': 'day#2024-01-15#api_call'}
+        assert kwargs['ExpressionAttributeValues'][':version'] == 3
+        assert kwargs['ExpressionAttributeValues'][':next_version'] == 4
+        written = load_item_sketches({
+            'distinct_customers': kwargs['ExpressionAttributeValues'][':customers'],
+            'quantity_digest': kwargs['ExpressionAttributeValues'][':digest']
+        })
+        assert written['customers'].count() == 2
+        assert written['quantities'].quantile(1) == 30
+        assert kwargs['ExpressionAttributeValues'][':top_customers'] == {'c2': [30000, 0], 'c1': [10000, 0]}
+
+    def test_apply_fills_in_rollup_attributes_once(self):
+        """Test a sketch written before its rollup still names its day and event type"""
+        table = MagicMock()
+        table.get_item.return_value = {}
+
+        apply_usage_sketches(table, fold_usage_sketches([_usage_event('c1', 10)]))
+
+        kwargs = table.update_item.call_args.kwargs
+        assert '#event_type = if_not_exists(#event_type, :event_type)' in kwargs['UpdateExpression']
+        assert kwargs['ExpressionAttributeNames']['#event_type'] == 'event_type'
+        assert kwargs['ExpressionAttributeValues'][':event_type'] == 'api_call'
+        assert kwargs['ExpressionAttributeValues'][':granularity'] == 'day'
+        assert kwargs['ExpressionAttributeValues'][':bucket'] == '2024-01-15'
+
+    def test_apply_retries_on_version_conflict(self):
+        """Test a lost version race re-reads the item and retries"""
+        table = MagicMock()
+        table.get_item.return_value = {}
+        conflict = ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': ''}}, 'UpdateItem')
+        table.update_item.side_effect = [conflict, None]
+
+        errors = apply_usage_sketches(table, fold_usage_sketches([_usage_event('c1', 10)]))
+
+        assert errors == 0
+        assert table.update_item.call_count == 2
+
+    def test_summarize_merges_days(self):
+        """Test daily sketches merge into window-wide counts and percentiles"""
+        sketches = fold_usage_sketches([
+            _usage_event('c1', 10),
+            _usage_event('c2', 20, timestamp='2024-01-16T00:00:00.000000#def'),
+            _usage_event('c2', 7, event_type='storage_gb')
+        ])
+        items = [
+            {'event_type': event_type, 'quantity': Decimal('1'),
+             'distinct_customers': batch['customers'].to_bytes(), 'quantity_digest': batch['quantities'].to_bytes(),
+             'top_customers': batch['top_customers'].to_item()}
+            for (day, event_type), batch in sketches.items()
+        ]
+        items.append({'event_type': 'api_call', 'quantity': Decimal('1')})  # rolled up before sketches existed
+
+        summary = summarize_sketches(items)
+
+        assert summary['distinct_customers'] == 2
+        assert summary['event_types']['api_call']['distinct_customers'] == 2
+        assert summary['event_types']['api_call']['quantity_p99'] == pytest.approx(20, abs=1)
+        assert summary['event_types']['storage_gb']['quantity_p50'] == 7
+        assert summary['event_types']['api_call']['top_customers'] == [
+            {'customer_id': 'c2', 'quantity': 20, 'max_error': 0},
+            {'customer_id': 'c1', 'quantity': 10, 'max_error': 0}
+        ]
+
+    def test_summarize_sketch_only_item(self):
+        """Test an item holding only sketches is keyed by the event type in its rollup key"""
+        batch = fold_usage_sketches([_usage_event('c1', 10)])[('2024-01-15', 'api_call')]
+        item = {
+            'customer_id': '#all', 'rollup_key': 'day#2024-01-15#api_call',
+            'distinct_customers': batch['customers'].to_bytes(), 'quantity_digest': batch['quantities'].to_bytes(),
+            'top_customers': batch['top_customers'].to_item(), 'sketch_version': Decimal('1')
+        }
+
+        summary = summarize_sketches([item])
+
+        assert summary['distinct_customers'] == 1
+        assert summary['event_types']['api_call']['quantity_p50'] == 10
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,53 @@
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from utils.sort_keys import new_sort_key, sort_key_range, sort_key_timestamp, parse_sort_key
+
+
+class TestSortKeys:
+    
+    def test_keys_unique_within_same_microsecond(self):
+        """Test events generated in the same instant never collide"""
+        now = datetime(2024, 1, 15, 10, 30, 0)
+        keys = [new_sort_key(now) for _ in range(1000)]
+        
+        assert len(set(keys)) == 1000
+        assert keys == sorted(keys)
+    
+    def test_keys_unique_across_threads(self):
+        """Test concurrent writers get distinct keys"""
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            keys = list(pool.map(lambda _: new_sort_key(), range(5000)))
+        
+        assert len(set(keys)) == 5000
+    
+    def test_keys_monotonic_when_clock_steps_back(self):
+        """Test keys keep increasing if the clock goes backwards"""
+        with patch('utils.sort_keys.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = datetime(2024, 1, 1, 0, 0, 1)
+            first = new_sort_key()
+            mock_datetime.utcnow.return_value = datetime(2024, 1, 1, 0, 0, 0)
+            second = new_sort_key()
+        
+        assert second > first
+    
+    def test_keys_fit_range_bounds(self):
+        """Test sort_key_range selects keys from both end instants, and nothing after"""
+        start = datetime(2024, 1, 1)
+        end = datetime(2024, 1, 31, 23, 59, 59, 999999)
+        lower, upper = sort_key_range(start, end)
+        
+        assert lower <= new_sort_key(datetime(2024, 1, 1)) <= upper
+        assert lower <= new_sort_key(datetime(2024, 1, 31, 12)) <= upper
+        assert lower <= new_sort_key(end) <= upper
+        assert new_sort_key(end) > end.isoformat()  # a bare ISO upper bound would drop it
+        assert new_sort_key(datetime(2024, 2, 1)) > upper
+    
+    def test_parse_sort_key(self):
+        """Test timestamps are recovered from new and legacy keys"""
+        key = new_sort_key(datetime(2024, 1, 15, 10, 30, 0))
+        
+        assert sort_key_timestamp(key) == '2024-01-15T10:30:00.000000'
+        assert parse_sort_key(key) == datetime(2024, 1, 15, 10, 30, 0)
+        assert parse_sort_key('2024-01-15T10:30:00') == datetime(2024, 1, 15, 10, 30, 0)
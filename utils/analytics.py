@@ -0,0 +1,241 @@
+import heapq
+from datetime import datetime, timedelta
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from utils.money import to_money_units, to_quantity_units
+from utils.sort_keys import sort_key_timestamp
+
+# The dashboard reads one precomputed document from the AnalyticsView table
+VIEW_ID = 'global'
+USAGE_WINDOW_DAYS = 30
+RECENT_ACTIVITY_LIMIT = 10
+RECENT_INVOICE_LIMIT = 10
+RECENT_CUSTOMER_LIMIT = 20
+MAX_VIEW_UPDATE_ATTEMPTS = 10
+
+# Stream sources, keyed by table name without the stage suffix
+SOURCES = {
+    'Invoices': 'invoices',
+    'Customers': 'customers',
+    'UsageEvents': 'usage_events'
+}
+
+INVOICE_SUMMARY_FIELDS = (
+    'invoice_id', 'customer_id', 'customer_name', 'total_amount', 'money_scale',
+    'quantity_scale', 'status', 'created_at', 'due_date'
+)
+
+deserializer = TypeDeserializer()
+
+
+def invoice_total_units(invoice):
+    """Invoice total in money units, for stored and legacy dollar invoices"""
+    total = invoice.get('total_amount', 0)
+    return int(total) if 'money_scale' in invoice else to_money_units(total)
+
+
+def empty_view():
+    """Analytics document before anything has been counted"""
+    return {
+        'total_revenue': 0,
+        'total_invoices': 0,
+        'total_customers': 0,
+        'monthly_revenue': {},
+        'usage_by_day': {},
+        'recent_activities': [],
+        'recent_invoices': [],
+        'recent_customers': []
+    }
+
+
+def empty_delta():
+    """Changes folded from a batch of writes, applied to the view in one update"""
+    delta = empty_view()
+    delta['removed_invoices'] = set()
+    delta['removed_customers'] = set()
+    return delta
+
+
+def keep_recent(entries, order_field, limit, id_field=None):
+    """Newest `limit` entries, the last one folded winning for a repeated id"""
+    if id_field:
+        entries = {entry[id_field]: entry for entry in entries}.values()
+    return heapq.nlargest(limit, entries, key=lambda entry: entry.get(order_field, ''))
+
+
+def fold_recent(delta, field, entry, order_field, limit, id_field=None):
+    """Append to a delta's recent list, trimming it so a delta stays O(limit)
+
+    Only the newest `limit` entries can reach the view, so the list is cut
+    back whenever it doubles; a full-table rebuild then holds a few dozen
+    entries rather than a copy of every item.
+    """
+    delta[field].append(entry)
+    if len(delta[field]) >= 2 * limit:
+        delta[field] = keep_recent(delta[field], order_field, limit, id_field)
+
+
+def fold_change(delta, source, old, new):
+    """Fold one item change (old/new images, either may be None) into a delta"""
+    if source == 'invoices':
+        for image, sign in ((old, -1), (new, 1)):
+            if image:
+                units = invoice_total_units(image)
+                month = image['created_at'][:7]
+                delta['total_revenue'] += sign * units
+                delta['total_invoices'] += sign
+                delta['monthly_revenue'][month] = delta['monthly_revenue'].get(month, 0) + sign * units
+        if new:
+            fold_recent(delta, 'recent_invoices', {k: new[k] for k in INVOICE_SUMMARY_FIELDS if k in new},
+                        'created_at', RECENT_INVOICE_LIMIT, 'invoice_id')
+        else:
+            delta['removed_invoices'].add(old['invoice_id'])
+
+    elif source == 'customers':
+        delta['total_customers'] += (1 if new else 0) - (1 if old else 0)
+        if new:
+            fold_recent(delta, 'recent_customers', dict(new), 'created_at', RECENT_CUSTOMER_LIMIT, 'customer_id')
+        else:
+            delta['removed_customers'].add(old['customer_id'])
+
+    elif source == 'usage_events' and new and not old:
+        # Usage events are append-only; only inserts count
+        day = sort_key_timestamp(new['timestamp'])[:10]
+        usage = delta['usage_by_day'].setdefault(day, {})
+        usage[new['event_type']] = usage.get(new['event_type'], 0) + to_quantity_units(new['quantity'])
+        fold_recent(delta, 'recent_activities', {
+            'type': 'usage_event',
+            'description': f"{new['event_type']} - {new['quantity']} units",
+            'customer_id': new['customer_id'],
+            'timestamp': new['timestamp']
+        }, 'timestamp', RECENT_ACTIVITY_LIMIT)
+
+    return delta
+
+
+def record_source(record):
+    """Which table a DynamoDB Streams record came from"""
+    table_name = record['eventSourceARN'].split(':table/', 1)[1].split('/', 1)[0]
+    return SOURCES.get(table_name.split('-', 1)[0])
+
+
+def deserialize_image(image):
+    """Plain dict from a stream record image in DynamoDB JSON"""
+    if not image:
+        return None
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
+
+
+def iter_stream_changes(records):
+    """(source, old image, new image) for each record from a known source table"""
+    for record in records:
+        source = record_source(record)
+        if source is None:
+            continue
+        images = record['dynamodb']
+        yield source, deserialize_image(images.get('OldImage')), deserialize_image(images.get('NewImage'))
+
+
+def fold_stream_records(records):
+    """Fold a batch of DynamoDB Streams records into one view delta"""
+    delta = empty_delta()
+
+    for source, old, new in iter_stream_changes(records):
+        fold_change(delta, source, old, new)
+
+    return delta
+
+
+def usage_event_inserts(records):
+    """New usage events in a batch of DynamoDB Streams records"""
+    return [
+        new for source, old, new in iter_stream_changes(records)
+        if source == 'usage_events' and new and not old
+    ]
+
+
+def merge_recent(current, added, removed, id_field, order_field, limit):
+    """Newest-first ring buffer with added entries replacing ones with the same id"""
+    added_ids = {entry[id_field] for entry in added}
+    merged = [entry for entry in current if entry[id_field] not in added_ids and entry[id_field] not in removed]
+    merged.extend(entry for entry in added if entry[id_field] not in removed)
+    merged.sort(key=lambda entry: entry.get(order_field, ''), reverse=True)
+    return merged[:limit]
+
+
+def apply_view_delta(view, delta, today=None):
+    """New analytics document with a delta applied and stale usage days dropped"""
+    today = today or datetime.utcnow()
+    oldest_day = (today - timedelta(days=USAGE_WINDOW_DAYS - 1)).strftime('%Y-%m-%d')
+    updated = empty_view()
+
+    for field in ('total_revenue', 'total_invoices', 'total_customers'):
+        updated[field] = int(view.get(field, 0)) + delta[field]
+
+    monthly_revenue = {month: int(units) for month, units in view.get('monthly_revenue', {}).items()}
+    for month, units in delta['monthly_revenue'].items():
+        monthly_revenue[month] = monthly_revenue.get(month, 0) + units
+    updated['monthly_revenue'] = monthly_revenue
+
+    usage_by_day = {
+        day: {event_type: int(units) for event_type, units in usage.items()}
+        for day, usage in view.get('usage_by_day', {}).items() if day >= oldest_day
+    }
+    for day, usage in delta['usage_by_day'].items():
+        if day < oldest_day:
+            continue
+        totals = usage_by_day.setdefault(day, {})
+        for event_type, units in usage.items():
+            totals[event_type] = totals.get(event_type, 0) + units
+    updated['usage_by_day'] = usage_by_day
+
+    updated['recent_activities'] = sorted(
+        list(view.get('recent_activities', [])) + delta['recent_activities'],
+        key=lambda activity: activity['timestamp'], reverse=True
+    )[:RECENT_ACTIVITY_LIMIT]
+    updated['recent_invoices'] = merge_recent(
+        view.get('recent_invoices', []), delta['recent_invoices'], delta.get('removed_invoices', set()),
+        'invoice_id', 'created_at', RECENT_INVOICE_LIMIT
+    )
+    updated['recent_customers'] = merge_recent(
+        view.get('recent_customers', []), delta['recent_customers'], delta.get('removed_customers', set()),
+        'customer_id', 'created_at', RECENT_CUSTOMER_LIMIT
+    )
+
+    return updated
+
+
+def update_analytics_view(view_table, delta, today=None, max_attempts=MAX_VIEW_UPDATE_ATTEMPTS):
+    """Apply a delta to the stored view with an optimistic version check
+
+    Concurrent stream batches (one per shard and source table) race on the
+    same item, so a write only succeeds if the version it read is still
+    current; on conflict the view is re-read and the delta re-applied.
+    """
+    for attempt in range(max_attempts):
+        item = view_table.get_item(Key={'view_id': VIEW_ID}, ConsistentRead=True).get('Item')
+        version = int(item['version']) if item else 0
+
+        updated = apply_view_delta(item or empty_view(), delta, today)
+        updated.update({
+            'view_id': VIEW_ID,
+            'version': version + 1,
+            'updated_at': datetime.utcnow().isoformat()
+        })
+
+        try:
+            if item:
+                view_table.put_item(
+                    Item=updated,
+                    ConditionExpression='#version = :version',
+                    ExpressionAttributeNames={'#version': 'version'},
+                    ExpressionAttributeValues={':version': version}
+                )
+            else:
+                view_table.put_item(Item=updated, ConditionExpression='attribute_not_exists(view_id)')
+            return updated
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    raise RuntimeError(f"Analytics view update lost {max_attempts} version races")
@@ -0,0 +1,239 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from utils import aws
+from utils.cache import TTLCache
+from utils.dynamo import DEFAULT_SCAN_SEGMENTS, batch_write_items, parallel_scan
+from utils.export import DEFAULT_CHUNK_ROWS, chunked_rows, import_pyarrow, iter_usage_events, usage_arrow_table, usage_rows
+from utils.money import to_quantity_units
+from utils.rollups import ALL_CUSTOMERS
+from utils.sort_keys import TIMESTAMP_FORMAT
+
+# Archive layout: usage/month=2024-01/customer_id=<id>/events.parquet, plus a
+# manifest per month written last, so its presence marks the month as archived
+ARCHIVE_PREFIX = 'usage'
+MANIFEST_NAME = '_manifest.json'
+
+# UsageEvents TTL attribute (epoch seconds); DynamoDB deletes expired items
+EXPIRES_AT_ATTRIBUTE = 'expires_at'
+DEFAULT_EXPIRE_AFTER_DAYS = 30
+
+# Manifests of closed months rarely change, and invoices for many customers
+# read the same one, so warm containers keep them briefly
+manifest_cache = TTLCache(maxsize=128, ttl=300)
+
+
+def month_bounds(month):
+    """First and last instant of a `YYYY-MM` month"""
+    start = datetime.strptime(month, '%Y-%m')
+    next_month = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, next_month - timedelta(microseconds=1)
+
+
+def months_between(start, end):
+    """`YYYY-MM` months overlapping a datetime range"""
+    months = []
+    month = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= end:
+        months.append(month.strftime('%Y-%m'))
+        month = month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+    return months
+
+
+def partition_path(month, customer_id):
+    """Archive file holding one customer's events for a month"""
+    return f"{ARCHIVE_PREFIX}/month={month}/customer_id={quote(customer_id, safe='')}/events.parquet"
+
+
+def manifest_path(month):
+    return f'{ARCHIVE_PREFIX}/month={month}/{MANIFEST_NAME}'
+
+
+class ArchiveStore:
+    """Usage archive on the local filesystem or under an `s3://bucket/prefix` url
+
+    Manifests are plain JSON objects; Parquet files go through pyarrow's
+    filesystem layer so reads can fetch only the row groups they need.
+    """
+
+    def __init__(self, url, endpoint_url=None, s3=None):
+        self.url = url.rstrip('/')
+        self.endpoint_url = endpoint_url
+        self._s3 = s3
+        if self.url.startswith('s3://'):
+            self.bucket, _, self.prefix = self.url[len('s3://'):].partition('/')
+        else:
+            self.bucket, self.prefix = None, os.path.abspath(self.url)
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            self._s3 = aws.session().client('s3', endpoint_url=self.endpoint_url) if self.endpoint_url \
+                else aws.client('s3')
+        return self._s3
+
+    def _key(self, path):
+        return f'{self.prefix}/{path}' if self.prefix else path
+
+    def read_json(self, path):
+        """Parsed JSON object at `path`, or None if it does not exist"""
+        if self.bucket is None:
+            try:
+                with open(self._key(path)) as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return None
+        try:
+            return json.loads(self.s3.get_object(Bucket=self.bucket, Key=self._key(path))['Body'].read())
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def write_json(self, path, data):
+        body = json.dumps(data, indent=2, sort_keys=True)
+        if self.bucket is None:
+            os.makedirs(os.path.dirname(self._key(path)), exist_ok=True)
+            with open(self._key(path), 'w') as f:
+                f.write(body)
+        else:
+            self.s3.put_object(Bucket=self.bucket, Key=self._key(path), Body=body.encode())
+
+    def filesystem(self):
+        """(pyarrow filesystem, path prefix) for reading and writing Parquet"""
+        import pyarrow.fs as pafs
+        if self.bucket is None:
+            return pafs.LocalFileSystem(), self.prefix
+        filesystem = pafs.S3FileSystem(endpoint_override=self.endpoint_url) if self.endpoint_url else pafs.S3FileSystem()
+        return filesystem, f'{self.bucket}/{self.prefix}'.rstrip('/')
+
+
+def load_manifest(store, month):
+    """Manifest of an archived month, or None if the month is not archived"""
+    return manifest_cache.get_or_load((store.url, month), lambda: store.read_json(manifest_path(month)))
+
+
+def archive_customer_month(store, usage_table, month, customer_id, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write one customer's events for a month to Parquet, one row group per chunk
+
+    Events are queried in time order, so each row group covers a narrow
+    event_time range and its statistics prune well on read. Returns the
+    manifest entry: row count, usage totals in quantity units and the last
+    sort key archived.
+    """
+    pa, pq = import_pyarrow()
+    filesystem, root = store.filesystem()
+    path = f'{root}/{partition_path(month, customer_id)}'
+    filesystem.create_dir(path.rsplit('/', 1)[0], recursive=True)
+    start, end = month_bounds(month)
+
+    entry = {'rows': 0, 'usage': {}, 'last_sort_key': None}
+    with filesystem.open_output_stream(path) as sink:
+        with pq.ParquetWriter(sink, usage_arrow_table(pa, []).schema, compression='zstd') as writer:
+            for chunk in chunked_rows(usage_rows(iter_usage_events(usage_table, start, end, customer_id)), chunk_rows):
+                writer.write_table(usage_arrow_table(pa, chunk))
+                entry['rows'] += len(chunk)
+                for row in chunk:
+                    entry['usage'][row['event_type']] = entry['usage'].get(row['event_type'], 0) + row['quantity']
+                entry['last_sort_key'] = chunk[-1]['sort_key']
+    return entry
+
+
+def customers_with_usage(rollups_table, month, segments=DEFAULT_SCAN_SEGMENTS):
+    """Customers with daily rollups in a month, found without scanning raw events"""
+    items = parallel_scan(
+        rollups_table, segments,
+        ProjectionExpression='customer_id',
+        FilterExpression=Attr('rollup_key').begins_with(f'day#{month}')
+    )
+    return sorted({item['customer_id'] for item in items} - {ALL_CUSTOMERS})
+
+
+def archive_month(store, usage_table, rollups_table, month, segments=DEFAULT_SCAN_SEGMENTS, progress=None,
+                  overwrite=False):
+    """Archive every customer's events for a closed month and write its manifest
+
+    An archived month is only rewritten with `overwrite`, since its raw
+    events may already have expired from DynamoDB.
+    """
+    if not overwrite and store.read_json(manifest_path(month)) is not None:
+        raise ValueError(f"{month} is already archived")
+
+    manifest = {
+        'month': month,
+        'format': 'parquet',
+        'customers': {}
+    }
+    for customer_id in customers_with_usage(rollups_table, month, segments):
+        manifest['customers'][customer_id] = archive_customer_month(store, usage_table, month, customer_id)
+        if progress:
+            progress(customer_id, manifest['customers'][customer_id])
+
+    manifest['archived_at'] = datetime.utcnow().isoformat()
+    manifest['rows'] = sum(entry['rows'] for entry in manifest['customers'].values())
+    store.write_json(manifest_path(month), manifest)
+    manifest_cache.invalidate((store.url, month))
+    return manifest
+
+
+def expire_archived_events(dynamodb, table_name, usage_table, manifest, expire_after_days=DEFAULT_EXPIRE_AFTER_DAYS):
+    """Set the TTL attribute on every archived event so DynamoDB deletes it
+
+    Only events up to the last sort key recorded in the manifest are
+    touched. Returns the number of events that could not be updated.
+    """
+    expires_at = int(time.time()) + expire_after_days * 86400
+    start, end = month_bounds(manifest['month'])
+    failed = 0
+
+    for customer_id, entry in manifest['customers'].items():
+        if not entry['rows']:
+            continue
+        events = (
+            dict(usage_event, **{EXPIRES_AT_ATTRIBUTE: expires_at})
+            for usage_event in iter_usage_events(usage_table, start, end, customer_id)
+            if usage_event['timestamp'] <= entry['last_sort_key']
+        )
+        for chunk in chunked_rows(events, DEFAULT_CHUNK_ROWS):
+            failed += len(batch_write_items(dynamodb, table_name, chunk, ('customer_id', 'timestamp')))
+
+    return failed
+
+
+def archived_usage_summary(store, customer_id, start, end):
+    """Usage totals in quantity units for a range of archived months
+
+    Returns (usage_summary, total_events), or None if any month in the range
+    has not been archived. Only the customer's partition is opened, and
+    row groups outside the time range are skipped using their statistics.
+    """
+    usage_summary = {}
+    total_events = 0
+    filters = [
+        ('event_time', '>=', start.strftime(TIMESTAMP_FORMAT)),
+        ('event_time', '<=', end.strftime(TIMESTAMP_FORMAT))
+    ]
+
+    for month in months_between(start, end):
+        manifest = load_manifest(store, month)
+        if manifest is None:
+            return None
+        if customer_id not in manifest['customers'] or not manifest['customers'][customer_id]['rows']:
+            continue
+
+        _, pq = import_pyarrow()
+        filesystem, root = store.filesystem()
+        table = pq.read_table(
+            f'{root}/{partition_path(month, customer_id)}', filesystem=filesystem,
+            columns=['event_type', 'quantity'], filters=filters
+        )
+        for batch in table.to_batches():
+            for event_type, quantity in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+                usage_summary[event_type] = usage_summary.get(event_type, 0) + to_quantity_units(quantity)
+                total_events += 1
+
+    return usage_summary, total_events
@@ -0,0 +1,103 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+# Connections per client; concurrent reads and billing run workers share
+# one client, and botocore's default of 10 would make them queue
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32'))
+
+# One boto3 session per container, created on first use. Building the
+# DynamoDB resource loads its service and resource models (~100 ms), so
+# nothing is built at import time and code paths that never touch AWS
+# never pay for it.
+_lock = threading.RLock()
+_session = None
+_clients = {}
+_resources = {}
+
+
+def region():
+    return os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
+
+
+def session():
+    """Shared boto3 session"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session(region_name=region())
+    return _session
+
+
+def client_config():
+    return Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+
+
+def resource(service_name):
+    """Shared boto3 resource, e.g. `resource('dynamodb')`"""
+    if service_name not in _resources:
+        # Sessions are not thread-safe, so creation is serialized
+        with _lock:
+            if service_name not in _resources:
+                _resources[service_name] = session().resource(service_name, config=client_config())
+    return _resources[service_name]
+
+
+def client(service_name):
+    """Shared low-level client; DynamoDB reuses the client under its resource"""
+    if service_name not in _clients:
+        with _lock:
+            if service_name not in _clients:
+                if service_name in _resources:
+                    _clients[service_name] = _resources[service_name].meta.client
+                else:
+                    _clients[service_name] = session().client(service_name, config=client_config())
+    return _clients[service_name]
+
+
+class LazyResource:
+    """Stand-in for a boto3 resource that is only built on first attribute access"""
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+
+    def __getattr__(self, name):
+        return getattr(resource(self.service_name), name)
+
+    def __repr__(self):
+        return f'LazyResource({self.service_name!r})'
+
+
+class LazyTable:
+    """Stand-in for a DynamoDB Table built from the shared resource on first use
+
+    Module-level tables stay cheap to declare (and easy to patch in tests)
+    while the resource model is only loaded by the first real call.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._table = None
+
+    def _resolve(self):
+        if self._table is None:
+            with _lock:
+                if self._table is None:
+                    self._table = resource('dynamodb').Table(self.name)
+        return self._table
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        return f'LazyTable({self.name!r})'
+
+
+def table(name):
+    """Lazily created DynamoDB Table for `name`"""
+    return LazyTable(name)
+
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Marks a cached "item does not exist" result, distinct from a cache miss
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed TTL
+
+    Lives at module level so it survives across warm Lambda invocations.
+    Entries may carry a version (e.g. an item's `updated_at`); `put` never
+    replaces a cached value with an older version, so a slow read racing a
+    write cannot resurrect stale data.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value, or `default` if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, version=None):
+        """Cache a value unless a newer version is already cached"""
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and version is not None and current[2] is not None \
+                    and current[1] > self.clock() and current[2] > version:
+                return
+            self._entries[key] = (value, self.clock() + self.ttl, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a cached value"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every cached value and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def get_or_load(self, key, loader, version_of=None, cache_missing=True):
+        """Return the cached value or call `loader()` and cache its result
+
+        `loader` returns None when the underlying record does not exist; that
+        is cached too unless `cache_missing` is False. `version_of(value)`
+        extracts the version stored alongside a loaded value.
+        """
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        value = loader()
+        if value is not None or cache_missing:
+            self.put(key, value, version_of(value) if version_of and value is not None else None)
+        return value
+
+    def stats(self):
+        """Hit/miss counters for logging and benchmarks"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
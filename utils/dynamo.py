@@ -0,0 +1,297 @@
+import base64
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from botocore.exceptions import ClientError
+
+# DynamoDB accepts at most 25 put/delete requests per BatchWriteItem call
+# and 100 keys (across every table) per BatchGetItem call
+BATCH_WRITE_LIMIT = 25
+BATCH_GET_LIMIT = 100
+MAX_BATCH_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 2.0
+
+# Segments for full-table parallel scans; each segment is read by its own worker
+DEFAULT_SCAN_SEGMENTS = 8
+_SEGMENT_DONE = object()
+
+# Independent reads (and rollup updates) within one request run on a shared
+# pool that lives as long as the container; CONCURRENT_READS=0 runs them one
+# after another
+READ_POOL_WORKERS = int(os.environ.get('READ_POOL_WORKERS', '8'))
+CONCURRENT_READS = os.environ.get('CONCURRENT_READS', '1') != '0'
+_read_pool = None
+_read_pool_lock = threading.Lock()
+
+
+def chunked(items, size):
+    """Yield successive lists of at most `size` items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given retry attempt"""
+    ceiling = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def iter_items(operation, **kwargs):
+    """Yield every item from a paginated query or scan, one page in memory at a time
+
+    `operation` is a bound Table method such as `table.query` or `table.scan`;
+    LastEvaluatedKey is followed until the result set is exhausted.
+    """
+    while True:
+        response = operation(**kwargs)
+        yield from response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def parallel_scan(table, total_segments=DEFAULT_SCAN_SEGMENTS, max_workers=None, **kwargs):
+    """Yield every item of a table from a segmented scan run across a thread pool
+
+    Each of `total_segments` workers follows LastEvaluatedKey through its own
+    Segment and hands pages to the caller through a bounded queue, so items
+    stream out as they arrive (in no particular order) and memory stays at a
+    few pages. Extra keyword arguments such as ProjectionExpression are passed
+    to every scan call. A failing segment raises in the caller; closing the
+    generator early stops the workers.
+    """
+    if total_segments <= 1:
+        yield from iter_items(table.scan, **kwargs)
+        return
+
+    pages = queue.Queue(maxsize=total_segments * 2)
+    stop = threading.Event()
+
+    def put(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan_segment(segment):
+        segment_kwargs = dict(kwargs, Segment=segment, TotalSegments=total_segments)
+        try:
+            while not stop.is_set():
+                response = table.scan(**segment_kwargs)
+                put(response['Items'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+                segment_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SEGMENT_DONE)
+
+    with ThreadPoolExecutor(max_workers=max_workers or total_segments) as pool:
+        for segment in range(total_segments):
+            pool.submit(scan_segment, segment)
+        try:
+            remaining = total_segments
+            while remaining:
+                page = pages.get()
+                if page is _SEGMENT_DONE:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            stop.set()
+
+
+def read_pool():
+    """Thread pool shared by every concurrent read in this container"""
+    global _read_pool
+    if _read_pool is None:
+        with _read_pool_lock:
+            if _read_pool is None:
+                _read_pool = ThreadPoolExecutor(max_workers=READ_POOL_WORKERS, thread_name_prefix='dynamo-read')
+    return _read_pool
+
+
+def gather(*calls, return_exceptions=False):
+    """Run independent zero-argument calls concurrently and return their results in order
+
+    Meant for DynamoDB round trips that do not depend on each other, so a
+    request waits for the slowest read rather than the sum of them. The first
+    call runs on the calling thread and the rest on the shared read pool; the
+    calls must not gather themselves. Every call finishes before anything is
+    raised: the first exception in call order, or with `return_exceptions`
+    the exceptions are returned in place of results.
+    """
+    if not CONCURRENT_READS or len(calls) < 2:
+        futures = []
+    else:
+        futures = [read_pool().submit(call) for call in calls[1:]]
+        calls = calls[:1]
+
+    results = []
+    for call in calls:
+        try:
+            results.append(call())
+        except Exception as e:
+            results.append(e)
+            if not return_exceptions:
+                break
+    wait(futures)
+    for future in futures:
+        error = future.exception()
+        results.append(future.result() if error is None else error)
+
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    return results
+
+
+def encode_page_token(last_evaluated_key):
+    """Opaque, URL-safe cursor for a LastEvaluatedKey (None when there are no more pages)"""
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(',', ':'), sort_keys=True, default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_page_token(token):
+    """Decode a cursor from encode_page_token back into an ExclusiveStartKey
+
+    Raises ValueError for anything that is not a cursor this module issued.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        key = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid next_token') from e
+    if not isinstance(key, dict) or not all(isinstance(v, str) for v in key.values()):
+        raise ValueError('Invalid next_token')
+    return key
+
+
+def query_page(operation, limit, next_token=None, **kwargs):
+    """Read one page of a query, resuming from a `next_token` cursor
+
+    Returns (items, next_token); next_token is None on the last page.
+    """
+    kwargs['Limit'] = limit
+    if next_token:
+        kwargs['ExclusiveStartKey'] = decode_page_token(next_token)
+    response = operation(**kwargs)
+    return response['Items'], encode_page_token(response.get('LastEvaluatedKey'))
+
+
+def batch_write_items(dynamodb, table_name, items, key_names, max_attempts=MAX_BATCH_ATTEMPTS):
+    """Write items with BatchWriteItem, retrying UnprocessedItems with backoff
+
+    Returns a dict mapping the index of every item that could not be written
+    to the reason it failed. An empty dict means every item was stored.
+    """
+    failed = {}
+
+    for chunk in chunked(list(enumerate(items)), BATCH_WRITE_LIMIT):
+        # Unprocessed items come back without their position, so track them by key
+        pending = {
+            tuple(item[name] for name in key_names): index
+            for index, item in chunk
+        }
+        requests = [{'PutRequest': {'Item': item}} for _, item in chunk]
+
+        for attempt in range(max_attempts):
+            try:
+                response = dynamodb.batch_write_item(RequestItems={table_name: requests})
+            except ClientError as e:
+                for index in pending.values():
+                    failed[index] = e.response['Error'].get('Message', str(e))
+                pending = {}
+                break
+
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            unprocessed_keys = {
+                tuple(request['PutRequest']['Item'][name] for name in key_names)
+                for request in requests
+            }
+            pending = {key: index for key, index in pending.items() if key in unprocessed_keys}
+
+            if not requests:
+                break
+            if attempt + 1 < max_attempts:
+                time.sleep(backoff_delay(attempt))
+
+        for index in pending.values():
+            failed[index] = 'Unprocessed after retries'
+
+    return failed
+
+
+def key_id(key):
+    """Hashable identity of a key dict, e.g. {'client_id': 'c1'} -> (('client_id', 'c1'),)"""
+    return tuple(sorted(key.items()))
+
+
+def batch_get_items(dynamodb, keys_by_table, max_attempts=MAX_BATCH_ATTEMPTS):
+    """Read items from one or more tables with BatchGetItem, retrying UnprocessedKeys with backoff
+
+    `keys_by_table` maps table names to lists of key dicts; duplicate keys
+    are read once. Requests of up to 100 keys are issued concurrently (see
+    gather). Returns (found, failed): `found` maps each table name to
+    {key_id(key): item} for the items that exist, and `failed` maps table
+    names to {key_id(key): reason} for keys that could not be read. A key
+    in neither does not exist.
+    """
+    requested = [
+        (table_name, key)
+        for table_name, keys in keys_by_table.items()
+        for key in {key_id(key): key for key in keys}.values()
+    ]
+    found = {table_name: {} for table_name in keys_by_table}
+    failed = {table_name: {} for table_name in keys_by_table}
+
+    def read_chunk(chunk):
+        pending = {}
+        for table_name, key in chunk:
+            pending.setdefault(table_name, {'Keys': []})['Keys'].append(key)
+        key_names = {table_name: list(key) for table_name, key in chunk}
+        items = []
+
+        for attempt in range(max_attempts):
+            try:
+                response = dynamodb.batch_get_item(RequestItems=pending)
+            except ClientError as e:
+                reason = e.response['Error'].get('Message', str(e))
+                break
+            for table_name, table_items in response.get('Responses', {}).items():
+                for item in table_items:
+                    items.append((table_name, key_id({name: item[name] for name in key_names[table_name]}), item))
+
+            pending = response.get('UnprocessedKeys') or {}
+            if not pending:
+                break
+            reason = 'Unprocessed after retries'
+            if attempt + 1 < max_attempts:
+                time.sleep(backoff_delay(attempt))
+
+        failures = [(table_name, key_id(key), reason) for table_name, request in pending.items()
+                    for key in request['Keys']]
+        return items, failures
+
+    for items, failures in gather(*[
+        lambda chunk=chunk: read_chunk(chunk) for chunk in chunked(requested, BATCH_GET_LIMIT)
+    ]):
+        for table_name, item_key, item in items:
+            found[table_name][item_key] = item
+        for table_name, item_key, reason in failures:
+            failed[table_name][item_key] = reason
+
+    return found, failed
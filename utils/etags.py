@@ -0,0 +1,62 @@
+import hashlib
+
+# Headers the dashboard needs to revalidate cross-origin: it sends
+# If-None-Match and must be able to read the ETag it gets back
+CORS_VALIDATOR_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag'
+}
+
+
+def _etag(data):
+    return '"' + hashlib.blake2b(data.encode(), digest_size=16).hexdigest() + '"'
+
+
+def version_etag(*parts):
+    """Strong ETag from the versions a response is built from, e.g. an item's `updated_at`"""
+    return _etag('\x1f'.join(str(part) for part in parts))
+
+
+def content_etag(body):
+    """Strong ETag from a serialized response body"""
+    return _etag(body)
+
+
+def request_header(event, name):
+    """Request header value by case-insensitive name, or None"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def etag_matches(event, etag):
+    """Whether the request's If-None-Match already names `etag`
+
+    If-None-Match uses the weak comparison, so a `W/` prefix added by a
+    proxy or CDN still matches.
+    """
+    header = request_header(event, 'If-None-Match')
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    return '*' in candidates or etag in (candidate.removeprefix('W/') for candidate in candidates)
+
+
+def not_modified(etag, cache_control):
+    """304 response: the client's copy is current, so no body is built or sent"""
+    return {
+        'statusCode': 304,
+        'headers': {**CORS_VALIDATOR_HEADERS, 'ETag': etag, 'Cache-Control': cache_control},
+        'body': ''
+    }
+
+
+def with_validators(response, etag, cache_control):
+    """Add ETag and Cache-Control headers to a response"""
+    response['headers'] = {
+        **response.get('headers', {}), **CORS_VALIDATOR_HEADERS,
+        'ETag': etag, 'Cache-Control': cache_control
+    }
+    return response
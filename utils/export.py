@@ -0,0 +1,226 @@
+import csv
+import io
+import json
+import time
+from decimal import Decimal
+from boto3.dynamodb.conditions import Attr, Key
+from utils.dynamo import DEFAULT_SCAN_SEGMENTS, iter_items, parallel_scan
+from utils.money import quantity_json, to_quantity_units
+from utils.sort_keys import sort_key_range, sort_key_timestamp
+
+EXPORT_FORMATS = ('ndjson', 'csv', 'parquet')
+EXPORT_COLUMNS = ('customer_id', 'event_type', 'quantity', 'event_time', 'sort_key', 'metadata')
+
+# Rows encoded and written per chunk (one Parquet row group); memory is
+# bounded by this and the scan's in-flight pages, not by the export size
+DEFAULT_CHUNK_ROWS = 10000
+
+# S3 multipart parts must be at least 5 MiB, except the last
+S3_PART_BYTES = 8 * 1024 * 1024
+
+
+def iter_usage_events(usage_table, start, end, customer_id=None, segments=DEFAULT_SCAN_SEGMENTS):
+    """Usage events between two datetimes (inclusive)
+
+    One customer's events come from a key-range query in time order; a
+    whole-tenant export reads every customer with a parallel segmented scan.
+    """
+    start_key, end_key = sort_key_range(start, end)
+    if customer_id:
+        return iter_items(
+            usage_table.query,
+            KeyConditionExpression=Key('customer_id').eq(customer_id) & Key('timestamp').between(start_key, end_key)
+        )
+    return parallel_scan(usage_table, segments, FilterExpression=Attr('timestamp').between(start_key, end_key))
+
+
+def usage_rows(usage_events):
+    """Flat export rows from UsageEvents items, with quantities in quantity units"""
+    for usage_event in usage_events:
+        yield {
+            'customer_id': usage_event['customer_id'],
+            'event_type': usage_event['event_type'],
+            'quantity': to_quantity_units(usage_event['quantity']),
+            'event_time': sort_key_timestamp(usage_event['timestamp']),
+            'sort_key': usage_event['timestamp'],
+            'metadata': usage_event.get('metadata') or {}
+        }
+
+
+def chunked_rows(rows, size):
+    """Yield successive lists of at most `size` rows from any iterable"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_ndjson(chunk):
+    """One JSON object per line"""
+    return ''.join(
+        json.dumps(dict(row, quantity=quantity_json(row['quantity'])), default=str) + '\n' for row in chunk
+    ).encode()
+
+
+def encode_csv(chunk, header=False):
+    """CSV lines, metadata as a JSON string"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    if header:
+        writer.writeheader()
+    for row in chunk:
+        writer.writerow(dict(
+            row, quantity=quantity_json(row['quantity']), metadata=json.dumps(row['metadata'], default=str)
+        ))
+    return buffer.getvalue().encode()
+
+
+def write_text(chunks, sink, export_format):
+    """Encode and write NDJSON or CSV chunks, yielding the rows in each"""
+    for index, chunk in enumerate(chunks):
+        if export_format == 'csv':
+            sink.write(encode_csv(chunk, header=index == 0))
+        else:
+            sink.write(encode_ndjson(chunk))
+        yield len(chunk)
+
+
+def import_pyarrow():
+    """(pyarrow, pyarrow.parquet), imported on first use since pyarrow is optional"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet support requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+
+def usage_arrow_table(pa, rows):
+    """Arrow table of export rows; quantities keep the 0.001 billing precision exactly"""
+    schema = pa.schema([
+        ('customer_id', pa.string()),
+        ('event_type', pa.string()),
+        ('quantity', pa.decimal128(18, 3)),
+        ('event_time', pa.string()),
+        ('sort_key', pa.string()),
+        ('metadata', pa.string())
+    ])
+    return pa.Table.from_pylist([
+        dict(row, quantity=Decimal(row['quantity']).scaleb(-3), metadata=json.dumps(row['metadata'], default=str))
+        for row in rows
+    ], schema=schema)
+
+
+def write_parquet(chunks, sink):
+    """Write chunks as zstd-compressed Parquet row groups, yielding the rows in each"""
+    pa, pq = import_pyarrow()
+    with pq.ParquetWriter(sink, usage_arrow_table(pa, []).schema, compression='zstd') as writer:
+        for chunk in chunks:
+            writer.write_table(usage_arrow_table(pa, chunk))
+            yield len(chunk)
+
+
+def export_usage(usage_events, export_format, sink, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None):
+    """Stream usage events into a writable binary `sink`, one chunk at a time
+
+    `progress(rows, seconds)` is called after every chunk. Returns the row
+    count, elapsed seconds and throughput in rows per second.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+    started = time.perf_counter()
+    chunks = chunked_rows(usage_rows(usage_events), chunk_rows)
+    if export_format == 'parquet':
+        written = write_parquet(chunks, sink)
+    else:
+        written = write_text(chunks, sink, export_format)
+
+    rows = 0
+    for count in written:
+        rows += count
+        if progress:
+            progress(rows, time.perf_counter() - started)
+
+    seconds = time.perf_counter() - started
+    return {'rows': rows, 'seconds': round(seconds, 3), 'rows_per_second': round(rows / seconds, 1) if seconds else 0.0}
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """Writable stream that uploads to S3 (or an S3-compatible store) in parts
+
+    At most one part is buffered in memory. Exports smaller than a part are
+    sent with a single put_object; `abort()` discards an unfinished upload.
+    """
+
+    def __init__(self, s3, bucket, key, part_bytes=S3_PART_BYTES):
+        super().__init__()
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_bytes = part_bytes
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = None
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.part_bytes:
+            self._upload_part(bytes(self.buffer[:self.part_bytes]))
+            del self.buffer[:self.part_bytes]
+        return len(data)
+
+    def _upload_part(self, data):
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=data
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            else:
+                if self.buffer:
+                    self._upload_part(bytes(self.buffer))
+                self.s3.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                    MultipartUpload={'Parts': self.parts}
+                )
+        finally:
+            self.buffer = bytearray()
+            super().close()
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        self.upload_id = None
+        self.buffer = bytearray()
+        super().close()
+
+
+def open_sink(target, s3=None):
+    """Writable binary stream for a local path or an `s3://bucket/key` url"""
+    if target.startswith('s3://'):
+        bucket, _, key = target[len('s3://'):].partition('/')
+        if not bucket or not key:
+            raise ValueError(f"Invalid S3 target: {target}")
+        return S3MultipartWriter(s3, bucket, key)
+    return open(target, 'wb')
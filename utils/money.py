@@ -0,0 +1,86 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+
+# Fixed-point scales used for every amount the billing path touches:
+# quantities in thousandths of a unit, money and rates in millionths of a dollar
+QUANTITY_SCALE = 1000
+MONEY_SCALE = 1000000
+
+# Response fields holding each kind of fixed-point value
+QUANTITY_FIELDS = frozenset({
+    'usage', 'limit', 'overage', 'total_quantity', 'free_quantity', 'billable_quantity'
+})
+MONEY_FIELDS = frozenset({'monthly_fee', 'rate', 'cost', 'total_cost', 'total_amount'})
+
+
+def to_units(value, scale):
+    """Convert a number to an integer count of 1/scale, rounded half-even"""
+    if type(value) is int:
+        return value * scale
+    return int((Decimal(str(value)) * scale).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def to_quantity_units(quantity):
+    """Convert a quantity to integer thousandths of a unit"""
+    return to_units(quantity, QUANTITY_SCALE)
+
+
+def to_money_units(amount):
+    """Convert a money amount or rate to integer millionths of a dollar"""
+    return to_units(amount, MONEY_SCALE)
+
+
+def from_quantity_units(units):
+    """Convert integer thousandths of a unit back to a Decimal quantity"""
+    return Decimal(int(units)).scaleb(-3)
+
+
+def from_money_units(units):
+    """Convert integer millionths of a dollar back to a Decimal amount"""
+    return Decimal(int(units)).scaleb(-6)
+
+
+def multiply_units(quantity_units, rate_units):
+    """Cost in money units of quantity x rate, rounded half-even
+
+    Works on ints and element-wise on numpy arrays. The whole-unit part is
+    multiplied exactly; only the fractional thousandths need dividing, which
+    keeps int64 products far from overflow.
+    """
+    whole, fraction = divmod(quantity_units, QUANTITY_SCALE)
+    quotient, remainder = divmod(fraction * rate_units, QUANTITY_SCALE)
+    round_up = (remainder * 2 > QUANTITY_SCALE) | ((remainder * 2 == QUANTITY_SCALE) & (quotient % 2 == 1))
+    return whole * rate_units + quotient + round_up
+
+
+def quantity_json(units):
+    """JSON number for a quantity; whole quantities stay integers"""
+    whole, fraction = divmod(int(units), QUANTITY_SCALE)
+    return whole if not fraction else float(from_quantity_units(units))
+
+
+def money_json(units):
+    """JSON number in dollars for a money amount"""
+    return float(from_money_units(units))
+
+
+def units_to_json(value):
+    """Copy of a billing result with fixed-point fields as JSON numbers
+
+    Walks nested dicts and lists and converts integer fields named in
+    QUANTITY_FIELDS or MONEY_FIELDS (DynamoDB returns stored integers as
+    Decimal); everything else is left as is.
+    """
+    if isinstance(value, list):
+        return [units_to_json(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    converted = {}
+    for key, item in value.items():
+        if key in MONEY_FIELDS and isinstance(item, (int, Decimal)):
+            converted[key] = money_json(item)
+        elif key in QUANTITY_FIELDS and isinstance(item, (int, Decimal)):
+            converted[key] = quantity_json(item)
+        else:
+            converted[key] = units_to_json(item)
+    return converted
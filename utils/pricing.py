@@ -1,5 +1,8 @@
+from bisect import bisect_left
+from types import MappingProxyType
 from decimal import Decimal
 from datetime import datetime
+from utils.money import to_quantity_units, to_money_units, multiply_units
 
 # Squill's subscription tiers for client companies
 SUBSCRIPTION_TIERS = {
@@ -60,68 +63,261 @@ DEFAULT_CLIENT_PRICING = {
     }
 }
 
-def calculate_squill_billing(subscription_tier, usage_data):
-    """Calculate what Squill charges a client company"""
-    if subscription_tier not in SUBSCRIPTION_TIERS:
+PRICING_MODES = ('graduated', 'volume')
+
+def freeze(instance, **fields):
+    """Set the slots of an immutable plan object"""
+    for name, value in fields.items():
+        object.__setattr__(instance, name, value)
+
+def frozen_setattr(instance, name, value):
+    raise AttributeError(f"{type(instance).__name__} is immutable")
+
+class CompiledTiers:
+    """Pricing tiers compiled into sorted breakpoints for O(log n) evaluation
+
+    `bounds[i]` is the inclusive upper quantity of tier i (the last tier is
+    unbounded and has no entry), `starts[i]` where it begins and
+    `cumulative[i]` the graduated cost of every quantity below `starts[i]`.
+    Quantities are integer quantity units and rates and costs integer money
+    units (see utils.money).
+    """
+    __slots__ = ('mode', 'bounds', 'starts', 'rates', 'cumulative')
+
+    def __init__(self, tiers, mode='graduated'):
+        if mode not in PRICING_MODES:
+            raise ValueError(f"Invalid pricing mode: {mode}")
+        if not tiers or tiers[-1].get('up_to') is not None:
+            raise ValueError("The last pricing tier must have up_to: null")
+
+        bounds = []
+        starts = []
+        rates = []
+        cumulative = []
+
+        start = 0
+        cost = 0
+        for tier in tiers:
+            rate = to_money_units(tier['rate'])
+            starts.append(start)
+            rates.append(rate)
+            cumulative.append(cost)
+            if tier.get('up_to') is None:
+                break
+            up_to = to_quantity_units(tier['up_to'])
+            if up_to <= start:
+                raise ValueError("Pricing tier bounds must be strictly increasing")
+            bounds.append(up_to)
+            cost += multiply_units(up_to - start, rate)
+            start = up_to
+
+        freeze(self, mode=mode, bounds=tuple(bounds), starts=tuple(starts),
+               rates=tuple(rates), cumulative=tuple(cumulative))
+
+    __setattr__ = frozen_setattr
+
+    def tier_index(self, quantity):
+        """Index of the tier containing `quantity`"""
+        return bisect_left(self.bounds, quantity)
+
+    def cost(self, quantity):
+        """Price a total quantity in quantity units"""
+        if quantity <= 0:
+            return 0
+        index = self.tier_index(quantity)
+        if self.mode == 'volume':
+            return multiply_units(quantity, self.rates[index])
+        return self.cumulative[index] + multiply_units(quantity - self.starts[index], self.rates[index])
+
+    def free_quantity(self, quantity):
+        """Portion of `quantity` that is not charged for
+
+        Graduated tiers give away whatever falls in the leading zero-rate
+        tiers. Volume tiers charge every unit at the rate where `quantity`
+        lands, so it is all free inside a zero-rate tier and none of it past.
+        """
+        if self.mode == 'volume':
+            return max(0, quantity) if self.rates[self.tier_index(quantity)] == 0 else 0
+        free_limit = 0
+        for bound, rate in zip(self.bounds, self.rates):
+            if rate != 0:
+                break
+            free_limit = bound
+        return max(0, min(quantity, free_limit))
+
+def compile_pricing_rule(rule):
+    """Compile a client pricing rule into CompiledTiers
+
+    Rules are either flat (`rate` plus optional `free_tier`) or tiered
+    (`tiers` list of `{up_to, rate}` with an optional `mode` of graduated
+    or volume). A flat rule is the graduated pair [free_tier @ 0, rest @ rate].
+    """
+    if 'tiers' in rule:
+        return CompiledTiers(rule['tiers'], rule.get('mode', 'graduated'))
+
+    free_tier = rule.get('free_tier', 0)
+    tiers = [{'up_to': None, 'rate': rule['rate']}]
+    if free_tier:
+        tiers.insert(0, {'up_to': free_tier, 'rate': 0})
+    return CompiledTiers(tiers)
+
+class ClientRule:
+    """One event type's pricing, with the rate and free tier parsed once into units"""
+    __slots__ = ('rate', 'free_tier', 'tiers')
+
+    def __init__(self, rule):
+        tiers = compile_pricing_rule(rule)
+        if 'tiers' in rule:
+            freeze(self, rate=None, free_tier=None, tiers=tiers)
+        else:
+            freeze(self, rate=to_money_units(rule['rate']),
+                   free_tier=to_quantity_units(rule.get('free_tier', 0)), tiers=tiers)
+
+    __setattr__ = frozen_setattr
+
+class ClientPlan:
+    """A client's pricing rules compiled once for repeated billing calls"""
+    __slots__ = ('rules', 'version')
+
+    def __init__(self, pricing_rules, version=None):
+        rules = {event_type: ClientRule(rule) for event_type, rule in pricing_rules.items()}
+        freeze(self, rules=MappingProxyType(rules), version=version)
+
+    __setattr__ = frozen_setattr
+
+class SubscriptionPlan:
+    """A subscription tier compiled once into integer units
+
+    Unlimited metrics are left out of `limits`, so billing never compares
+    against float('inf'). Optional graduated `overage_tiers` per metric
+    replace the flat overage rate, e.g.
+    {'api_calls': [{'up_to': 50000, 'rate': '0.0008'}, {'up_to': None, 'rate': '0.0005'}]}
+    """
+    __slots__ = ('name', 'monthly_fee', 'limits', 'overage_rates', 'overage_tiers')
+
+    def __init__(self, name, config):
+        limits = {
+            metric: to_quantity_units(limit) for metric, limit in config['limits'].items()
+            if limit != float('inf')
+        }
+        overage_rates = {
+            metric: to_money_units(rate) for metric, rate in config['overage_rates'].items()
+        }
+        overage_tiers = {
+            metric: CompiledTiers(tiers)
+            for metric, tiers in config.get('overage_tiers', {}).items()
+        }
+        freeze(
+            self,
+            name=name,
+            monthly_fee=to_money_units(config['monthly_fee']),
+            limits=MappingProxyType(limits),
+            overage_rates=MappingProxyType(overage_rates),
+            overage_tiers=MappingProxyType(overage_tiers)
+        )
+
+    __setattr__ = frozen_setattr
+
+def compile_client_plan(pricing_rules, version=None):
+    """Compile client pricing rules; empty rules mean the default plan"""
+    if isinstance(pricing_rules, ClientPlan):
+        return pricing_rules
+    if not pricing_rules:
+        return DEFAULT_CLIENT_PLAN
+    return ClientPlan(pricing_rules, version)
+
+def get_subscription_plan(subscription_tier):
+    """Compiled plan for a tier name (plans pass through)"""
+    if isinstance(subscription_tier, SubscriptionPlan):
+        return subscription_tier
+    plan = SUBSCRIPTION_PLANS.get(subscription_tier)
+    if plan is None:
         raise ValueError(f"Invalid subscription tier: {subscription_tier}")
+    return plan
+
+def calculate_squill_billing(subscription_tier, usage_data):
+    """Calculate what Squill charges a client company
     
-    tier_config = SUBSCRIPTION_TIERS[subscription_tier]
-    monthly_fee = tier_config['monthly_fee']
-    limits = tier_config['limits']
-    overage_rates = tier_config['overage_rates']
+    `subscription_tier` is a tier name or a precompiled SubscriptionPlan and
+    `usage_data` maps metrics to quantity units. Every quantity in the result
+    is in quantity units and every amount in money units.
+    """
+    plan = get_subscription_plan(subscription_tier)
+    limits = plan.limits
     
-    total_cost = monthly_fee
+    total_cost = plan.monthly_fee
     overages = {}
     
     for metric, usage in usage_data.items():
-        if metric in limits:
-            limit = limits[metric]
-            if usage > limit and limit != float('inf'):
-                overage = usage - limit
-                overage_cost = overage * overage_rates[metric]
-                overages[metric] = {
-                    'usage': usage,
-                    'limit': limit,
-                    'overage': overage,
-                    'rate': overage_rates[metric],
-                    'cost': overage_cost
-                }
-                total_cost += overage_cost
+        limit = limits.get(metric)
+        if limit is not None and usage > limit:
+            overage = usage - limit
+            overage_tiers = plan.overage_tiers.get(metric)
+            if overage_tiers:
+                overage_cost = overage_tiers.cost(overage)
+                rate = overage_tiers.rates[overage_tiers.tier_index(overage)]
+            else:
+                rate = plan.overage_rates[metric]
+                overage_cost = multiply_units(overage, rate)
+            overages[metric] = {
+                'usage': usage,
+                'limit': limit,
+                'overage': overage,
+                'rate': rate,
+                'cost': overage_cost
+            }
+            total_cost += overage_cost
     
     return {
-        'subscription_tier': subscription_tier,
-        'monthly_fee': monthly_fee,
+        'subscription_tier': plan.name,
+        'monthly_fee': plan.monthly_fee,
         'overages': overages,
         'total_cost': total_cost
     }
 
 def calculate_client_billing(pricing_rules, usage_events):
-    """Calculate what a client company charges their customers"""
-    if not pricing_rules:
-        pricing_rules = DEFAULT_CLIENT_PRICING
+    """Calculate what a client company charges their customers
+    
+    `pricing_rules` is a rules dict, a precompiled ClientPlan, or None for
+    the default pricing. `usage_events` maps event types to lists of
+    quantity units; the result is in quantity and money units.
+    """
+    plan = compile_client_plan(pricing_rules)
     
     billing_details = {}
-    total_cost = Decimal('0.00')
+    total_cost = 0
     
     for event_type, events in usage_events.items():
-        if event_type not in pricing_rules:
+        rule = plan.rules.get(event_type)
+        if rule is None:
             continue
-            
-        rule = pricing_rules[event_type]
-        rate = Decimal(str(rule['rate']))
-        free_tier = rule.get('free_tier', 0)
         
         total_quantity = sum(events)
-        billable_quantity = max(0, total_quantity - free_tier)
-        event_cost = billable_quantity * rate
         
-        billing_details[event_type] = {
-            'total_quantity': total_quantity,
-            'free_quantity': min(total_quantity, free_tier),
-            'billable_quantity': billable_quantity,
-            'rate': rate,
-            'cost': event_cost
-        }
+        if rule.rate is None:
+            tiers = rule.tiers
+            event_cost = tiers.cost(total_quantity)
+            free_quantity = tiers.free_quantity(total_quantity) if total_quantity > 0 else 0
+            billing_details[event_type] = {
+                'total_quantity': total_quantity,
+                'free_quantity': free_quantity,
+                'billable_quantity': total_quantity - free_quantity,
+                'pricing_mode': tiers.mode,
+                'rate': tiers.rates[tiers.tier_index(total_quantity)],
+                'cost': event_cost
+            }
+        else:
+            free_tier = rule.free_tier
+            billable_quantity = max(0, total_quantity - free_tier)
+            event_cost = multiply_units(billable_quantity, rule.rate)
+            
+            billing_details[event_type] = {
+                'total_quantity': total_quantity,
+                'free_quantity': min(total_quantity, free_tier),
+                'billable_quantity': billable_quantity,
+                'rate': rule.rate,
+                'cost': event_cost
+            }
         
         total_cost += event_cost
     
@@ -131,23 +327,23 @@ def calculate_client_billing(pricing_rules, usage_events):
     }
 
 def validate_subscription_limits(subscription_tier, current_usage):
-    """Check if usage is within subscription limits"""
-    if subscription_tier not in SUBSCRIPTION_TIERS:
-        return False, f"Invalid subscription tier: {subscription_tier}"
+    """Check if usage (in quantity units) is within subscription limits"""
+    try:
+        limits = get_subscription_plan(subscription_tier).limits
+    except ValueError as e:
+        return False, str(e)
     
-    limits = SUBSCRIPTION_TIERS[subscription_tier]['limits']
     violations = []
     
     for metric, usage in current_usage.items():
-        if metric in limits:
-            limit = limits[metric]
-            if limit != float('inf') and usage > limit:
-                violations.append({
-                    'metric': metric,
-                    'usage': usage,
-                    'limit': limit,
-                    'overage': usage - limit
-                })
+        limit = limits.get(metric)
+        if limit is not None and usage > limit:
+            violations.append({
+                'metric': metric,
+                'usage': usage,
+                'limit': limit,
+                'overage': usage - limit
+            })
     
     return len(violations) == 0, violations
 
@@ -156,4 +352,100 @@ def get_pricing_tier_info(tier):
     if tier not in SUBSCRIPTION_TIERS:
         return None
     
-    return SUBSCRIPTION_TIERS[tier]
\ No newline at end of file
+    return SUBSCRIPTION_TIERS[tier]
+
+# Built-in plans compiled once at import
+SUBSCRIPTION_PLANS = {name: SubscriptionPlan(name, config) for name, config in SUBSCRIPTION_TIERS.items()}
+DEFAULT_CLIENT_PLAN = ClientPlan(DEFAULT_CLIENT_PRICING)
+
+
+def tiered_cost_units(tiers, quantity_units):
+    """Vectorized CompiledTiers.cost over an array of quantity units"""
+    import numpy as np
+
+    bounds = np.array(tiers.bounds, dtype=np.int64)
+    starts = np.array(tiers.starts, dtype=np.int64)
+    rates = np.array(tiers.rates, dtype=np.int64)
+    cumulative = np.array(tiers.cumulative, dtype=np.int64)
+
+    quantity = np.maximum(np.asarray(quantity_units, dtype=np.int64), 0)
+    index = np.searchsorted(bounds, quantity, side='left')
+    if tiers.mode == 'volume':
+        return multiply_units(quantity, rates[index])
+    return cumulative[index] + multiply_units(quantity - starts[index], rates[index])
+
+def calculate_client_billing_batch(pricing_rules, event_types, quantity_units):
+    """Price N customers x M event types in one vectorized pass
+
+    `quantity_units` is an N x M integer array of each customer's total
+    quantity per event type in thousandths of a unit (see to_quantity_units),
+    with columns ordered as `event_types`. Flat and tiered rules are both
+    evaluated with a vectorized searchsorted over the compiled breakpoints.
+    Returns integer money units: an N x M array of line costs and an N array
+    of invoice totals. Each line equals calculate_client_billing's cost.
+    """
+    import numpy as np
+
+    plan = compile_client_plan(pricing_rules)
+
+    quantities = np.asarray(quantity_units, dtype=np.int64).reshape(-1, len(event_types))
+    costs = np.zeros(quantities.shape, dtype=np.int64)
+    for column, event_type in enumerate(event_types):
+        # Event types without a rule are not billed, matching the scalar engine
+        rule = plan.rules.get(event_type)
+        if rule is None:
+            continue
+        costs[:, column] = tiered_cost_units(rule.tiers, quantities[:, column])
+    
+    return {
+        'event_types': list(event_types),
+        'costs': costs,
+        'total_costs': costs.sum(axis=1)
+    }
+
+def calculate_squill_billing_batch(subscription_tiers, metrics, usage_units):
+    """Price what Squill charges N clients in one vectorized pass
+
+    `subscription_tiers` lists each client's tier and `usage_units` is an
+    N x K integer array of usage in thousandths of a unit, with columns
+    ordered as `metrics`. Returns integer money units for the overage per
+    metric (N x K) and each client's total including the monthly fee.
+    """
+    import numpy as np
+
+    tier_names = list(SUBSCRIPTION_PLANS)
+    try:
+        tier_index = np.array([tier_names.index(tier) for tier in subscription_tiers], dtype=np.int64)
+    except ValueError:
+        invalid = next(tier for tier in subscription_tiers if tier not in SUBSCRIPTION_PLANS)
+        raise ValueError(f"Invalid subscription tier: {invalid}")
+
+    plans = [SUBSCRIPTION_PLANS[tier] for tier in tier_names]
+    fees = np.array([plan.monthly_fee for plan in plans], dtype=np.int64)
+    # Unlimited or unknown metrics never incur overage
+    limits = np.full((len(plans), len(metrics)), np.iinfo(np.int64).max, dtype=np.int64)
+    rates = np.zeros((len(plans), len(metrics)), dtype=np.int64)
+    for row, plan in enumerate(plans):
+        for column, metric in enumerate(metrics):
+            if metric in plan.limits:
+                limits[row, column] = plan.limits[metric]
+                rates[row, column] = plan.overage_rates[metric]
+
+    usage = np.asarray(usage_units, dtype=np.int64).reshape(-1, len(metrics))
+    overage = np.maximum(usage - limits[tier_index], 0)
+    overage_costs = multiply_units(overage, rates[tier_index])
+    
+    # Graduated overage tiers replace the flat rate for their tier and metric
+    for row, plan in enumerate(plans):
+        for metric, tiers in plan.overage_tiers.items():
+            if metric not in metrics:
+                continue
+            rows = tier_index == row
+            column = list(metrics).index(metric)
+            overage_costs[rows, column] = tiered_cost_units(tiers, overage[rows, column])
+
+    return {
+        'metrics': list(metrics),
+        'overage_costs': overage_costs,
+        'total_costs': fees[tier_index] + overage_costs.sum(axis=1)
+    }
@@ -0,0 +1,114 @@
+from decimal import Decimal
+from functools import partial
+from boto3.dynamodb.conditions import Key
+from utils.dynamo import gather, iter_items
+from utils.money import to_quantity_units
+from utils.sort_keys import parse_sort_key
+
+# Bucket formats per rollup granularity; both sort lexicographically in time order
+GRANULARITIES = {
+    'hour': '%Y-%m-%dT%H',
+    'day': '%Y-%m-%d'
+}
+
+# Pseudo customer whose daily items hold the platform-wide usage sketches.
+# Ingestion does not ADD into it: one item per day and event type for the
+# whole platform would be a hot key, and nothing reads its totals.
+ALL_CUSTOMERS = '#all'
+
+
+def rollup_key(granularity, bucket, event_type):
+    """Build the UsageRollups sort key, e.g. `day#2024-01-15#api_call`"""
+    return f'{granularity}#{bucket}#{event_type}'
+
+
+def aggregate_rollups(usage_events):
+    """Fold usage events into rollup deltas
+
+    Returns {(customer_id, rollup_key): {'quantity': Decimal, 'event_count': int}}
+    with one hourly and one daily entry per customer and event type.
+    """
+    deltas = {}
+
+    for usage_event in usage_events:
+        event_time = parse_sort_key(usage_event['timestamp'])
+        event_type = usage_event['event_type']
+        customer_id = usage_event['customer_id']
+
+        for granularity, fmt in GRANULARITIES.items():
+            key = (customer_id, rollup_key(granularity, event_time.strftime(fmt), event_type))
+            if key not in deltas:
+                deltas[key] = {'quantity': Decimal('0'), 'event_count': 0}
+            deltas[key]['quantity'] += Decimal(str(usage_event['quantity']))
+            deltas[key]['event_count'] += 1
+
+    return deltas
+
+
+def update_rollup(rollups_table, customer_id, key, delta):
+    """ADD one rollup delta into its UsageRollups item"""
+    granularity, bucket, event_type = key.split('#', 2)
+    rollups_table.update_item(
+        Key={'customer_id': customer_id, 'rollup_key': key},
+        UpdateExpression='SET #granularity = :granularity, #bucket = :bucket, #event_type = :event_type '
+                         'ADD #quantity :quantity, #event_count :event_count',
+        ExpressionAttributeNames={
+            '#granularity': 'granularity',
+            '#bucket': 'bucket',
+            '#event_type': 'event_type',
+            '#quantity': 'quantity',
+            '#event_count': 'event_count'
+        },
+        ExpressionAttributeValues={
+            ':granularity': granularity,
+            ':bucket': bucket,
+            ':event_type': event_type,
+            ':quantity': delta['quantity'],
+            ':event_count': delta['event_count']
+        }
+    )
+
+
+def apply_rollups(rollups_table, deltas):
+    """Atomically ADD rollup deltas into their UsageRollups items
+
+    Every delta targets its own item, so the updates run concurrently on the
+    shared pool behind utils.dynamo.gather rather than one round trip after
+    another. Returns the number of rollup items that could not be updated.
+    """
+    targets = list(deltas.items())
+    results = gather(
+        *(partial(update_rollup, rollups_table, customer_id, key, delta) for (customer_id, key), delta in targets),
+        return_exceptions=True
+    )
+    errors = 0
+
+    for ((customer_id, key), _), result in zip(targets, results):
+        if isinstance(result, Exception):
+            print(f"Failed to update rollup {customer_id} {key}: {result}")
+            errors += 1
+
+    return errors
+
+
+def query_rollups(rollups_table, customer_id, granularity, start_bucket, end_bucket):
+    """Read every rollup item for a customer between two buckets (inclusive)"""
+    # '~' sorts after '#', so the upper bound covers every event type in end_bucket
+    return list(iter_items(
+        rollups_table.query,
+        KeyConditionExpression=Key('customer_id').eq(customer_id) &
+        Key('rollup_key').between(f'{granularity}#{start_bucket}', f'{granularity}#{end_bucket}~')
+    ))
+
+
+def summarize_rollups(rollup_items):
+    """Total quantity units per event type and overall event count from rollup items"""
+    usage_summary = {}
+    total_events = 0
+
+    for item in rollup_items:
+        event_type = item['event_type']
+        usage_summary[event_type] = usage_summary.get(event_type, 0) + to_quantity_units(item['quantity'])
+        total_events += int(item['event_count'])
+
+    return usage_summary, total_events
@@ -0,0 +1,59 @@
+import os
+import threading
+from datetime import datetime
+
+# Fixed-width timestamp so keys compare lexicographically in time order.
+# datetime.isoformat() drops the microseconds when they are zero, which
+# would make '...:05' sort after '...:05.000001'.
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# '#' sorts below every character of an ISO timestamp, so a bare ISO
+# string is always a lower bound for the keys generated in that instant.
+# It is not an upper bound: keys from the end instant sort above it, so
+# range queries close with '~' (see sort_key_range).
+SEPARATOR = '#'
+
+# 64 random bits per process keep concurrent writers (separate Lambda
+# containers) from ever producing the same suffix
+_node_id = os.urandom(8).hex()
+_lock = threading.Lock()
+_last_timestamp = ''
+_sequence = 0
+
+
+def new_sort_key(now=None):
+    """Generate a unique, time-ordered UsageEvents sort key
+
+    Keys look like `2024-01-15T10:30:00.123456#<node><sequence>`. The
+    per-process sequence never repeats, so keys stay unique and ordered even
+    when several events share a microsecond. Wall-clock keys are also kept
+    increasing if the clock steps backwards; an explicit `now` is used as is.
+    """
+    global _last_timestamp, _sequence
+
+    timestamp = (now or datetime.utcnow()).strftime(TIMESTAMP_FORMAT)
+    with _lock:
+        if now is None:
+            if timestamp < _last_timestamp:
+                timestamp = _last_timestamp
+            _last_timestamp = timestamp
+        _sequence += 1
+        sequence = _sequence
+
+    return f'{timestamp}{SEPARATOR}{_node_id}{sequence:08x}'
+
+
+def sort_key_range(start, end):
+    """(lower, upper) sort key bounds selecting every key from start to end inclusive"""
+    # '~' sorts after the separator and every timestamp character
+    return start.isoformat(), end.isoformat() + '~'
+
+
+def sort_key_timestamp(sort_key):
+    """Return the ISO timestamp part of a sort key (legacy keys pass through)"""
+    return sort_key.split(SEPARATOR, 1)[0]
+
+
+def parse_sort_key(sort_key):
+    """Parse the datetime encoded in a sort key"""
+    return datetime.fromisoformat(sort_key_timestamp(sort_key))
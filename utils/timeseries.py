@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+from utils.money import quantity_json
+
+# Bucket label formats per series resolution, finest first
+RESOLUTIONS = {
+    'minute': '%Y-%m-%dT%H:%M',
+    'hour': '%Y-%m-%dT%H',
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m'
+}
+
+# Rollup granularity each resolution is built from (None reads raw events)
+RESOLUTION_SOURCES = {
+    'minute': None,
+    'hour': 'hour',
+    'day': 'day',
+    'month': 'day'
+}
+
+# Largest series a single request may return
+MAX_SERIES_POINTS = 1000
+
+
+def parse_utc(value):
+    """Parse an ISO 8601 datetime into naive UTC, the form stored in sort keys"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def floor_to(moment, resolution):
+    """Start of the bucket containing `moment`"""
+    moment = moment.replace(second=0, microsecond=0)
+    if resolution != 'minute':
+        moment = moment.replace(minute=0)
+    if resolution in ('day', 'month'):
+        moment = moment.replace(hour=0)
+    if resolution == 'month':
+        moment = moment.replace(day=1)
+    return moment
+
+
+def next_bucket(bucket_start, resolution):
+    """Start of the bucket following `bucket_start`"""
+    if resolution == 'minute':
+        return bucket_start + timedelta(minutes=1)
+    if resolution == 'hour':
+        return bucket_start + timedelta(hours=1)
+    if resolution == 'day':
+        return bucket_start + timedelta(days=1)
+    if bucket_start.month == 12:
+        return bucket_start.replace(year=bucket_start.year + 1, month=1)
+    return bucket_start.replace(month=bucket_start.month + 1)
+
+
+def count_buckets(start, end, resolution):
+    """Number of buckets between two datetimes (inclusive), without listing them"""
+    first, last = floor_to(start, resolution), floor_to(end, resolution)
+    if resolution == 'month':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    step = {'minute': 60, 'hour': 3600, 'day': 86400}[resolution]
+    return int((last - first).total_seconds()) // step + 1
+
+
+def choose_resolution(start, end, max_points=MAX_SERIES_POINTS):
+    """Finest resolution whose series for the range fits in `max_points`"""
+    for resolution in RESOLUTIONS:
+        if count_buckets(start, end, resolution) <= max_points:
+            return resolution
+    return 'month'
+
+
+def bucket_label(moment, resolution):
+    """Label of the bucket containing `moment`, e.g. `2024-01-15T10` for an hour"""
+    return moment.strftime(RESOLUTIONS[resolution])
+
+
+def build_series(totals, start, end, resolution):
+    """Dense, zero-filled series from `{label: {event_type: quantity units}}`
+
+    Returns `{'timestamps': [...], 'usage': {event_type: [...]}}` with one
+    entry per bucket from `start` to `end`; timestamps are bucket starts.
+    """
+    event_types = sorted({event_type for usage in totals.values() for event_type in usage})
+    timestamps = []
+    usage = {event_type: [] for event_type in event_types}
+
+    bucket_start = floor_to(start, resolution)
+    while bucket_start <= end:
+        bucket_usage = totals.get(bucket_label(bucket_start, resolution), {})
+        timestamps.append(bucket_start.isoformat())
+        for event_type in event_types:
+            usage[event_type].append(quantity_json(bucket_usage.get(event_type, 0)))
+        bucket_start = next_bucket(bucket_start, resolution)
+
+    return {'timestamps': timestamps, 'usage': usage}